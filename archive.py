@@ -0,0 +1,210 @@
+# archive.py
+#
+# Read side of the event archive written by sinks.ArchiveSink. Enable it
+# in config.json:
+#   "sinks": {"sammi": {}, "archive": {"path": "events.db", "retention_days": 30}}
+#
+# Usage:
+#   python archive.py [--db events.db] query  [--since 2h] [--key KEY] [--source ID]
+#                                             [--user ID] [--parser NAME] [--limit N]
+#   python archive.py [--db events.db] count  [--since 2h] [--by key|source|user]
+#   python archive.py [--db events.db] refire ROW_ID
+#   python archive.py [--db events.db] prune  [--days N] [--max-rows N]
+# Example:
+#   python archive.py count --since 4h --by key       # how many subs this stream
+#   python archive.py query --user 123456 --limit 5
+#
+# --since takes a duration (90s, 30m, 2h, 1d) or an ISO timestamp.
+
+import sys
+import time
+import argparse
+from datetime import datetime
+
+from codec import loads
+from sinks import open_archive, prune_archive
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+_GROUP_COLUMNS = {
+    "key":    "event_key",
+    "source": "source_id",
+    "user":   "user_id",
+    "parser": "parser",
+}
+
+
+def parse_since(value):
+    """
+    Epoch seconds for "2h" / "30m" / "1d" / "90s" (that long ago) or an
+    ISO timestamp. None passes through.
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if value[-1:] in _UNITS and value[:-1].replace(".", "", 1).isdigit():
+        return time.time() - float(value[:-1]) * _UNITS[value[-1]]
+    return datetime.fromisoformat(value).timestamp()
+
+
+class Archive:
+    """
+    Queries over an archive database. Every filter maps onto one of the
+    indexes created by ARCHIVE_SCHEMA, so lookups stay fast however many
+    rows the archive holds.
+    """
+
+    def __init__(self, path="events.db"):
+        self.conn = open_archive(path)
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def _where(since=None, until=None, event_key=None, source_id=None,
+               user_id=None, parser=None):
+        clauses, args = [], []
+        for column, op, value in (
+            ("event_key", "=",  event_key),
+            ("source_id", "=",  source_id),
+            ("user_id",   "=",  user_id),
+            ("parser",    "=",  parser),
+            ("ts",        ">=", since),
+            ("ts",        "<",  until),
+        ):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                args.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), args
+
+    def query(self, limit=100, **filters) -> list:
+        """
+        Newest matching events first, as dicts with customData decoded.
+        Filters: since, until (epoch seconds), event_key, source_id,
+        user_id, parser.
+        """
+        where, args = self._where(**filters)
+        rows = self.conn.execute(
+            "SELECT id, ts, parser, source_id, event_key, trigger, user_id, event_id, data"
+            f" FROM events{where} ORDER BY ts DESC LIMIT ?", args + [limit]
+        ).fetchall()
+        return [self._record(r) for r in rows]
+
+    def count(self, by=None, **filters):
+        """
+        Number of matching events, or {value: count} grouped by "key",
+        "source", "user" or "parser".
+        """
+        where, args = self._where(**filters)
+        if by is None:
+            return self.conn.execute(f"SELECT COUNT(*) FROM events{where}", args).fetchone()[0]
+        column = _GROUP_COLUMNS[by]
+        rows = self.conn.execute(
+            f"SELECT {column}, COUNT(*) AS n FROM events{where}"
+            f" GROUP BY {column} ORDER BY n DESC", args
+        ).fetchall()
+        return dict(rows)
+
+    def get(self, row_id):
+        row = self.conn.execute(
+            "SELECT id, ts, parser, source_id, event_key, trigger, user_id, event_id, data"
+            " FROM events WHERE id = ?", (row_id,)
+        ).fetchone()
+        return self._record(row) if row else None
+
+    @staticmethod
+    def _record(row) -> dict:
+        rid, ts, parser, source_id, event_key, trigger, user_id, event_id, data = row
+        return {
+            "id":         rid,
+            "time":       ts,
+            "parser":     parser,
+            "source_id":  source_id,
+            "event_key":  event_key,
+            "trigger":    trigger,
+            "user_id":    user_id,
+            "event_id":   event_id,
+            "customData": loads(data) if data else None,
+        }
+
+
+def refire(archive, row_id) -> bool:
+    """
+    Send an archived event to SAMMI again, with its original trigger,
+    customData and idempotency key.
+    """
+    import sammi
+
+    rec = archive.get(row_id)
+    if not rec:
+        print(f"[Archive] No event with id {row_id}")
+        return False
+    sammi.send_to_sammi(
+        {"trigger": rec["trigger"], "customData": rec["customData"]},
+        rec["event_id"]
+    )
+    return True
+
+
+def _fmt_time(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Query the local event archive")
+    ap.add_argument("--db", default="events.db")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    for name in ("query", "count"):
+        sp = sub.add_parser(name)
+        sp.add_argument("--since")
+        sp.add_argument("--until")
+        sp.add_argument("--key", dest="event_key")
+        sp.add_argument("--source", dest="source_id")
+        sp.add_argument("--user", dest="user_id")
+        sp.add_argument("--parser")
+        if name == "query":
+            sp.add_argument("--limit", type=int, default=20)
+        else:
+            sp.add_argument("--by", choices=sorted(_GROUP_COLUMNS))
+
+    sp = sub.add_parser("refire")
+    sp.add_argument("row_id", type=int)
+
+    sp = sub.add_parser("prune")
+    sp.add_argument("--days", type=float, default=30)
+    sp.add_argument("--max-rows", type=int)
+
+    args    = ap.parse_args()
+    archive = Archive(args.db)
+    t0      = time.perf_counter()
+
+    if args.cmd in ("query", "count"):
+        filters = {
+            "since":     parse_since(args.since),
+            "until":     parse_since(args.until),
+            "event_key": args.event_key,
+            "source_id": args.source_id,
+            "user_id":   args.user_id,
+            "parser":    args.parser,
+        }
+        if args.cmd == "query":
+            for rec in archive.query(limit=args.limit, **filters):
+                print(f"{rec['id']:>8}  {_fmt_time(rec['time'])}  {rec['source_id']:<16} "
+                      f"{rec['trigger']:<28} {rec['user_id'] or '-'}")
+        else:
+            result = archive.count(by=args.by, **filters)
+            if isinstance(result, dict):
+                for value, n in result.items():
+                    print(f"{n:>8}  {value}")
+            else:
+                print(result)
+        print(f"[Archive] {(time.perf_counter() - t0) * 1000:.1f} ms", file=sys.stderr)
+
+    elif args.cmd == "refire":
+        if not refire(archive, args.row_id):
+            sys.exit(1)
+
+    elif args.cmd == "prune":
+        prune_archive(archive.conn, args.days, args.max_rows)
+        print(f"[Archive] {archive.count()} event(s) kept")
@@ -0,0 +1,334 @@
+# bench.py
+#
+# Offline micro-benchmarks for the relay's hot paths. No browser needed:
+# frames are synthesised from representative Twitch/Kick/YouTube samples.
+#
+# Usage:
+#   python bench.py memory [count]
+#   python bench.py json [count] [corpus.ndjson]
+#   python bench.py parse [count] [corpus.ndjson]
+#   python bench.py rules [count]
+#   python bench.py viewers [unique_viewers]
+# Example:
+#   python bench.py memory 50000
+#   python bench.py json 20000 frames.ndjson
+#
+# A corpus file holds one JSON object per line with at least "parser"
+# and "payload" keys (raw frames as captured from the driver), such as
+# a `python recorder.py dump` file.
+
+import re
+import sys
+import json
+import time
+import random
+import tracemalloc
+
+import codec
+import rules
+import viewers
+
+import twitch_parse
+import kick_parse
+import youtube_parse
+
+
+def twitch_frame(i: int) -> str:
+    tags = (
+        f"@badge-info=subscriber/{i % 48};badges=subscriber/12,premium/1;color=#1E90FF;"
+        f"display-name=Viewer{i % 5000};emotes=;first-msg=0;flags=;id=8d7a3c5e-{i:08x}-4b1f;"
+        f"mod=0;returning-chatter=0;room-id=123456;subscriber=1;"
+        f"tmi-sent-ts={1700000000000 + i};turbo=0;user-id={100000 + i % 5000};user-type="
+    )
+    nick = f"viewer{i % 5000}"
+    return f"{tags} :{nick}!{nick}@{nick}.tmi.twitch.tv PRIVMSG #somechannel :message number {i} LUL"
+
+
+def kick_frame(i: int) -> str:
+    inner = {
+        "id": f"5b1e0c3a-{i:08x}",
+        "chatroom_id": 668,
+        "content": f"message number {i}",
+        "type": "message",
+        "created_at": "2024-01-01T00:00:00+00:00",
+        "sender": {
+            "id": 1000 + i % 5000,
+            "username": f"viewer{i % 5000}",
+            "slug": f"viewer{i % 5000}",
+            "identity": {"color": "#E9113C", "badges": []},
+        },
+    }
+    return json.dumps({
+        "event": "App\\Events\\ChatMessageEvent",
+        "data": json.dumps(inner, separators=(",", ":")),
+        "channel": "chatrooms.668.v2",
+    }, separators=(",", ":"))
+
+
+def youtube_frame(i: int) -> str:
+    item = {"liveChatTextMessageRenderer": {
+        "id": f"ChwKGkNKX{i:010d}",
+        "authorName": {"simpleText": f"Viewer {i % 5000}"},
+        "authorExternalChannelId": f"UC{i % 5000:022d}",
+        "message": {"runs": [{"text": f"message number {i} "}, {"text": "nice"}]},
+        "timestampUsec": str(1700000000000000 + i),
+    }}
+    return json.dumps({"continuationContents": {"liveChatContinuation": {
+        "actions": [{"addChatItemAction": {"item": item, "clientId": f"c{i}"}}]
+    }}})
+
+
+FRAMES = {
+    "twitch_parse":  (twitch_parse,  twitch_frame),
+    "kick_parse":    (kick_parse,    kick_frame),
+    "youtube_parse": (youtube_parse, youtube_frame),
+}
+
+
+def twitch_corpus(i: int) -> str:
+    # what the Twitch chat socket actually carries: mostly PRIVMSG, plus
+    # PINGs, PubSub notifications and the odd multi-line burst
+    r = i % 20
+    if r == 0:
+        return "PING :tmi.twitch.tv"
+    if r == 1:
+        inner = {"type": "reward-redeemed", "data": {"timestamp": "2024-01-01T00:00:00Z",
+                 "redemption": {"id": f"r{i}", "channel_id": "123456",
+                                "user": {"id": str(i), "login": f"viewer{i}", "display_name": f"Viewer{i}"},
+                                "reward": {"id": "abcdef", "title": "Hydrate"}}}}
+        return json.dumps({"type": "MESSAGE", "data": {"topic": "community-points-channel-v1.123456",
+                           "message": json.dumps(inner)}, "notification": {"pubsub": json.dumps(inner)}})
+    if r == 2:
+        return twitch_frame(i) + "\r\n" + twitch_frame(i + 1)
+    return twitch_frame(i)
+
+
+def kick_corpus(i: int) -> str:
+    if i % 10 == 0:
+        return '{"event":"pusher:pong","data":"{}"}'
+    return kick_frame(i)
+
+
+def youtube_corpus(i: int) -> str:
+    return youtube_frame(i)
+
+
+CORPORA = {
+    "twitch_parse":  twitch_corpus,
+    "kick_parse":    kick_corpus,
+    "youtube_parse": youtube_corpus,
+}
+
+
+def load_corpus(path):
+    """
+    Group recorded frames by parser name.
+    """
+    frames = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            rec = json.loads(line)
+            frames.setdefault(rec["parser"], []).append(rec["payload"])
+    return frames
+
+
+def _stdlib_try_json(s):
+    # the pre-codec parser helper: always attempt a decode
+    try:
+        return json.loads(s)
+    except Exception:
+        return None
+
+
+def _time_per_item(fn, items, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for x in items:
+            fn(x)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(items) * 1e6
+
+
+def bench_json(count="20000", corpus=None):
+    """
+    Decode cost per frame (stdlib try/except vs codec.try_json) and
+    encode cost per delivered payload (json.dumps vs codec.dumps).
+    """
+    count = int(count)
+    if corpus:
+        frames = load_corpus(corpus)
+    else:
+        frames = {name: [gen(i) for i in range(count)] for name, gen in CORPORA.items()}
+
+    print(f"codec backend: {codec.BACKEND}")
+    print(f"{'parser':<15}{'frames':>8}{'decode old us':>15}{'decode new us':>15}"
+          f"{'encode old us':>15}{'encode new us':>15}")
+    for name, items in frames.items():
+        mod = FRAMES[name][0] if name in FRAMES else None
+        payloads = []
+        if mod:
+            for s in items:
+                ek, fmt = mod.parse_frame(s)
+                payloads.append(fmt)
+        dec_old = _time_per_item(_stdlib_try_json, items)
+        dec_new = _time_per_item(codec.try_json, items)
+        enc_old = _time_per_item(json.dumps, payloads) if payloads else 0.0
+        enc_new = _time_per_item(codec.dumps, payloads) if payloads else 0.0
+        print(f"{name:<15}{len(items):>8}{dec_old:>15.2f}{dec_new:>15.2f}"
+              f"{enc_old:>15.2f}{enc_new:>15.2f}")
+
+
+def bench_parse(count="20000", corpus=None):
+    """
+    Classification cost per frame through each parser's parse_event.
+    """
+    count = int(count)
+    if corpus:
+        frames = load_corpus(corpus)
+    else:
+        frames = {name: [gen(i) for i in range(count)] for name, gen in CORPORA.items()}
+
+    print(f"{'parser':<15}{'frames':>8}{'us/frame':>10}{'frames/s':>12}")
+    for name, items in frames.items():
+        if name not in FRAMES:
+            continue
+        mod = FRAMES[name][0]
+        us  = _time_per_item(lambda s: mod.parse_event(s, "bench"), items)
+        print(f"{name:<15}{len(items):>8}{us:>10.2f}{1e6 / us:>12.0f}")
+
+
+_WORDS = (
+    "hype", "pog", "lurk", "hydrate", "clip", "raid", "gg", "wp", "lol", "nice",
+    "train", "boss", "chat", "drop", "level", "speedrun", "emote", "stream", "song", "vote",
+)
+
+
+def _rule_entries(n):
+    """
+    n rules: a mix of !commands, keywords and a few regexes over made-up words.
+    """
+    out = []
+    for i in range(n):
+        word = f"{_WORDS[i % len(_WORDS)]}{i // len(_WORDS) or ''}"
+        if i % 10 == 0:
+            out.append({"type": "command", "match": f"!{word}", "trigger": f"cmd {word}"})
+        elif i % 500 == 1:
+            out.append({"type": "regex", "match": rf"\b{word}\d+\b", "trigger": f"rx {word}"})
+        else:
+            out.append({"type": "keyword", "match": word, "trigger": f"kw {word}"})
+    return out
+
+
+def bench_rules(count="20000"):
+    """
+    Matching cost per chat message for growing rule sets: the compiled
+    RuleSet versus checking each rule in turn.
+    """
+    count = int(count)
+    texts = []
+    for i in range(count):
+        words = [random.choice(_WORDS) + random.choice(("", "1", "x")) for _ in range(random.randint(3, 12))]
+        if i % 25 == 0:
+            words.insert(0, "!" + random.choice(_WORDS))
+        texts.append(" ".join(words))
+
+    print(f"{'rules':>8}{'naive us/msg':>14}{'ruleset us/msg':>16}{'msgs/s':>10}{'hits/msg':>10}")
+    for n in (5, 50, 500, 5000):
+        entries = _rule_entries(n)
+        ruleset = rules.RuleSet(entries)
+        naive   = [(e["type"], e["match"].casefold(), re.compile(e["match"]) if e["type"] == "regex" else None)
+                   for e in entries]
+
+        def check_each(text):
+            folded = text.casefold()
+            words  = folded.split()
+            hits   = 0
+            for kind, pat, rx in naive:
+                if kind == "command":
+                    hits += words[:1] == [pat]
+                elif kind == "keyword":
+                    hits += pat in words
+                else:
+                    hits += rx.search(text) is not None
+            return hits
+
+        slow = _time_per_item(check_each, texts[:max(200, count // max(1, n // 5))], repeat=1)
+        fast = _time_per_item(ruleset.match, texts)
+        for r in ruleset.rules:
+            r.hits = 0
+        ruleset.matched = 0
+        hits = sum(len(ruleset.match(t)) for t in texts) / len(texts)
+        print(f"{n:>8}{slow:>14.2f}{fast:>16.2f}{1e6 / fast:>10.0f}{hits:>10.2f}")
+
+
+def bench_viewers(unique="50000"):
+    """
+    Viewer-cache cost per chat message as the number of distinct chatters
+    grows, with a cap below the largest size so eviction is exercised.
+    """
+    unique = int(unique)
+    print(f"{'viewers':>9}{'messages':>10}{'us/msg':>8}{'hit rate':>10}{'kept':>8}{'evicted':>9}{'MiB':>7}")
+    for n in (1000, unique // 5, unique, unique * 2):
+        cache = viewers.ViewerCache(max_viewers=unique)
+        ids   = [str(random.randrange(n)) for _ in range(max(n * 3, 100000))]
+        t0 = time.perf_counter()
+        for uid in ids:
+            cache.seen("twitch_parse", uid, now=0.0)
+        us = (time.perf_counter() - t0) / len(ids) * 1e6
+        st = cache.stats()
+        print(f"{n:>9}{len(ids):>10}{us:>8.2f}{st['hit_rate']:>10.0%}{st['viewers']:>8}"
+              f"{st['evicted']:>9}{st['bytes'] / 2**20:>7.1f}")
+
+
+def _retained(build, count):
+    """
+    Bytes still allocated after keeping `count` results of build(i) alive.
+    """
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    kept = [build(i) for i in range(count)]
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del kept
+    return used
+
+
+def bench_memory(count="20000"):
+    """
+    Per-event memory held in event_queue: the legacy 5-tuple with an eager
+    customData dict versus the slotted Event with lazy customData.
+    """
+    count = int(count)
+    source_id = "somechannel"
+    print(f"{'parser':<15}{'tuple B/ev':>12}{'Event B/ev':>12}{'saved':>8}")
+    for name, (mod, frame) in FRAMES.items():
+        def legacy(i):
+            ek, fmt = mod.parse_frame(frame(i))
+            return (name, source_id, ek, fmt["trigger"], fmt["customData"])
+
+        def record(i):
+            return mod.parse_event(frame(i), source_id)
+
+        before = _retained(legacy, count) / count
+        after  = _retained(record, count) / count
+        print(f"{name:<15}{before:>12.0f}{after:>12.0f}{1 - after / before:>8.0%}")
+
+
+if __name__ == "__main__":
+    benches = {
+        "memory": bench_memory,
+        "json":   bench_json,
+        "parse":  bench_parse,
+        "rules":  bench_rules,
+        "viewers": bench_viewers,
+    }
+    if len(sys.argv) < 2 or sys.argv[1] not in benches:
+        print(f"Usage: python bench.py <{'|'.join(benches)}> [args...]")
+        sys.exit(1)
+
+    random.seed(0)
+    benches[sys.argv[1]](*sys.argv[2:])
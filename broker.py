@@ -0,0 +1,326 @@
+# broker.py
+#
+# Optional scale-out mode: N headless relay workers, each running its own
+# Chromium for a shard of the sources in config.json, publish parsed
+# events over localhost TCP to one coordinator. The coordinator does
+# dedup, zone routing and sink delivery exactly like the UI does.
+#
+# Usage:
+#   python broker.py coordinator [--workers N] [--port PORT]
+#   python broker.py worker --name NAME [--port PORT]
+#   python broker.py check      # coordinator + two stand-in workers on localhost
+#
+# The coordinator spawns and supervises its workers; a worker that dies
+# is restarted under the same name, and its sources are handed to the
+# surviving workers in the meantime. Wire format is one JSON object per
+# line in both directions:
+#   worker → coordinator   {"type": "hello", "worker": name}
+#                          {"type": "event", "parser": ..., "source_id": ...,
+#                           "event_key": ..., "trigger": ..., "event_id": ...,
+#                           "customData": {...}, "raw": [...]}
+#                          ("raw" only for structured extras like YouTube
+#                           message runs; raw frames are never forwarded)
+#   coordinator → worker   {"type": "assign", "sources": [{"parser": ..., "username": ...}]}
+
+import os
+import sys
+import socket
+import asyncio
+import argparse
+import hashlib
+from threading import Thread
+
+import profiler
+from codec import dumps, loads
+from config import BASE_DIR, discover_parsers, load_config
+from events import Event, coerce_event
+
+BROKER_HOST    = "127.0.0.1"
+BROKER_PORT    = 9470
+RESPAWN_DELAY  = 3.0        # seconds before a dead worker is restarted
+LINE_LIMIT     = 16 << 20   # max bytes per wire message (raw YouTube polls are big)
+
+
+def _weight(worker: str, key) -> int:
+    digest = hashlib.blake2b(f"{worker}|{key[0]}|{key[1]}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def assign_shards(source_keys, workers) -> dict:
+    """
+    Rendezvous hashing: each (parser, source_id) goes to the worker with
+    the highest hash weight. When a worker leaves, only its own sources
+    move; everything else stays where it is.
+    """
+    shards = {w: [] for w in workers}
+    if not shards:
+        return shards
+    for key in source_keys:
+        best = max(shards, key=lambda w: _weight(w, key))
+        shards[best].append(key)
+    return shards
+
+
+def event_message(ev) -> bytes:
+    msg = {
+        "type":       "event",
+        "parser":     ev.parser,
+        "source_id":  ev.source_id,
+        "event_key":  ev.event_key,
+        "trigger":    ev.trigger,
+        "event_id":   ev.event_id,
+        "customData": ev.custom_data,
+    }
+    if isinstance(ev.raw, list):
+        msg["raw"] = ev.raw     # e.g. YouTube runs, for rich message tokens
+    return dumps(msg) + b"\n"
+
+
+def event_from_message(msg: dict) -> Event:
+    return Event(
+        msg["parser"], msg["source_id"], msg["event_key"], msg["trigger"],
+        custom_data=msg.get("customData"), raw=msg.get("raw"), event_id=msg.get("event_id")
+    )
+
+
+class Coordinator:
+    def __init__(self, model, relay, parsers_by_name, host=BROKER_HOST, port=BROKER_PORT):
+        self.model    = model
+        self.relay    = relay
+        self.parsers  = parsers_by_name
+        self.host     = host
+        self.port     = port
+        self.workers  = {}     # name -> StreamWriter
+        self.assigned = {}     # name -> list of (parser, source_id)
+        self.received = 0
+
+    def source_keys(self) -> list:
+        keys = {
+            (z.parser, z.input) for z in self.model
+            if z.parser in self.parsers and z.input
+        }
+        return sorted(keys)
+
+    def rebalance(self):
+        shards = assign_shards(self.source_keys(), sorted(self.workers))
+        for name, keys in shards.items():
+            if self.assigned.get(name) == keys:
+                continue
+            self.assigned[name] = keys
+            self.workers[name].write(dumps({
+                "type":    "assign",
+                "sources": [{"parser": p, "username": u} for p, u in keys],
+            }) + b"\n")
+            print(f"[Broker] {name}: {len(keys)} source(s)")
+
+    async def serve(self, spawn=0):
+        server = await asyncio.start_server(
+            self._handle, self.host, self.port, limit=LINE_LIMIT
+        )
+        self.port = server.sockets[0].getsockname()[1]     # when started on port 0
+        print(f"[Broker] Coordinator listening on {self.host}:{self.port}")
+        supervisors = [
+            asyncio.create_task(self._supervise(f"worker-{i}")) for i in range(spawn)
+        ]
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for t in supervisors:
+                t.cancel()
+            await asyncio.gather(*supervisors, return_exceptions=True)
+
+    async def _supervise(self, name):
+        while True:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.abspath(__file__), "worker",
+                "--name", name, "--host", self.host, "--port", str(self.port)
+            )
+            try:
+                code = await proc.wait()
+            except asyncio.CancelledError:
+                proc.terminate()
+                await proc.wait()
+                raise
+            print(f"[Broker] {name} exited with {code}, restarting in {RESPAWN_DELAY:.0f}s")
+            await asyncio.sleep(RESPAWN_DELAY)
+
+    async def _handle(self, reader, writer):
+        try:
+            hello = loads(await reader.readline())
+        except Exception:
+            writer.close()
+            return
+        name = hello.get("worker") or f"peer-{id(writer)}"
+        old  = self.workers.get(name)
+        if old:
+            old.close()
+        self.workers[name] = writer
+        self.assigned.pop(name, None)
+        self.rebalance()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                msg = loads(line)
+                if msg.get("type") == "event":
+                    self.received += 1
+                    self.relay.handle(event_from_message(msg))
+        except (ConnectionError, ValueError, asyncio.LimitOverrunError) as e:
+            print(f"[Broker] {name} dropped: {e}")
+        finally:
+            if self.workers.get(name) is writer:
+                del self.workers[name]
+                self.assigned.pop(name, None)
+                self.rebalance()
+            writer.close()
+
+
+def run_coordinator(workers=2, host=BROKER_HOST, port=BROKER_PORT):
+    from relay import Relay
+    from sinks import build_sinks
+    from zones import ZoneModel
+    from viewers import ViewerCache
+
+    parsers = {p.__name__: p for p in discover_parsers(BASE_DIR)}
+    cfg     = load_config()
+    sinks   = build_sinks(cfg)
+    model   = ZoneModel.from_config(cfg)
+    viewers = ViewerCache.from_config(cfg)
+    relay   = Relay(model, sinks, parsers, viewers=viewers)
+    coord   = Coordinator(model, relay, parsers, host, port)
+    profiler.on_signal(profiler.toggle_capture)
+
+    sinks.start()
+    try:
+        asyncio.run(coord.serve(spawn=workers))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sinks.stop()
+        viewers.save()
+
+
+def run_worker(name, host=BROKER_HOST, port=BROKER_PORT):
+    """
+    Headless relay worker: runs the driver for whatever sources the
+    coordinator assigns and forwards every parsed event upstream.
+    Exits when the coordinator connection drops.
+    """
+    import driver
+    import recorder
+
+    parsers = {p.__name__: p for p in discover_parsers(BASE_DIR)}
+
+    recorder.open_recorder(load_config(), f"-{name}")
+    profiler.on_signal(profiler.toggle_capture)
+
+    sock = socket.create_connection((host, port))
+    sock.sendall(dumps({"type": "hello", "worker": name, "pid": os.getpid()}) + b"\n")
+
+    def _apply(entries):
+        sources = []
+        for e in entries:
+            parser = parsers.get(e.get("parser"))
+            if parser:
+                sources.append({
+                    "parser":   parser,
+                    "username": e["username"],
+                })
+        if not driver.sync_sources(sources):
+            driver.start_driver(sources, headless=True, multiplex=load_config().get("multiplex"))
+
+    def _read():
+        try:
+            for line in sock.makefile("rb"):
+                msg = loads(line)
+                if msg.get("type") == "assign":
+                    _apply(msg.get("sources", []))
+        except (OSError, ValueError):
+            pass
+        driver.event_queue.put(None)    # wake the sender so the worker exits
+
+    Thread(target=_read, name="broker-reader", daemon=True).start()
+    try:
+        while True:
+            item = driver.event_queue.get()
+            if item is None:
+                break
+            sock.sendall(event_message(coerce_event(item)))
+    except OSError:
+        pass
+    finally:
+        driver.stop_driver()
+        sock.close()
+
+
+async def _check(sources=12, timeout=5.0) -> bool:
+    from zones import ZoneModel
+
+    model = ZoneModel()
+    for i in range(sources):
+        model.add("twitch_parse", f"channel{i}")
+    coord  = Coordinator(model, None, {"twitch_parse": None}, port=0)
+    server = asyncio.create_task(coord.serve())
+    while not coord.port:
+        await asyncio.sleep(0.01)
+
+    # stand-in workers: say hello, then remember their latest assignment
+    latest = {}
+
+    async def worker(name):
+        reader, writer = await asyncio.open_connection(coord.host, coord.port)
+        writer.write(dumps({"type": "hello", "worker": name}) + b"\n")
+
+        async def _read():
+            async for line in reader:
+                msg = loads(line)
+                if msg.get("type") == "assign":
+                    latest[name] = {s["username"] for s in msg["sources"]}
+        return writer, asyncio.create_task(_read())
+
+    async def settle(done):
+        loop = asyncio.get_running_loop()
+        end  = loop.time() + timeout
+        while not done() and loop.time() < end:
+            await asyncio.sleep(0.01)
+        return done()
+
+    everything = {f"channel{i}" for i in range(sources)}
+    w0, r0 = await worker("check-0")
+    w1, r1 = await worker("check-1")
+    ok = await settle(lambda: latest.get("check-0", set()) | latest.get("check-1", set()) == everything
+                      and not latest.get("check-0", set()) & latest.get("check-1", set())
+                      and "check-1" in latest)
+    print(f"[Broker] check: split {len(latest.get('check-0', ()))} / {len(latest.get('check-1', ()))}")
+    moved = set(latest.get("check-1", ()))
+
+    w1.transport.abort()        # the worker dies without a goodbye
+    ok = ok and bool(moved) and await settle(lambda: latest.get("check-0") == everything)
+    print(f"[Broker] check: after check-1 died, check-0 has {len(latest.get('check-0', ()))}")
+
+    w0.close()
+    for t in (r0, r1, server):
+        t.cancel()
+    await asyncio.gather(r0, r1, server, return_exceptions=True)
+    print(f"[Broker] check {'passed' if ok else 'FAILED'}")
+    return ok
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Relay workers coordinated over localhost")
+    ap.add_argument("role", choices=["coordinator", "worker", "check"])
+    ap.add_argument("--workers", type=int, default=2, help="workers to spawn (coordinator)")
+    ap.add_argument("--name", default=f"worker-{os.getpid()}", help="worker name")
+    ap.add_argument("--host", default=BROKER_HOST)
+    ap.add_argument("--port", type=int, default=BROKER_PORT)
+    args = ap.parse_args()
+
+    if args.role == "check":
+        sys.exit(0 if asyncio.run(_check()) else 1)
+    elif args.role == "coordinator":
+        run_coordinator(args.workers, args.host, args.port)
+    else:
+        run_worker(args.name, args.host, args.port)
@@ -0,0 +1,64 @@
+# codec.py
+#
+# One JSON backend for the parsers and the sinks. Uses orjson when it is
+# installed and falls back to the stdlib otherwise; both paths produce
+# compact UTF-8 bytes from dumps().
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson else "json"
+
+_WHITESPACE = " \t\r\n"
+
+
+def looks_like_json(s) -> bool:
+    """
+    Cheap first-byte check: only objects and arrays are worth decoding.
+    Plain IRC lines, PINGs and Pusher heartbeats never pay for a failed parse.
+    """
+    if not s:
+        return False
+    c = s[0]
+    if c in _WHITESPACE:
+        s = s.lstrip()
+        if not s:
+            return False
+        c = s[0]
+    return c == "{" or c == "["
+
+
+if orjson:
+    JSONDecodeError = orjson.JSONDecodeError
+
+    def loads(s):
+        return orjson.loads(s)
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+else:
+    JSONDecodeError = json.JSONDecodeError
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def loads(s):
+        return json.loads(s)
+
+    def dumps(obj) -> bytes:
+        return _encoder.encode(obj).encode("utf-8")
+
+
+def try_json(s):
+    """
+    Decode `s` if it looks like a JSON object/array, else None.
+    """
+    if not looks_like_json(s):
+        return None
+    try:
+        return loads(s)
+    except Exception:
+        return None
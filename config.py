@@ -0,0 +1,70 @@
+# config.py
+#
+# config.json and parser discovery, without Tk or Playwright, so the
+# headless broker coordinator can load both (see broker.py). main.py
+# re-uses the same helpers.
+
+import os
+import json
+import importlib.util
+
+import schema
+
+CONFIG_FILE = "config.json"
+BASE_DIR    = os.path.dirname(os.path.abspath(__file__))
+
+
+def discover_parsers(directory):
+    """
+    Auto-load every *_parse.py in `directory` that defines
+    EVENTS, get_chat_url, and parse_frame (or a SCHEMA, which is compiled
+    into dispatch tables here and supplies parse_frame itself).
+    """
+    parsers = []
+    for fname in os.listdir(directory):
+        if not fname.endswith("_parse.py"):
+            continue
+        module_name = fname[:-3]
+        path = os.path.join(directory, fname)
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        if not spec or not spec.loader:
+            continue
+        mod = importlib.util.module_from_spec(spec)
+        try:
+            spec.loader.exec_module(mod)
+            schema.install(mod)
+        except Exception:
+            continue
+        if (
+            hasattr(mod, "EVENTS")
+            and hasattr(mod, "get_chat_url")
+            and hasattr(mod, "parse_frame")
+            and isinstance(mod.EVENTS, (list, tuple))
+        ):
+            parsers.append(mod)
+    return parsers
+
+
+def load_config():
+    try:
+        with open(CONFIG_FILE, "r") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def save_config(model):
+    """
+    Write the zone list back to config.json, keeping any other sections
+    (e.g. "sinks") as the user wrote them. Written to a temp file first so
+    a crash mid-write can't truncate the config.
+    """
+    cfg = {k: v for k, v in load_config().items() if not k.startswith("zone_")}
+    cfg["zones"] = model.to_config()
+    tmp = CONFIG_FILE + ".tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(cfg, f, indent=2)
+        os.replace(tmp, CONFIG_FILE)
+    except Exception:
+        pass
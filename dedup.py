@@ -0,0 +1,133 @@
+# dedup.py
+#
+# Drops events that reach the relay more than once: Twitch redemptions
+# arrive over both IRC and PubSub, and page reloads can replay recent
+# Kick/YouTube history. Parsers opt in by defining
+#
+#     def event_id(event_key, customData) -> str | None
+#     DEDUP_WINDOWS = {"event key": seconds, ...}   # optional overrides
+#
+# Events that arrive over two transports without a shared id (a Twitch
+# redemption has its id on PubSub only) are paired instead of deduped:
+#
+#     TWIN_EVENTS = {"event key", ...}
+#     def twin_key(event_key, customData) -> (key, side, ts) | None
+#
+# A copy is dropped only when a copy from the other side with the same key
+# and a timestamp within TWIN_SLACK is waiting; each copy pairs once.
+
+import time
+from collections import OrderedDict, deque
+
+DEDUP_WINDOW   = 600.0    # seconds an id is remembered by default
+DEDUP_MAX_KEYS = 50_000   # hard cap per window, oldest ids evicted first
+TWIN_WINDOW    = 15.0     # seconds a copy waits for its twin from the other side
+TWIN_SLACK     = 2.0      # max difference between the twins' own timestamps
+
+
+class Deduper:
+    """
+    Time-windowed set of recently seen ids.
+
+    Ids are kept in insertion order per window length, so expiry only ever
+    pops from the front and lookups are a single dict hit. Memory is capped
+    at `max_keys` per window regardless of how long the stream runs.
+    """
+
+    def __init__(self, window=DEDUP_WINDOW, max_keys=DEDUP_MAX_KEYS, clock=time.monotonic):
+        self.window   = window
+        self.max_keys = max_keys
+        self.clock    = clock
+        self.dropped  = 0
+        self._windows = {}
+        self._twins   = deque()     # [arrived, key, side, ts], oldest first
+
+    def seen(self, key, window=None, now=None) -> bool:
+        """
+        Return True if `key` was already seen inside its window,
+        otherwise remember it and return False. A None key is never a dup.
+        """
+        if key is None:
+            return False
+        window = self.window if window is None else window
+        now    = self.clock() if now is None else now
+
+        ids = self._windows.get(window)
+        if ids is None:
+            ids = self._windows[window] = OrderedDict()
+
+        cutoff = now - window
+        while ids:
+            first = next(iter(ids))
+            if ids[first] >= cutoff:
+                break
+            ids.popitem(last=False)
+
+        if key in ids:
+            self.dropped += 1
+            return True
+
+        ids[key] = now
+        if len(ids) > self.max_keys:
+            ids.popitem(last=False)
+        return False
+
+    def paired(self, key, side, ts, window=TWIN_WINDOW, slack=TWIN_SLACK, now=None) -> bool:
+        """
+        Return True if a copy of this event from another `side`, with a
+        timestamp within `slack` of `ts`, arrived in the last `window`
+        seconds and hasn't been paired yet; that copy is used up. Otherwise
+        remember this copy and return False. Copies from the same side
+        never pair, so a repeated event is always delivered.
+        """
+        now    = self.clock() if now is None else now
+        twins  = self._twins
+        cutoff = now - window
+        while twins and twins[0][0] < cutoff:
+            twins.popleft()
+        for i, (_, k, s, t) in enumerate(twins):
+            if k == key and s != side and abs(t - ts) <= slack:
+                del twins[i]
+                self.dropped += 1
+                return True
+        twins.append((now, key, side, ts))
+        return False
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._windows.values()) + len(self._twins)
+
+    def clear(self):
+        self._windows.clear()
+        self._twins.clear()
+
+
+def idempotency_key(parser, event):
+    """
+    Stable id for an Event: the one the parser attached while parsing, or
+    else whatever the parser's event_id() hook derives from customData.
+    Returns (key, window) – key is None when the parser can't identify it.
+    """
+    windows = getattr(parser, "DEDUP_WINDOWS", {})
+    if event.event_id:
+        return event.event_id, windows.get(event.event_key)
+    fn = getattr(parser, "event_id", None)
+    if not fn:
+        return None, None
+    try:
+        key = fn(event.event_key, event.custom_data)
+    except Exception:
+        return None, None
+    return key, windows.get(event.event_key)
+
+
+def twin_key(parser, event):
+    """
+    (key, side, ts) for Deduper.paired(), from the parser's twin_key()
+    hook, or None if the event isn't one of the parser's TWIN_EVENTS.
+    """
+    if event.event_key not in getattr(parser, "TWIN_EVENTS", ()):
+        return None
+    try:
+        return parser.twin_key(event.event_key, event.custom_data)
+    except Exception:
+        return None
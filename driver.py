@@ -3,17 +3,47 @@
 import asyncio
 import os
 import subprocess
-from threading import Thread
+from collections import deque
+from threading import Thread, Event
 from queue import Queue
 from playwright.async_api import async_playwright
 
+from events import event_from_frame, frame_parts
+from profiler import watch_asyncio
+from recorder import record
+
 event_queue    = Queue()
 _driver_loop   = None
 _driver_thread = None
 _driver_task   = None
+_context       = None
+_sync_lock     = None
+_desired       = []     # latest requested source list, driver loop only
+_open_sources  = {}     # (parser name, source id) -> (source, page, cdp), driver loop only
+_page_metrics  = {}     # source key -> deque of renderer samples
+_metrics_shown = {}     # source key -> sample last written to the log
+_multiplex     = frozenset()   # parser names served one page per platform
+_mux_pages     = {}     # parser name -> _MuxPage, driver loop only
+
+# how many pages may be navigating at once when many sources start together
+OPEN_CONCURRENCY = 4
 
-def start_driver(sources):
+# renderer footprint sampling via CDP Performance.getMetrics
+METRICS_INTERVAL = 60.0     # seconds between samples of every open page
+METRICS_HISTORY  = 120      # samples kept per page
+METRICS_KEYS     = ("JSHeapUsedSize", "JSHeapTotalSize", "Nodes", "JSEventListeners", "LayoutCount")
+METRICS_LOG_STEP = 0.25     # log a page again once heap or nodes moved this much
+METRICS_LOG_MIN  = {"JSHeapUsedSize": 8 << 20, "Nodes": 2000}   # ...and at least this much
+
+def start_driver(sources, headless=False, multiplex=()):
+    """
+    Run the browser on its own thread and open a page per source. Parsers
+    named in `multiplex` that support it get one page for all their sources.
+    """
+    global _multiplex
     stop_driver()
+    _multiplex = frozenset(multiplex or ())
+    ready = Event()
 
     def _thread_target():
         global _driver_loop, _driver_task
@@ -30,12 +60,15 @@ def start_driver(sources):
 
         _driver_loop.set_exception_handler(_handle_loop_exc)
 
-        _driver_task = _driver_loop.create_task(run_driver(sources))
+        _driver_task = _driver_loop.create_task(run_driver(sources, headless))
+        _driver_loop.call_soon(ready.set)
         _driver_loop.run_forever()
 
     global _driver_thread
     _driver_thread = Thread(target=_thread_target, daemon=True)
     _driver_thread.start()
+    # once this returns, sync_sources() can reach the new loop
+    ready.wait(timeout=5)
 
 
 def stop_driver():
@@ -108,12 +141,264 @@ def ensure_chromium_installed():
             pass
 
 
-async def run_driver(sources):
+def sync_sources(sources):
+    """
+    Bring the running driver in line with `sources`: open pages for new
+    sources and close pages for removed ones, leaving the rest untouched.
+    Returns False if the driver isn't running.
+    """
+    if not is_running():
+        return False
+    asyncio.run_coroutine_threadsafe(_sync_sources(list(sources)), _driver_loop)
+    return True
+
+
+def _source_key(source):
+    # one page per (parser, source id), however many zones listen to it
+    return (source["parser"].__name__, source["username"])
+
+
+async def _new_page(ctx, parser):
+    page = await ctx.new_page()
+    cdp  = await ctx.new_cdp_session(page)
+    await cdp.send("Network.enable")
+    await cdp.send("Performance.enable")
+
+    # page-side maintenance (DOM pruning / no rendering), before any chat loads
+    script = getattr(parser, "PAGE_SCRIPT", None)
+    if script:
+        await page.add_init_script(script)
+    return page, cdp
+
+
+async def _open_source(ctx, source):
+    parser    = source["parser"]
+    source_id = source["username"]
+    url       = parser.get_chat_url(source_id)
+
+    page, cdp = await _new_page(ctx, parser)
+
+    # every raw frame goes to the flight recorder, whichever parser reads it
+    name = parser.__name__
+    cdp.on("Network.webSocketFrameReceived",
+           lambda frame: record(name, source_id, frame["response"]["payloadData"]))
+
+    if hasattr(parser, "attach_listeners"):
+        # a parser may return a coroutine that has to finish before navigation
+        ready = parser.attach_listeners(page, cdp, event_queue, source_id)
+        if ready is not None:
+            await ready
+    else:
+        def _ws_handler(frame, pr=parser, sid=source_id):
+            for part in frame_parts(pr, frame["response"]["payloadData"]):
+                ev = event_from_frame(pr, sid, part)
+                if ev:
+                    event_queue.put(ev)
+        cdp.on("Network.webSocketFrameReceived", _ws_handler)
+
+    await page.goto(url)
+    return page, cdp
+
+
+async def _sync_sources(sources):
+    global _desired
+    _desired = sources
+    if _sync_lock is None:
+        # browser still launching; run_driver applies _desired when it's up
+        return
+    async with _sync_lock:
+        # a newer request may have arrived while we waited for the lock
+        if sources is _desired:
+            await _apply_sources(sources)
+
+
+class _MuxPage:
+    """
+    One pop-out page carrying the chat of many channels of one parser. The
+    page is opened on `primary`; the others are subscribed over its chat
+    WebSocket by the parser's MUX_SCRIPT, and frames are routed back to
+    their source by the parser's frame_channel() key.
+    """
+
+    def __init__(self, parser, primary, page, cdp):
+        self.parser  = parser
+        self.primary = primary
+        self.page    = page
+        self.cdp     = cdp
+        self.routes  = {}       # demultiplexing key -> source id
+
+    def on_frame(self, frame):
+        # a batched frame can hold lines of different channels: route each
+        for part in frame_parts(self.parser, frame["response"]["payloadData"]):
+            # parts without a known channel belong to the page's own source
+            key = self.parser.frame_channel(part)
+            sid = self.routes.get(key, self.primary)
+            record(self.parser.__name__, sid, part)
+            ev  = event_from_frame(self.parser, sid, part)
+            if ev:
+                event_queue.put(ev)
+
+    async def sync(self, channels):
+        name    = self.parser.__name__
+        current = set(self.routes.values())
+        added   = [c for c in channels if c not in current]
+        removed = current.difference(channels)
+        if removed:
+            self.routes = {k: c for k, c in self.routes.items() if c not in removed}
+        if added:
+            self.routes.update(await self.parser.mux_keys(self.page, added))
+            missing = set(added).difference(self.routes.values())
+            if missing:
+                print(f"[Driver] {name}: could not resolve {', '.join(sorted(missing))}")
+        if added or removed:
+            await self.page.evaluate("keys => window.__relayMux(keys)", list(self.routes))
+            print(f"[Driver] {name}: {len(set(self.routes.values()))} channel(s) on one page")
+
+
+def _multiplexed(parser) -> bool:
+    return parser.__name__ in _multiplex and hasattr(parser, "MUX_SCRIPT")
+
+
+async def _open_mux(ctx, source):
+    parser    = source["parser"]
+    page, cdp = await _new_page(ctx, parser)
+    await page.add_init_script(parser.MUX_SCRIPT)
+    mux = _MuxPage(parser, source["username"], page, cdp)
+    cdp.on("Network.webSocketFrameReceived", mux.on_frame)
+    await page.goto(parser.get_chat_url(source["username"]))
+    return mux
+
+
+async def _apply_mux(groups):
+    # a page opened on a channel that is no longer wanted can't keep serving the rest
+    for name, mux in list(_mux_pages.items()):
+        channels = groups.get(name)
+        if not channels or mux.primary not in channels:
+            del _mux_pages[name]
+            _page_metrics.pop(("mux", name), None)
+            _metrics_shown.pop(("mux", name), None)
+            try:
+                await mux.page.close()
+            except Exception:
+                pass
+
+    for name, channels in groups.items():
+        mux = _mux_pages.get(name)
+        if mux is None:
+            try:
+                mux = await _open_mux(_context, next(iter(channels.values())))
+            except Exception as e:
+                print(f"[Driver] Could not open multiplexed {name}: {e}")
+                continue
+            _mux_pages[name] = mux
+        try:
+            await mux.sync(list(channels))
+        except Exception as e:
+            print(f"[Driver] Could not update multiplexed {name}: {e}")
+
+
+async def _apply_sources(sources):
+    wanted = {}
+    muxed  = {}     # parser name -> {channel: source}
+    for s in sources:
+        if _multiplexed(s["parser"]):
+            muxed.setdefault(s["parser"].__name__, {})[s["username"]] = s
+        else:
+            wanted.setdefault(_source_key(s), s)
+
+    # close pages whose source went away
+    for key, (source, page, _) in list(_open_sources.items()):
+        if key not in wanted:
+            del _open_sources[key]
+            _page_metrics.pop(key, None)
+            _metrics_shown.pop(key, None)
+            try:
+                await page.close()
+            except Exception:
+                pass
+
+    # open the rest concurrently, a few navigations at a time
+    sem = asyncio.Semaphore(OPEN_CONCURRENCY)
+
+    async def _open(key, source):
+        async with sem:
+            try:
+                page, cdp = await _open_source(_context, source)
+            except Exception as e:
+                print(f"[Driver] Could not open {source['username']}: {e}")
+                return
+            _open_sources[key] = (source, page, cdp)
+
+    await asyncio.gather(*(
+        _open(key, src) for key, src in wanted.items() if key not in _open_sources
+    ))
+    await _apply_mux(muxed)
+
+
+async def _sample_metrics():
+    """
+    Every METRICS_INTERVAL, read each open page's renderer metrics. JS heap
+    and DOM node counts are logged next to the page's first sample when the
+    page is new and whenever either has moved by METRICS_LOG_STEP since the
+    last line, so a growing page stands out and a steady one stays quiet.
+    """
+    while True:
+        await asyncio.sleep(METRICS_INTERVAL)
+        for key, label, cdp in _pages():
+            try:
+                resp = await cdp.send("Performance.getMetrics")
+            except Exception:
+                continue
+            values = {m["name"]: m["value"] for m in resp.get("metrics", ())}
+            sample = {k: values.get(k, 0) for k in METRICS_KEYS}
+            sample["time"] = values.get("Timestamp", 0)
+
+            history = _page_metrics.get(key)
+            if history is None:
+                history = _page_metrics[key] = deque(maxlen=METRICS_HISTORY)
+            history.append(sample)
+            shown = _metrics_shown.get(key)
+            if shown is not None and not any(
+                abs(sample[k] - shown[k]) >= max(shown[k] * METRICS_LOG_STEP, least)
+                for k, least in METRICS_LOG_MIN.items()
+            ):
+                continue
+            _metrics_shown[key] = sample
+            first = history[0]
+            print(f"[Driver] {label}: "
+                  f"heap {sample['JSHeapUsedSize'] / 1048576:.1f} MiB "
+                  f"(from {first['JSHeapUsedSize'] / 1048576:.1f}), "
+                  f"{int(sample['Nodes'])} nodes (from {int(first['Nodes'])})")
+
+
+def _pages():
+    # (metrics key, label, CDP session) of every open page
+    for key, (source, _, cdp) in list(_open_sources.items()):
+        yield key, f"{source['parser'].__name__}/{source['username']}", cdp
+    for name, mux in list(_mux_pages.items()):
+        yield ("mux", name), f"{name} ({len(set(mux.routes.values()))} channels)", mux.cdp
+
+
+def page_metrics() -> dict:
+    """
+    Renderer samples per open source key, oldest first. Each sample holds
+    METRICS_KEYS plus the page's CDP timestamp.
+    """
+    return {key: list(history) for key, history in list(_page_metrics.items())}
+
+
+def is_running() -> bool:
+    return bool(_driver_loop and _driver_loop.is_running())
+
+
+async def run_driver(sources, headless=False):
+    global _context, _sync_lock, _desired
+    _desired = sources
     ensure_chromium_installed()
 
     async with async_playwright() as p:
         browser = await p.chromium.launch(
-            headless=False,
+            headless=headless,
             args=[
                 "--disable-gpu",
                 "--mute-audio",
@@ -122,47 +407,31 @@ async def run_driver(sources):
             ]
         )
 
-        contexts = []
-        for source in sources:
-            parser    = source["parser"]
-            source_id = source["username"]
-            url       = parser.get_chat_url(source_id)
-
-            ctx = await browser.new_context()
-            contexts.append(ctx)
-
-            await ctx.route("**/*", lambda r, req: (
-                r.abort() if req.resource_type in ("image", "media", "font")
-                else r.continue_()
-            ))
-
-            page = await ctx.new_page()
-            cdp  = await ctx.new_cdp_session(page)
-            await cdp.send("Network.enable")
-
-            if hasattr(parser, "attach_listeners"):
-                parser.attach_listeners(page, cdp, event_queue, source_id)
-            else:
-                def _ws_handler(frame, pr=parser, sid=source_id):
-                    payload = frame["response"]["payloadData"]
-                    res     = pr.parse_frame(payload)
-                    if res:
-                        ek, fmt = res
-                        event_queue.put((
-                            pr.__name__, sid, ek,
-                            fmt["trigger"], fmt["customData"]
-                        ))
-                cdp.on("Network.webSocketFrameReceived", _ws_handler)
-
-            await page.goto(url)
+        # one context shared by every source; each source gets its own page
+        _context = await browser.new_context()
+        await _context.route("**/*", lambda r, req: (
+            r.abort() if req.resource_type in ("image", "media", "font")
+            else r.continue_()
+        ))
 
+        _sync_lock = asyncio.Lock()
+        watchdog   = asyncio.create_task(watch_asyncio("Driver loop"))
+        metrics    = asyncio.create_task(_sample_metrics())
         try:
+            await _sync_sources(_desired)
             while True:
                 await asyncio.sleep(1)
         except asyncio.CancelledError:
             # cancellation triggers cleanup below
             pass
         finally:
-            for ctx in contexts:
-                await ctx.close()
+            watchdog.cancel()
+            metrics.cancel()
+            _open_sources.clear()
+            _mux_pages.clear()
+            _page_metrics.clear()
+            _metrics_shown.clear()
+            _sync_lock = None
+            await _context.close()
+            _context = None
             await browser.close()
\ No newline at end of file
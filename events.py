@@ -0,0 +1,123 @@
+# events.py
+#
+# The record that travels through event_queue. Parsers hand over the raw
+# (or minimally decoded) payload plus a builder; customData is only built
+# for events some zone actually wants (Relay.handle builds it, once,
+# before the sinks see the event).
+
+import sys
+import time
+
+from codec import dumps
+
+_intern = sys.intern
+
+
+class Event:
+    __slots__ = (
+        "parser", "source_id", "event_key", "trigger",
+        "event_id", "ts", "raw", "_build", "_data", "_view", "_body",
+    )
+
+    def __init__(self, parser, source_id, event_key, trigger,
+                 custom_data=None, raw=None, build=None, event_id=None, ts=None):
+        """
+        parser/source_id/event_key/trigger – routing fields, interned
+        custom_data – ready-made customData dict, or
+        raw + build  – build(raw) is called once, on first access
+        event_id     – stable id for dedup (see dedup.py), if cheaply known
+        """
+        self.parser    = _intern(parser)
+        self.source_id = _intern(source_id)
+        self.event_key = _intern(event_key)
+        self.trigger   = _intern(trigger)
+        self.event_id  = event_id
+        self.ts        = time.monotonic() if ts is None else ts
+        self.raw       = raw
+        self._build    = build
+        self._data     = custom_data
+        self._view     = None
+        self._body     = None
+
+    @property
+    def custom_data(self):
+        # not locked: Relay.handle builds it before the event reaches the
+        # sink threads, so only one thread ever gets here with _data unset
+        if self._data is None:
+            build = self._build
+            self._data  = {"raw": self.raw} if build is None else build(self.raw)
+            self._build = None
+        return self._data
+
+    def payload(self) -> dict:
+        """
+        Body for SAMMI-style targets: {"trigger": ..., "customData": {...}},
+        with customData trimmed by project() if it was called.
+        """
+        data = self._view if self._view is not None else self.custom_data
+        return {"trigger": self.trigger, "customData": data}
+
+    def body(self) -> bytes:
+        """
+        payload() serialised once, shared by the sinks that send it and
+        their retries.
+        """
+        if self._body is None:
+            self._body = dumps(self.payload())
+        return self._body
+
+    def project(self, fn) -> dict:
+        """
+        Set the customData that payload() and body() send to fn(customData),
+        e.g. a zone's field selection, and return it. custom_data itself
+        stays whole for sinks that store or inspect the full event.
+        """
+        self._view = fn(self.custom_data)
+        self._body = None
+        return self._view
+
+    def as_tuple(self):
+        """
+        Legacy 5-tuple layout: (parser, source_id, event_key, trigger, customData)
+        """
+        return (self.parser, self.source_id, self.event_key,
+                self.trigger, self.custom_data)
+
+    def __repr__(self):
+        return f"Event({self.parser}, {self.source_id}, {self.event_key!r})"
+
+
+def coerce_event(item):
+    """
+    Accept either an Event or the legacy 5-tuple third-party parsers may
+    still put on the queue.
+    """
+    if isinstance(item, Event):
+        return item
+    parser_name, source_id, event_key, trigger, data = item
+    return Event(parser_name, source_id, event_key, trigger, custom_data=data)
+
+
+def frame_parts(parser, payload_str):
+    """
+    The pieces of one raw frame that are routed and parsed separately: the
+    parser's split_frame() result (Twitch batches several IRC lines into a
+    frame), or just the frame.
+    """
+    split = getattr(parser, "split_frame", None)
+    return split(payload_str) if split else (payload_str,)
+
+
+def event_from_frame(parser, source_id, payload_str):
+    """
+    Run a parser over one raw frame. Uses parse_event when the parser
+    provides it, otherwise wraps the classic parse_frame result.
+    """
+    if hasattr(parser, "parse_event"):
+        return parser.parse_event(payload_str, source_id)
+    res = parser.parse_frame(payload_str)
+    if not res:
+        return None
+    ek, fmt = res
+    return Event(parser.__name__, source_id, ek,
+                 fmt["trigger"], custom_data=fmt["customData"])
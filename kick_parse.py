@@ -1,6 +1,12 @@
 # kick_parse.py
 
-import json
+import re
+
+from codec import try_json
+from events import Event
+from pagescript import multiplex, prune_chat
+from schema import compile_schema
+from tokens import tokenize_kick
 
 # Tell the UI to prompt for a username
 INPUT_TYPE = "username"
@@ -29,6 +35,34 @@ TRIGGERS = {
 }
 
 
+# the pop-out keeps every message; cap the list and stop rendering
+PAGE_SCRIPT = prune_chat("#chatroom-messages", keep=100)
+
+# multiplexed mode: extra channels are subscribed on the pop-out's Pusher socket
+MUX_SCRIPT = multiplex(
+    "pusher", r"pusher:connection_established",
+    subscribe="""keys => keys.map(k => JSON.stringify(
+        {event: "pusher:subscribe", data: {auth: "", channel: k}}))""",
+    unsubscribe="""keys => keys.map(k => JSON.stringify(
+        {event: "pusher:unsubscribe", data: {channel: k}}))""",
+)
+
+# slug -> [chatroom id, channel id], looked up from inside the pop-out page
+_RESOLVE_JS = """
+async (slugs) => {
+  const out = {};
+  for (const slug of slugs) {
+    try {
+      const r = await fetch("/api/v2/channels/" + encodeURIComponent(slug));
+      const c = await r.json();
+      if (c && c.chatroom) out[slug] = [c.chatroom.id, c.id];
+    } catch (e) {}
+  }
+  return out;
+}
+"""
+
+
 def get_chat_url(username: str) -> str:
     """
     Kick’s pop-out chat URL.
@@ -37,104 +71,194 @@ def get_chat_url(username: str) -> str:
     return f"https://kick.com/popout/{username}/chat"
 
 
-def try_json(s: str):
-    try:
-        return json.loads(s)
-    except Exception:
-        return None
+KNOWN_EVENTS = (
+    "ChatMessageEvent", "RewardRedeemedEvent", "FollowEvent", "SubscriptionEvent",
+    "GiftedSubscriptionEvent", "PinnedMessageEvent", "ReactionCreatedEvent",
+    "UserBannedEvent", "UserTimedOutEvent", "StreamStartedEvent", "StreamEndedEvent",
+    "HostStartedEvent", "HostEndedEvent", "RaidStartedEvent", "RaidEndedEvent",
+    "PollStartedEvent", "PollEndedEvent", "PollVoteEvent", "StreamUpdatedEvent",
+    "ChatClearedEvent", "EmoteCreatedEvent", "EmoteDeletedEvent"
+)
+_KNOWN_SET = frozenset(KNOWN_EVENTS)
+
+# Pusher puts the event name first: {"event":"App\\Events\\ChatMessageEvent",...}
+_EVENT_NAME_RE = re.compile(r'"event"\s*:\s*"([^"]+)"')
+
+# Pusher event name → event key, compiled once into DISPATCH
+SCHEMA = {
+    "select": "event",
+    "cases": {
+        "ChatMessageEvent":        "Kick chat",
+        "RewardRedeemedEvent": {
+            "event":    "Kick redeem",
+            "fields":   {"title": "data.reward.title|data.reward_title|data.title"},
+            "defaults": {"title": "Unknown"},
+        },
+        "FollowEvent":             "Kick follow",
+        "SubscriptionEvent":       "Kick sub",
+        "GiftedSubscriptionEvent": "Kick gift sub",
+        "RaidStartedEvent":        "Kick raid start",
+        "RaidEndedEvent":          "Kick raid end",
+        "UserBannedEvent":         "Kick ban",
+        "UserTimedOutEvent":       "Kick timeout",
+        "StreamStartedEvent":      "Kick stream start",
+        "StreamEndedEvent":        "Kick stream end",
+    },
+    "default": {"event": "Kick other", "fields": {"event": "event"}},
+}
+
+DISPATCH = compile_schema(SCHEMA, TRIGGERS)
 
 
 def detect_event_name(payload_str: str) -> str | None:
     """
-    Scan for any known Kick event type in the raw payload.
-    """
-    names = [
-        "ChatMessageEvent", "RewardRedeemedEvent", "FollowEvent", "SubscriptionEvent",
-        "GiftedSubscriptionEvent", "PinnedMessageEvent", "ReactionCreatedEvent",
-        "UserBannedEvent", "UserTimedOutEvent", "StreamStartedEvent", "StreamEndedEvent",
-        "HostStartedEvent", "HostEndedEvent", "RaidStartedEvent", "RaidEndedEvent",
-        "PollStartedEvent", "PollEndedEvent", "PollVoteEvent", "StreamUpdatedEvent",
-        "ChatClearedEvent", "EmoteCreatedEvent", "EmoteDeletedEvent"
-    ]
-    for n in names:
+    Known Kick event type of a raw payload. Reads the Pusher "event" field
+    directly; falls back to scanning for a known name if it isn't there.
+    """
+    i = payload_str.find('"event":"')
+    if i != -1:
+        value = payload_str[i + 9:payload_str.find('"', i + 9)]
+    else:
+        m = _EVENT_NAME_RE.search(payload_str)
+        value = m.group(1) if m else None
+    if value is not None:
+        name = value.rsplit("\\", 1)[-1]
+        return name if name in _KNOWN_SET else None
+    for n in KNOWN_EVENTS:
         if n in payload_str:
             return n
     return None
 
 
-def parse_frame(payload_str: str):
+def frame_channel(payload_str: str) -> str | None:
     """
-    Called on each WS frame. Returns (event_key, {trigger, customData})
-    or None if payload is empty.
+    Demultiplexing key of a frame: its Pusher channel, e.g.
+    "chatrooms.123.v2", or None for connection-level messages.
     """
-    en = detect_event_name(payload_str)
-    if not en:
-        # no known event → classify as “other”
-        return "Kick other", {
-            "trigger": TRIGGERS["Kick other"].format(event="Unknown"),
-            "customData": {"raw": payload_str}
-        }
+    i = payload_str.rfind('"channel":"')
+    if i == -1:
+        return None
+    return payload_str[i + 11:payload_str.find('"', i + 11)]
+
+
+async def mux_keys(page, channels) -> dict:
+    """
+    {Pusher channel: source id} for channels to subscribe on a multiplexed
+    page. Channels Kick doesn't know are left out.
+    """
+    ids  = await page.evaluate(_RESOLVE_JS, list(channels))
+    keys = {}
+    for slug, (chatroom_id, channel_id) in ids.items():
+        keys[f"chatrooms.{chatroom_id}.v2"] = slug
+        keys[f"channel.{channel_id}"]       = slug
+    return keys
+
+
+def event_id(event_key: str, data: dict) -> str | None:
+    """
+    Stable id used by the relay to drop replayed messages.
+    """
+    inner = data.get("data") if isinstance(data.get("data"), dict) else data
+    mid   = inner.get("id")
+    return f"kick:{event_key}:{mid}" if mid else None
+
+
+def user_id(event_key: str, data: dict) -> str | None:
+    """
+    Kick user id of the sender / redeemer, if known.
+    """
+    inner = data.get("data") if isinstance(data.get("data"), dict) else data
+    user  = inner.get("sender") or inner.get("user") or {}
+    uid   = user.get("id") if isinstance(user, dict) else None
+    uid   = uid if uid is not None else inner.get("user_id")
+    return str(uid) if uid is not None else None
 
-    # attempt to parse JSON wrapper
+
+def chat_text(event_key: str, data: dict) -> str | None:
+    """
+    Message text of a chat event, for rules.py.
+    """
+    if event_key != "Kick chat":
+        return None
+    inner = data.get("data") if isinstance(data.get("data"), dict) else data
+    return inner.get("content")
+
+
+def message_tokens(event_key: str, data: dict, raw=None) -> list | None:
+    """
+    Text / emote / mention segments of a chat message, for rich zones.
+    """
+    text = chat_text(event_key, data)
+    return None if text is None else tokenize_kick(text)
+
+
+# "id" when it is the first key of the doubly-encoded data object, e.g.
+# "data":"{\"id\":\"9f2c…\", … — the same top-level data.id that event_id()
+# reads. Anywhere else (nested sender/user objects) it isn't the event's id.
+_DATA_ID_RE = re.compile(r'"data":\s*"\{\\"id\\":\s*(?:\\"([^\\"]+)\\"|(\d+))')
+
+
+def decode_payload(payload_str: str) -> dict:
+    """
+    Decode the Pusher wrapper and its JSON-encoded `data` string.
+    """
     d = try_json(payload_str) or {}
+    if not isinstance(d, dict):
+        return {"raw": payload_str}
     raw_data = d.get("data")
     if isinstance(raw_data, str):
         inner = try_json(raw_data)
         if isinstance(inner, dict):
             d["data"] = inner
+    return d
+
 
-    ek    = "Kick other"
-    title = ""
-    payload = d if isinstance(d, dict) else {"raw": payload_str}
-
-    if en == "ChatMessageEvent":
-        ek = "Kick chat"
-
-    elif en == "RewardRedeemedEvent":
-        ek = "Kick redeem"
-        rd = {}
-        data_field = d.get("data")
-        if isinstance(data_field, dict):
-            rd = data_field
-        elif isinstance(data_field, str):
-            parsed = try_json(data_field)
-            if isinstance(parsed, dict):
-                rd = parsed
-        title = (
-            (rd.get("reward", {}) or {}).get("title")
-            or rd.get("reward_title")
-            or rd.get("title")
-            or "Unknown"
+def parse_event(payload_str: str, source_id: str = "") -> Event:
+    """
+    Classify one frame from the event name alone; the JSON is only
+    decoded when something reads customData (redeems need the title now).
+    """
+    en = detect_event_name(payload_str)
+    if not en:
+        # no known event → classify as “other”
+        return Event(
+            __name__, source_id, "Kick other",
+            DISPATCH.routes["Kick other"].trigger(event="Unknown"),
+            raw=payload_str
         )
+
+    record = {"event": en}
+    route  = DISPATCH.route(record)
+    ek     = route.event_key
+
+    if ek == "Kick redeem":
+        d  = decode_payload(payload_str)
+        rd = d.get("data") if isinstance(d.get("data"), dict) else {}
         payload = rd or {"raw": payload_str}
+        return Event(
+            __name__, source_id, ek, route.trigger(d),
+            custom_data=payload, raw=payload_str,
+            event_id=event_id(ek, payload)
+        )
 
-    elif en == "FollowEvent":
-        ek = "Kick follow"
-    elif en == "SubscriptionEvent":
-        ek = "Kick sub"
-    elif en == "GiftedSubscriptionEvent":
-        ek = "Kick gift sub"
-    elif en == "RaidStartedEvent":
-        ek = "Kick raid start"
-    elif en == "RaidEndedEvent":
-        ek = "Kick raid end"
-    elif en == "UserBannedEvent":
-        ek = "Kick ban"
-    elif en == "UserTimedOutEvent":
-        ek = "Kick timeout"
-    elif en == "StreamStartedEvent":
-        ek = "Kick stream start"
-    elif en == "StreamEndedEvent":
-        ek = "Kick stream end"
-
-    # build the trigger string
-    template = TRIGGERS.get(ek, TRIGGERS["Kick other"])
-    trigger = template.format(title=title, event=en)
-
-    return ek, {
-        "trigger": trigger,
-        "customData": payload
-    }
+    # without a leading id the relay asks event_id(), which decodes the
+    # frame and returns None when data has no id of its own
+    trigger = route.trigger(record)
+    m = _DATA_ID_RE.search(payload_str)
+    return Event(
+        __name__, source_id, ek, trigger,
+        raw=payload_str, build=decode_payload,
+        event_id=f"kick:{ek}:{m.group(1) or m.group(2)}" if m else None
+    )
+
+
+def parse_frame(payload_str: str):
+    """
+    Called on each WS frame. Returns (event_key, {trigger, customData})
+    or None if payload is empty.
+    """
+    ev = parse_event(payload_str)
+    return ev.event_key, {"trigger": ev.trigger, "customData": ev.custom_data}
 
 
 def attach_listeners(page, cdp_session, event_queue, source_id):
@@ -144,15 +268,6 @@ def attach_listeners(page, cdp_session, event_queue, source_id):
     """
     def _on_ws(frame):
         payload = frame["response"]["payloadData"]
-        result  = parse_frame(payload)
-        if result:
-            ek, fmt = result
-            event_queue.put((
-                __name__,    # should match parser.__name__
-                source_id,
-                ek,
-                fmt["trigger"],
-                fmt["customData"]
-            ))
+        event_queue.put(parse_event(payload, source_id))
 
     cdp_session.on("Network.webSocketFrameReceived", _on_ws)
\ No newline at end of file
@@ -0,0 +1,317 @@
+# loadtest.py
+#
+# End-to-end load harness with no browser. Synthetic frames are pushed
+# through each parser's real attach_listeners via a fake CDP session,
+# land on an event queue, are drained by Relay the way the UI tick does,
+# and are delivered by a real SammiSink to a local stub webhook with
+# injectable latency and failures.
+#
+# Usage:
+#   python loadtest.py [--rate R] [--duration S] [--shape steady|burst|ramp]
+#                      [--parsers twitch_parse,kick_parse] [--sources N]
+#                      [--latency MS] [--fail P] [--youtube-capture fetch|response]
+# Example:
+#   python loadtest.py --rate 2000 --duration 30 --shape burst --latency 20
+#
+# The report states sustained delivery throughput, peak queue depths,
+# drops and end-to-end latency (frame received → SAMMI answered), plus
+# YouTube's capture cost: Python callbacks per live-chat poll and the
+# time from a poll reaching Python to its event being queued.
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import contextlib
+from queue import Queue
+from threading import Thread, Lock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bench import CORPORA, FRAMES
+from relay import Relay
+from sinks import FanOut, SammiSink
+from zones import ZoneModel
+
+TICK_SECONDS    = 0.1     # main.process_events reschedules itself every 100 ms
+EVENTS_PER_TICK = 500     # main.MAX_EVENTS_PER_TICK
+SAMPLE_SECONDS  = 0.5     # queue depth sampling interval
+OTHER_RESPONSES = 3       # non-chat responses (telemetry, scripts) a chat page loads per poll
+
+
+class StubSammi:
+    """
+    Local stand-in for the SAMMI webhook. Every request sleeps `latency`
+    seconds; a `fail_rate` fraction answer 500.
+    """
+
+    def __init__(self, latency=0.0, fail_rate=0.0, host="127.0.0.1", port=0):
+        self.latency   = latency
+        self.fail_rate = fail_rate
+        self.received  = 0
+        self.failed    = 0
+        self._lock     = Lock()
+        stub = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if stub.latency:
+                    time.sleep(stub.latency)
+                fail = random.random() < stub.fail_rate
+                with stub._lock:
+                    stub.received += 1
+                    stub.failed   += fail
+                body = b"fail" if fail else b"ok"
+                self.send_response(500 if fail else 200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self.url     = f"http://{host}:{self._server.server_address[1]}/webhook"
+        self._thread = Thread(target=self._server.serve_forever, name="stub-sammi", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FakeCDPSession:
+    """
+    Just enough of a Playwright CDPSession / Page for attach_listeners:
+    handlers registered with .on() are called synchronously by emit().
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        self._loop     = None
+        self._bodies   = {}      # paused Fetch request id -> body
+        self._paused   = 0
+
+    def on(self, event, fn):
+        self._handlers.setdefault(event, []).append(fn)
+
+    def run(self, coro):
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(coro)
+
+    def emit(self, event, params):
+        for fn in self._handlers.get(event, ()):
+            res = fn(params)
+            if asyncio.iscoroutine(res):
+                self.run(res)
+
+    async def send(self, method, params=None):
+        if method == "Fetch.getResponseBody":
+            return {"body": self._bodies.pop(params["requestId"]), "base64Encoded": False}
+        return {}
+
+    def pause(self, body):
+        """
+        What the browser does for a response matching Fetch.enable's
+        patterns: pause it and tell the session.
+        """
+        if "Fetch.requestPaused" not in self._handlers:
+            return
+        self._paused += 1
+        request_id = f"fake-{self._paused}"
+        self._bodies[request_id] = body
+        self.emit("Fetch.requestPaused", {"requestId": request_id})
+
+
+class _FakeResponse:
+    # what youtube_parse's page.on("response") handler reads
+    url = "https://www.youtube.com/youtubei/v1/live_chat/get_live_chat?prettyPrint=false"
+
+    def __init__(self, body, url=None):
+        self._body = body
+        if url:
+            self.url = url
+
+    async def text(self):
+        return self._body
+
+
+_OTHER_RESPONSE = _FakeResponse("{}", "https://www.youtube.com/youtubei/v1/log_event?alt=json")
+
+
+def attach(mod, session, event_queue, source_id):
+    """
+    Call a parser's attach_listeners on a fake session, finishing any
+    setup coroutine it returns the way the driver does.
+    """
+    ready = mod.attach_listeners(session, session, event_queue, source_id)
+    if ready is not None:
+        session.run(ready)
+
+
+def deliver_frame(session, payload):
+    session.emit("Network.webSocketFrameReceived", {"response": {"payloadData": payload}})
+    session.pause(payload)
+    session.emit("response", _FakeResponse(payload))
+    for _ in range(OTHER_RESPONSES):
+        session.emit("response", _OTHER_RESPONSE)
+
+
+class TimedSammiSink(SammiSink):
+    """
+    SammiSink that records how long each event took from parse to the
+    webhook's answer.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.latencies = []
+
+    def deliver(self, event):
+        super().deliver(event)
+        self.latencies.append(time.monotonic() - event.ts)
+
+
+def rate_at(shape, rate, t, duration):
+    """
+    Target frames/s at time t. "burst" idles at a fifth of the rate and
+    spikes to 5x for the first second of every five; "ramp" climbs
+    linearly from zero to twice the rate.
+    """
+    if shape == "burst":
+        return rate * 5 if t % 5 < 1 else rate / 5
+    if shape == "ramp":
+        return rate * 2 * t / duration
+    return rate
+
+
+def generate(sessions, rate, duration, shape, stats):
+    """
+    Push frames round-robin across `sessions` on schedule. Falls behind
+    rather than dropping when the pipeline can't keep up.
+    """
+    start = time.monotonic()
+    sent  = 0
+    due   = 0.0
+    last  = start
+    while True:
+        now = time.monotonic()
+        t   = now - start
+        if t >= duration:
+            break
+        due += rate_at(shape, rate, t, duration) * (now - last)
+        last = now
+        while sent < due:
+            parser_name, session = sessions[sent % len(sessions)]
+            deliver_frame(session, CORPORA[parser_name](sent))
+            sent += 1
+        time.sleep(0.001)
+    stats["frames"] = sent
+    stats["gen_seconds"] = time.monotonic() - start
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(parsers, sources, rate, duration, shape, latency, fail_rate, verbose=False):
+    stub = StubSammi(latency, fail_rate)
+    stub.start()
+
+    model    = ZoneModel()
+    by_name  = {}
+    sessions = []
+    event_queue = Queue()
+    for name in parsers:
+        mod = FRAMES[name][0]
+        by_name[name] = mod
+        for n in range(sources):
+            source_id = f"loadtest{n}"
+            model.add(name, source_id, {ek: True for ek in mod.EVENTS})
+            session = FakeCDPSession()
+            attach(mod, session, event_queue, source_id)
+            sessions.append((name, session))
+
+    sink  = TimedSammiSink(url=stub.url)
+    sinks = FanOut([sink])
+    relay = Relay(model, sinks, by_name)
+
+    stats   = {}
+    samples = []
+    gen     = Thread(target=generate, args=(sessions, rate, duration, shape, stats), daemon=True)
+
+    out = sys.stdout if verbose else open(os.devnull, "w")
+    with contextlib.redirect_stdout(out):
+        sinks.start()
+        gen.start()
+        start = next_sample = time.monotonic()
+        while gen.is_alive() or not event_queue.empty():
+            relay.drain(event_queue, EVENTS_PER_TICK)
+            now = time.monotonic()
+            if now >= next_sample:
+                samples.append((now - start, event_queue.qsize(), sink.queue.qsize()))
+                next_sample = now + SAMPLE_SECONDS
+            time.sleep(TICK_SECONDS)
+        # let the sink finish what it already holds
+        while not sink.queue.empty() and time.monotonic() - start < duration * 3:
+            time.sleep(TICK_SECONDS)
+        elapsed = time.monotonic() - start
+        sinks.stop()
+    stub.stop()
+    if out is not sys.stdout:
+        out.close()
+
+    lat = sink.latencies
+    print(f"parsers      {', '.join(parsers)} × {sources} source(s), shape {shape}")
+    print(f"offered      {stats['frames']} frames in {stats['gen_seconds']:.1f}s "
+          f"({stats['frames'] / stats['gen_seconds']:.0f}/s, target {rate}/s)")
+    print(f"delivered    {sink.sent} events in {elapsed:.1f}s ({sink.sent / elapsed:.0f}/s)")
+    print(f"stub         {stub.received} requests, {stub.failed} answered 500, "
+          f"{sink.retried} retries")
+    print(f"dropped      {sink.dropped} at the sink queue, {relay.duplicates} duplicates")
+    print(f"queue peak   event_queue {max((s[1] for s in samples), default=0)}, "
+          f"sink {max((s[2] for s in samples), default=0)}")
+    if len(samples) > 1:
+        (t0, q0, s0), (t1, q1, s1) = samples[0], samples[-1]
+        print(f"queue growth {(q1 + s1 - q0 - s0) / max(t1 - t0, 1e-9):+.1f} events/s")
+    print(f"latency ms   p50 {percentile(lat, 0.50) * 1e3:.1f}  p99 {percentile(lat, 0.99) * 1e3:.1f}  "
+          f"max {max(lat, default=0) * 1e3:.1f}")
+    if "youtube_parse" in by_name:
+        print(f"youtube      {by_name['youtube_parse'].capture_stats.summary()}")
+    return sink, stub
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Offline end-to-end load test")
+    ap.add_argument("--rate", type=float, default=500, help="frames per second")
+    ap.add_argument("--duration", type=float, default=10, help="seconds of traffic")
+    ap.add_argument("--shape", choices=["steady", "burst", "ramp"], default="steady")
+    ap.add_argument("--parsers", default="twitch_parse,kick_parse,youtube_parse")
+    ap.add_argument("--sources", type=int, default=1, help="sources per parser")
+    ap.add_argument("--latency", type=float, default=0, help="stub webhook latency in ms")
+    ap.add_argument("--fail", type=float, default=0, help="fraction of webhook calls that fail")
+    ap.add_argument("--youtube-capture", choices=["fetch", "response"], default="fetch",
+                    help="YouTube live-chat capture path to exercise")
+    ap.add_argument("--verbose", action="store_true", help="keep [SAMMI] log lines")
+    args = ap.parse_args()
+
+    random.seed(0)
+    FRAMES["youtube_parse"][0].CAPTURE = args.youtube_capture
+    parsers = [p for p in args.parsers.split(",") if p]
+    unknown = [p for p in parsers if p not in FRAMES]
+    if unknown:
+        print(f"Unknown parser(s): {', '.join(unknown)}")
+        sys.exit(1)
+    run(parsers, args.sources, args.rate, args.duration, args.shape,
+        args.latency / 1000, args.fail, args.verbose)
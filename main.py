@@ -2,21 +2,30 @@
 
 import os
 import sys
-import json
 import subprocess
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
-import importlib.util
 from threading import Thread
-from queue import Queue
-import queue
 import time
-
-from driver import start_driver, stop_driver, event_queue
-from sammi import send_to_sammi
-
-CONFIG_FILE = "config.json"
-BASE_DIR    = os.path.dirname(os.path.abspath(__file__))
+import argparse
+
+from driver import start_driver, stop_driver, sync_sources, event_queue
+from sinks import build_sinks
+from relay import Relay
+from zones import ZoneModel
+from viewers import ViewerCache
+import profiler
+import recorder
+import scheduler
+from config import BASE_DIR, discover_parsers, load_config, save_config
+
+ZONES_PER_PAGE      = 4      # zones rendered at once (2×2 grid)
+SYNC_DELAY_MS       = 800    # settle time before saving / re-syncing sources
+MAX_EVENTS_PER_TICK = 500    # cap per UI tick so a burst can't freeze the window
+CONSOLE_MAX_LINES   = 2000   # trigger console keeps only the most recent lines
+PROFILE_SECONDS     = 30     # length of a capture started from the Profile button
+DUMP_MINUTES        = 5      # raw frames written by the Dump frames button
+PACING_REFRESH_MS   = 1000   # how often the header shows queued paced alerts
 
 
 def ensure_playwright_installed():
@@ -98,85 +107,38 @@ def ensure_playwright_installed():
             os.execv(sys.executable, [sys.executable] + sys.argv)
 
 
-def discover_parsers(directory):
-    """
-    Auto-load every *_parse.py in `directory` that defines
-    EVENTS, get_chat_url, and parse_frame.
-    """
-    parsers = []
-    for fname in os.listdir(directory):
-        if not fname.endswith("_parse.py"):
-            continue
-        module_name = fname[:-3]
-        path = os.path.join(directory, fname)
-        spec = importlib.util.spec_from_file_location(module_name, path)
-        if not spec or not spec.loader:
-            continue
-        mod = importlib.util.module_from_spec(spec)
-        try:
-            spec.loader.exec_module(mod)
-        except Exception:
-            continue
-        if (
-            hasattr(mod, "EVENTS")
-            and hasattr(mod, "get_chat_url")
-            and hasattr(mod, "parse_frame")
-            and isinstance(mod.EVENTS, (list, tuple))
-        ):
-            parsers.append(mod)
-    return parsers
-
-
-def load_config():
-    try:
-        with open(CONFIG_FILE, "r") as f:
-            return json.load(f)
-    except Exception:
-        return {}
-
-
-def save_config(zones):
-    cfg = {}
-    for i, zone in enumerate(zones):
-        parser = zone.get_parser()
-        if not parser:
-            continue
-        raw = zone.input_var.get().strip()
-        if hasattr(zone, "_placeholder") and raw == zone._placeholder:
-            raw = ""
-        cfg[f"zone_{i}"] = {
-            "parser": parser.__name__,
-            "input": raw,
-            "filters": {
-                ev: bool(var.get()) for ev, var in zone.filter_vars.items()
-            }
-        }
-    try:
-        with open(CONFIG_FILE, "w") as f:
-            json.dump(cfg, f, indent=2)
-    except Exception:
-        pass
-
-
 # Discover parser modules at startup
 PARSERS = discover_parsers(BASE_DIR)
+PARSERS_BY_NAME = {p.__name__: p for p in PARSERS}
 
 
 class ZoneFrame(tk.LabelFrame):
-    def __init__(self, master, label, config, *args, **kwargs):
+    """
+    Editor widget for one zones.Zone. Every edit is written straight
+    through to the ZoneModel; the frame itself holds no state that
+    outlives it, so it can be destroyed whenever it scrolls out of view.
+    """
+    def __init__(self, master, label, zone, model, *args, **kwargs):
         super().__init__(master, text=label, *args, **kwargs)
+        self.zone         = zone
+        self.model        = model
         self.parser_var   = tk.StringVar()
         self.input_var    = tk.StringVar()
         self.filter_vars  = {}
         self._placeholder = ""
 
-        # Parser dropdown
+        # Parser dropdown + remove button
+        top = tk.Frame(self)
+        top.pack(fill=tk.X)
         self.parser_dropdown = ttk.Combobox(
-            self, textvariable=self.parser_var, state="readonly"
+            top, textvariable=self.parser_var, state="readonly"
         )
         self.parser_dropdown["values"] = [p.__name__ for p in PARSERS]
-        self.parser_dropdown.pack(fill=tk.X, padx=4, pady=4)
+        self.parser_dropdown.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=4, pady=4)
         self.parser_dropdown.bind("<<ComboboxSelected>>", self._on_parser_change)
+        ttk.Button(
+            top, text="✕", width=3, command=lambda: model.remove(zone.id)
+        ).pack(side=tk.RIGHT, padx=4)
 
         # Input field
         self.input_entry = tk.Entry(self, textvariable=self.input_var)
@@ -188,22 +150,19 @@ class ZoneFrame(tk.LabelFrame):
         self.filter_frame = tk.Frame(self)
         self.filter_frame.pack(fill=tk.BOTH, expand=True)
 
-        # Load saved state if present
-        if config:
-            self.parser_var.set(config.get("parser", ""))
-            self.input_var.set(config.get("input", ""))
-            self.update_filters(config.get("filters", {}))
+        # Load state from the model
+        if zone.parser:
+            self.parser_var.set(zone.parser)
+            self.input_var.set(zone.input)
+            self.update_filters(zone.filters)
 
-        # Placeholder & auto‐detect trace
+        # Placeholder, auto‐detect and write-through traces
         self._add_placeholder()
         self.input_var.trace_add("write", self._detect_parser)
+        self.input_var.trace_add("write", self._on_input_change)
 
     def get_parser(self):
-        name = self.parser_var.get()
-        for p in PARSERS:
-            if p.__name__ == name:
-                return p
-        return None
+        return PARSERS_BY_NAME.get(self.parser_var.get())
 
     def _on_parser_change(self, event):
         self.input_var.set("")
@@ -212,6 +171,12 @@ class ZoneFrame(tk.LabelFrame):
         self.update_filters()
         self._add_placeholder()
 
+    def _on_input_change(self, *args):
+        raw = self.input_var.get().strip()
+        if raw == self._placeholder:
+            raw = ""
+        self.model.update(self.zone.id, input=raw)
+
     def update_filters(self, saved_filters=None):
         if isinstance(saved_filters, tk.Event):
             saved_filters = None
@@ -220,16 +185,27 @@ class ZoneFrame(tk.LabelFrame):
         self.filter_vars.clear()
         parser = self.get_parser()
         if not parser:
+            self.model.update(self.zone.id, parser="", filters={})
             return
         for ev in parser.EVENTS:
             val = 1 if saved_filters is None or saved_filters.get(ev, True) else 0
             var = tk.IntVar(value=val)
             row = tk.Frame(self.filter_frame)
             row.pack(fill=tk.X, padx=2, pady=1)
-            tk.Checkbutton(row, variable=var).pack(side=tk.LEFT)
+            tk.Checkbutton(
+                row, variable=var,
+                command=lambda ev=ev, var=var: self.model.set_filter(
+                    self.zone.id, ev, bool(var.get())
+                )
+            ).pack(side=tk.LEFT)
             lbl = parser.TRIGGERS.get(ev, ev)
             tk.Label(row, text=f"{lbl} ({ev})", anchor="w").pack(side=tk.LEFT)
             self.filter_vars[ev] = var
+        self.model.update(
+            self.zone.id,
+            parser=parser.__name__,
+            filters={ev: bool(var.get()) for ev, var in self.filter_vars.items()}
+        )
 
     def _add_placeholder(self):
         if self.input_var.get().strip():
@@ -242,10 +218,10 @@ class ZoneFrame(tk.LabelFrame):
         else:
             ptype = "parser"
         text = f"Enter {ptype}"
+        self._placeholder = text
         self.input_entry.delete(0, tk.END)
         self.input_entry.insert(0, text)
         self.input_entry.config(fg="gray")
-        self._placeholder = text
 
     def _on_input_focus_in(self, event):
         if self.input_var.get() == self._placeholder:
@@ -274,14 +250,22 @@ class ZoneFrame(tk.LabelFrame):
                 break
 
 
-def launch_ui():
+def launch_ui(profile_seconds=0):
     # 1) Ensure Playwright & Chromium are installed
     ensure_playwright_installed()
 
     # 2) Load saved configuration
     cfg = load_config()
 
-    # 3) Build and launch UI
+    # 3) Start delivery targets
+    sinks = build_sinks(cfg)
+    sinks.start()
+    model   = ZoneModel.from_config(cfg)
+    viewers = ViewerCache.from_config(cfg)
+    relay   = Relay(model, sinks, PARSERS_BY_NAME, viewers=viewers)
+    recorder.open_recorder(cfg)
+
+    # 4) Build and launch UI
     root = tk.Tk()
     root.title("Hook Streamer")
     root.geometry("1200x700")
@@ -289,23 +273,46 @@ def launch_ui():
     # Header with Start button
     header = tk.Frame(root)
     header.pack(side=tk.TOP, fill=tk.X, padx=10, pady=5)
-    start_btn = ttk.Button(header, text="Start", command=lambda: on_start(zones))
+    start_btn = ttk.Button(header, text="Start", command=lambda: on_start())
     start_btn.pack(side=tk.LEFT)
+    ttk.Button(header, text="Add zone", command=lambda: model.add()).pack(side=tk.LEFT, padx=(10, 0))
+    profile_btn = ttk.Button(header, text="Profile", command=lambda: toggle_profile())
+    profile_btn.pack(side=tk.LEFT, padx=(10, 0))
+    ttk.Button(header, text="Dump frames", command=lambda: dump_frames()).pack(side=tk.LEFT, padx=(10, 0))
+    pacing_label = tk.Label(header)
+    pacing_label.pack(side=tk.LEFT, padx=(10, 0))
+    ttk.Button(header, text="▶", width=3, command=lambda: turn_page(1)).pack(side=tk.RIGHT)
+    page_label = tk.Label(header)
+    page_label.pack(side=tk.RIGHT, padx=5)
+    ttk.Button(header, text="◀", width=3, command=lambda: turn_page(-1)).pack(side=tk.RIGHT)
 
     # Main layout: zones + console
     content = tk.Frame(root)
     content.pack(fill=tk.BOTH, expand=True)
 
-    zones = []
     zone_frame = tk.Frame(content)
     zone_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-    for i in range(4):
-        zone_cfg = cfg.get(f"zone_{i}", {})
-        zf = ZoneFrame(zone_frame, f"Zone {i+1}", zone_cfg)
-        zf.grid(row=i//2, column=i%2, padx=10, pady=10, sticky="nsew")
-        zone_frame.grid_rowconfigure(i//2, weight=1)
-        zone_frame.grid_columnconfigure(i%2, weight=1)
-        zones.append(zf)
+    for i in range(2):
+        zone_frame.grid_rowconfigure(i, weight=1)
+        zone_frame.grid_columnconfigure(i, weight=1)
+    page = [0]
+
+    def render_page():
+        # only the visible page of zones has widgets; the rest live in the model
+        for w in zone_frame.winfo_children():
+            w.destroy()
+        visible = list(model)
+        pages   = max(1, -(-len(visible) // ZONES_PER_PAGE))
+        page[0] = min(page[0], pages - 1)
+        first   = page[0] * ZONES_PER_PAGE
+        for i, zone in enumerate(visible[first:first + ZONES_PER_PAGE]):
+            zf = ZoneFrame(zone_frame, f"Zone {first + i + 1}", zone, model)
+            zf.grid(row=i//2, column=i%2, padx=10, pady=10, sticky="nsew")
+        page_label.config(text=f"Zones {page[0] + 1}/{pages}")
+
+    def turn_page(step):
+        page[0] = max(0, page[0] + step)
+        render_page()
 
     console_frame = tk.Frame(content)
     console_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -319,49 +326,103 @@ def launch_ui():
     def log_trigger(msg):
         console_log.config(state=tk.NORMAL)
         console_log.insert(tk.END, msg + "\n")
+        # a long stream would otherwise grow the widget without bound
+        excess = int(console_log.index("end-1c").split(".")[0]) - 1 - CONSOLE_MAX_LINES
+        if excess > 0:
+            console_log.delete("1.0", f"{excess + 1}.0")
         console_log.see(tk.END)
         console_log.config(state=tk.DISABLED)
 
-    def on_start(zones):
+    # Sampling profiler: Profile starts a capture, pressing it again stops early
+    capture = [None]
+
+    def toggle_profile(seconds=PROFILE_SECONDS):
+        if capture[0] and capture[0].running:
+            capture[0].stop()
+            return
+
+        def done(sampler):
+            print(f"[Profiler] {sampler.summary()}")
+            root.after(0, lambda: (
+                profile_btn.config(text="Profile"),
+                log_trigger(f"[Profiler] saved {sampler.path}")
+            ))
+        capture[0] = profiler.start_capture(seconds, on_done=done)
+        profile_btn.config(text="Stop profile")
+        log_trigger(f"[Profiler] capturing all threads for up to {seconds}s")
+
+    # `python profiler.py toggle PID` (Ctrl+Break on Windows) does the same
+    profiler.on_signal(lambda: root.after(0, toggle_profile))
+
+    def dump_frames(minutes=DUMP_MINUTES):
+        # copying the ring buffer takes a moment; keep it off the Tk thread
+        def _dump():
+            result = recorder.dump_recent(minutes)
+            msg = (f"[Recorder] {result[1]} frame(s) from the last {minutes} min → {result[0]}"
+                   if result else "[Recorder] not running")
+            print(msg)
+            root.after(0, lambda: log_trigger(msg))
+        Thread(target=_dump, name="recorder-dump", daemon=True).start()
+
+    def on_start():
         stop_driver()
         time.sleep(0.5)
-        sources = []
-        for zone in zones:
-            parser = zone.get_parser()
-            val    = zone.input_var.get().strip()
-            if parser and val and val != zone._placeholder:
-                sources.append({"parser": parser, "username": val})
+        sources = model.sources(PARSERS_BY_NAME)
         if sources:
-            start_driver(sources)
+            start_driver(sources, multiplex=load_config().get("multiplex"))
+
+    # Persist and apply zone edits once typing settles, not per keystroke
+    pending = {}
+
+    def on_model_change(kind, zone):
+        if kind == "add":
+            page[0] = (len(model) - 1) // ZONES_PER_PAGE
+        if kind in ("add", "remove"):
+            render_page()
+        if "sync" in pending:
+            root.after_cancel(pending["sync"])
+        pending["sync"] = root.after(SYNC_DELAY_MS, apply_changes)
+
+    def apply_changes():
+        pending.pop("sync", None)
+        save_config(model)
+        sync_sources(model.sources(PARSERS_BY_NAME))
+
+    model.subscribe(on_model_change)
 
     def process_events():
-        try:
-            parser_name, source_id, event_key, trigger, data = event_queue.get(timeout=0.1)
-            for zone in zones:
-                parser    = zone.get_parser()
-                input_val = zone.input_var.get().strip()
-                if (
-                    parser
-                    and parser.__name__ == parser_name
-                    and input_val == source_id
-                    and event_key in zone.filter_vars
-                    and zone.filter_vars[event_key].get()
-                ):
-                    send_to_sammi({"trigger": trigger, "customData": data})
-                    log_trigger(trigger)
-        except queue.Empty:
-            pass
+        # drain what has arrived since the last tick instead of one event per tick
+        for ev in relay.drain(event_queue, MAX_EVENTS_PER_TICK):
+            log_trigger(ev.trigger)
         root.after(100, process_events)
 
+    def show_pacing():
+        # paced SAMMI alerts still waiting, per class
+        text = scheduler.describe(sinks.pacing_stats())
+        pacing_label.config(text=f"Pacing: {text}" if text else "")
+        root.after(PACING_REFRESH_MS, show_pacing)
+
     def on_close():
         stop_driver()
-        save_config(zones)
+        sinks.stop()
+        save_config(model)
+        viewers.save()
         root.destroy()
 
     root.protocol("WM_DELETE_WINDOW", on_close)
+    render_page()
     process_events()
+    show_pacing()
+    profiler.watch_tk(root)
+    if profile_seconds:
+        toggle_profile(profile_seconds)
     root.mainloop()
 
 
 if __name__ == "__main__":
-    launch_ui()
\ No newline at end of file
+    ap = argparse.ArgumentParser(description="Streamer Alert Relay")
+    ap.add_argument("--profile", type=float, default=0, metavar="SECONDS",
+                    help="record a sampling profile of all threads right after startup "
+                         "(later: python profiler.py toggle PID)")
+    args = ap.parse_args()
+    launch_ui(args.profile)
\ No newline at end of file
@@ -0,0 +1,134 @@
+# pagescript.py
+#
+# Page-side maintenance for the chat pop-outs. The relay only reads
+# network traffic, but the pages still render every message for hours.
+# A parser can set PAGE_SCRIPT to JavaScript the driver injects with
+# page.add_init_script() before the chat loads; prune_chat() builds the
+# usual one:
+#
+#     PAGE_SCRIPT = prune_chat("#chat-list", keep=100)
+#
+# It skips rendering of the page (`hide`, the whole body by default, so
+# new messages cost no layout or paint) and, when `keep` is set, removes
+# all but the newest `keep` children of the message list. The list is
+# looked up again every few seconds, so re-rendered chat containers are
+# picked up as well. Only prune lists the site doesn't already cap: the
+# pages' own frameworks may not like their nodes disappearing.
+#
+# multiplex() builds a parser's MUX_SCRIPT: it lets one pop-out page carry
+# the chat of many channels by sending extra subscriptions over the page's
+# own chat WebSocket (see driver.py, "multiplex" in config.json).
+
+import json
+
+_TEMPLATE = """
+(() => {
+  const SELECTOR = %(selector)s, KEEP = %(keep)s, HIDE = %(hide)s;
+  if (window.__relayPrune) return;
+  window.__relayPrune = true;
+
+  if (HIDE) {
+    const style = document.createElement("style");
+    style.textContent = HIDE + " { content-visibility: hidden !important; }";
+    document.documentElement.appendChild(style);
+  }
+  if (!SELECTOR || !KEEP) return;
+
+  let list = null, observer = null;
+  const trim = () => {
+    try {
+      while (list && list.childElementCount > KEEP) list.firstElementChild.remove();
+    } catch (e) {}
+  };
+  setInterval(() => {
+    const found = document.querySelector(SELECTOR);
+    if (found === list) return;
+    if (observer) observer.disconnect();
+    list = found;
+    if (list) {
+      observer = new MutationObserver(trim);
+      observer.observe(list, { childList: true });
+      trim();
+    }
+  }, 2000);
+})();
+"""
+
+
+def prune_chat(selector=None, keep=None, hide="body") -> str:
+    """
+    Init script that stops rendering of `hide` (a CSS selector, or None to
+    keep rendering) and, if `keep` is given, caps the children of the
+    element matching `selector` at the newest `keep`.
+    """
+    return _TEMPLATE % {
+        "selector": json.dumps(selector),
+        "keep":     int(keep or 0),
+        "hide":     json.dumps(hide),
+    }
+
+
+_MUX_TEMPLATE = """
+(() => {
+  const URL_PART = %(url)s, READY = new RegExp(%(ready)s), SPACING = %(spacing)s;
+  const subscribe = %(subscribe)s, unsubscribe = %(unsubscribe)s;
+  const Native = window.WebSocket;
+  let socket = null, ready = false, timer = null;
+  let wanted = new Set(), joined = new Set(), outbox = [];
+
+  const flush = () => {
+    timer = null;
+    if (!ready || socket.readyState !== 1) return;
+    const msg = outbox.shift();
+    if (msg === undefined) return;
+    socket.send(msg);
+    if (outbox.length) timer = setTimeout(flush, SPACING);
+  };
+  const sync = () => {
+    if (!ready) return;
+    const add  = [...wanted].filter((k) => !joined.has(k));
+    const drop = [...joined].filter((k) => !wanted.has(k));
+    joined = new Set(wanted);
+    if (add.length) outbox.push(...subscribe(add));
+    if (drop.length) outbox.push(...unsubscribe(drop));
+    if (!timer) flush();
+  };
+
+  window.WebSocket = function (url, protocols) {
+    const ws = protocols === undefined ? new Native(url) : new Native(url, protocols);
+    if (String(url).includes(URL_PART)) {
+      // the site reconnected: start over on the new socket
+      socket = ws; ready = false; joined = new Set(); outbox = [];
+      ws.addEventListener("message", (e) => {
+        if (!ready && typeof e.data === "string" && READY.test(e.data)) {
+          ready = true;
+          sync();
+        }
+      });
+    }
+    return ws;
+  };
+  window.WebSocket.prototype = Native.prototype;
+  Object.assign(window.WebSocket, { CONNECTING: 0, OPEN: 1, CLOSING: 2, CLOSED: 3 });
+
+  window.__relayMux = (keys) => { wanted = new Set(keys); sync(); };
+})();
+"""
+
+
+def multiplex(url_part, ready, subscribe, unsubscribe, spacing=0) -> str:
+    """
+    Init script for a parser's MUX_SCRIPT. It wraps the page's WebSocket
+    whose URL contains `url_part`; once a frame matches the `ready` regex,
+    it sends the messages that the JS functions `subscribe(keys)` and
+    `unsubscribe(keys)` return, `spacing` ms apart. The driver then calls
+    window.__relayMux(keys) with the full set of topics the page should
+    be subscribed to.
+    """
+    return _MUX_TEMPLATE % {
+        "url":         json.dumps(url_part),
+        "ready":       json.dumps(ready),
+        "spacing":     int(spacing),
+        "subscribe":   subscribe,
+        "unsubscribe": unsubscribe,
+    }
@@ -0,0 +1,272 @@
+# profiler.py
+#
+# Diagnostics for a relay that stutters mid-stream.
+#
+# Sampling profiler: capture(seconds) snapshots every thread's stack via
+# sys._current_frames() every few milliseconds and writes the result in
+# collapsed-stack format ("thread;file:func;file:func count" per line),
+# which flamegraph.pl and speedscope open directly. Started from the UI's
+# Profile button, `python main.py --profile SECONDS`, or in a running relay
+# (UI or broker process) from the command line:
+#
+#     python profiler.py toggle PID      # sends SIGUSR1; again to stop
+#
+# On Windows, press Ctrl+Break in the relay's console instead.
+#
+# Watchdogs: the Tk main loop and the driver's asyncio loop each beat a
+# Watchdog from a periodic callback. A background thread checks the
+# beats; when one loop stops beating for longer than its threshold, the
+# stack of the thread running it is logged so the blocking call is named.
+
+import os
+import sys
+import time
+import signal
+import asyncio
+import argparse
+import threading
+import traceback
+from collections import Counter
+
+PROFILE_INTERVAL = 0.005   # seconds between stack samples
+BEAT_INTERVAL    = 0.1     # how often watched loops beat
+STALL_THRESHOLD  = 0.5     # seconds without a beat before a loop counts as stalled
+TOGGLE_SECONDS   = 300     # a capture toggled on by signal stops by itself after this
+
+# starts / stops a capture in a running process (SIGBREAK is Ctrl+Break on Windows)
+PROFILE_SIGNAL = getattr(signal, "SIGUSR1", None) or getattr(signal, "SIGBREAK", None)
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _stack_key(thread_name, frame):
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ";".join(reversed(labels))
+
+
+class Sampler:
+    """
+    Background sampling profiler over all threads. Use capture() or
+    start_capture() rather than driving it directly.
+    """
+
+    def __init__(self, seconds, path=None, interval=PROFILE_INTERVAL):
+        self.seconds  = seconds
+        self.interval = interval
+        self.path     = path or time.strftime("profile-%Y%m%d-%H%M%S.txt")
+        self.samples  = 0
+        self.elapsed  = 0.0     # seconds actually captured (less if stopped early)
+        self.stacks   = Counter()
+        self._stop    = threading.Event()
+        self._thread  = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def start(self, on_done=None):
+        def _run():
+            self.run()
+            if on_done:
+                on_done(self)
+        self._thread = threading.Thread(target=_run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        own   = threading.get_ident()
+        names = {}
+        start = time.monotonic()
+        end   = start + self.seconds
+        while not self._stop.is_set() and time.monotonic() < end:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                name = names.get(ident)
+                if name is None:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                    name  = names.get(ident, f"thread-{ident}")
+                self.stacks[_stack_key(name, frame)] += 1
+            self.samples += 1
+            self._stop.wait(self.interval)
+        self.elapsed = time.monotonic() - start
+        self.write()
+
+    def write(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+
+    def summary(self, top=5) -> str:
+        """
+        Busiest leaf functions per thread, as a few printable lines.
+        """
+        per_thread = {}
+        for stack, n in self.stacks.items():
+            parts = stack.split(";")
+            per_thread.setdefault(parts[0], Counter())[parts[-1]] += n
+        lines = [f"{self.samples} samples over {self.elapsed:.1f}s → {self.path}"]
+        for thread, leaves in sorted(per_thread.items()):
+            hot = ", ".join(f"{leaf} {n * 100 // max(self.samples, 1)}%"
+                            for leaf, n in leaves.most_common(top))
+            lines.append(f"  {thread}: {hot}")
+        return "\n".join(lines)
+
+
+def start_capture(seconds, path=None, on_done=None) -> Sampler:
+    """
+    Profile all threads for `seconds` in the background; on_done(sampler)
+    is called from the profiler thread once the file is written.
+    """
+    return Sampler(seconds, path).start(on_done)
+
+
+def capture(seconds, path=None) -> Sampler:
+    """
+    Blocking variant of start_capture().
+    """
+    sampler = Sampler(seconds, path)
+    sampler.run()
+    return sampler
+
+
+_toggled = None     # capture started by toggle_capture()
+
+
+def toggle_capture(seconds=TOGGLE_SECONDS):
+    """
+    Start a capture, or stop the one this started earlier. The summary is
+    logged once the file is written.
+    """
+    global _toggled
+    if _toggled and _toggled.running:
+        _toggled.stop()
+        return
+    _toggled = start_capture(seconds, on_done=lambda s: print(f"[Profiler] {s.summary()}"))
+    print(f"[Profiler] Capturing all threads for up to {seconds}s")
+
+
+def on_signal(fn) -> bool:
+    """
+    Call fn() each time the process receives PROFILE_SIGNAL. Must be called
+    from the main thread. Returns False where there is no such signal.
+    """
+    if PROFILE_SIGNAL is None:
+        return False
+    signal.signal(PROFILE_SIGNAL, lambda signum, frame: fn())
+    return True
+
+
+class Watchdog:
+    """
+    Liveness of one loop. The loop calls beat() every BEAT_INTERVAL; the
+    watchdog thread reports when beats stop for longer than `threshold`.
+    """
+
+    def __init__(self, name, threshold=STALL_THRESHOLD, ident=None):
+        self.name      = name
+        self.threshold = threshold
+        self.ident     = ident or threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.max_lag   = 0.0
+        self.stalls    = 0
+        self._stalled  = False
+
+    def beat(self):
+        now = time.monotonic()
+        lag = now - self.last_beat - BEAT_INTERVAL
+        if lag > self.max_lag:
+            self.max_lag = lag
+        if self._stalled:
+            print(f"[Watchdog] {self.name} recovered after {lag + BEAT_INTERVAL:.2f}s")
+            self._stalled = False
+        self.last_beat = now
+
+    def check(self, now):
+        if self._stalled or now - self.last_beat < self.threshold + BEAT_INTERVAL:
+            return
+        self._stalled = True
+        self.stalls  += 1
+        frame = sys._current_frames().get(self.ident)
+        stack = "".join(traceback.format_stack(frame)) if frame else "  (thread gone)\n"
+        print(f"[Watchdog] {self.name} stalled for {now - self.last_beat:.2f}s, "
+              f"currently in:\n{stack}", end="")
+
+    def close(self):
+        _watchdogs.discard(self)
+
+
+_watchdogs = set()
+_watch_thread = None
+
+
+def watchdog(name, threshold=STALL_THRESHOLD) -> Watchdog:
+    """
+    Register a watchdog for the loop running on the calling thread.
+    """
+    global _watch_thread
+    wd = Watchdog(name, threshold)
+    _watchdogs.add(wd)
+    if _watch_thread is None:
+        def _watch():
+            while True:
+                time.sleep(BEAT_INTERVAL)
+                now = time.monotonic()
+                for w in list(_watchdogs):
+                    w.check(now)
+        _watch_thread = threading.Thread(target=_watch, name="watchdog", daemon=True)
+        _watch_thread.start()
+    return wd
+
+
+def watch_tk(root, threshold=STALL_THRESHOLD) -> Watchdog:
+    """
+    Beat a watchdog from Tk's after() loop. Call on the Tk thread.
+    """
+    wd = watchdog("Tk main loop", threshold)
+    interval = int(BEAT_INTERVAL * 1000)
+
+    def _tick():
+        wd.beat()
+        root.after(interval, _tick)
+    root.after(interval, _tick)
+    return wd
+
+
+async def watch_asyncio(name="asyncio loop", threshold=STALL_THRESHOLD):
+    """
+    Beat a watchdog from the running event loop until cancelled.
+    """
+    wd = watchdog(name, threshold)
+    try:
+        while True:
+            await asyncio.sleep(BEAT_INTERVAL)
+            wd.beat()
+    finally:
+        wd.close()
+
+
+if __name__ == "__main__":
+    ap  = argparse.ArgumentParser(description="Profile a running relay")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    t   = sub.add_parser("toggle", help="start or stop a capture in a running relay")
+    t.add_argument("pid", type=int, help="process id of the relay (UI, coordinator or worker)")
+    args = ap.parse_args()
+
+    if not hasattr(signal, "SIGUSR1"):
+        sys.exit("[Profiler] Press Ctrl+Break in the relay's console to toggle a capture")
+    try:
+        os.kill(args.pid, signal.SIGUSR1)
+    except OSError as e:
+        sys.exit(f"[Profiler] {e}")
+    print(f"[Profiler] Toggled capture in {args.pid}; the profile is written in its directory")
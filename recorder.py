@@ -0,0 +1,295 @@
+# recorder.py
+#
+# Flight recorder for raw frames. Every payload the driver receives is
+# appended, with its wall-clock time, parser and source id, to a
+# fixed-size ring buffer in a memory-mapped file. Once the file is full the
+# oldest frames are overwritten, so the recorder is always on and never
+# grows. The file survives a crash and can be read by another process.
+#
+# When a parser misclassifies something live, dump the last few minutes:
+#
+#     python recorder.py dump --minutes 5 --out frames.ndjson
+#     python test.py --replay frames.ndjson
+#     python bench.py parse 0 frames.ndjson
+#
+# `python recorder.py check` exercises the wrap-around on a scratch file.
+#
+# (or the UI's "Dump frames" button). The dump is NDJSON, one
+# {"parser", "source_id", "ts", "payload"} object per frame.
+#
+# config.json:
+#   "recorder": {"path": "flight_recorder.bin", "size_mb": 64}    (size_mb 0 turns it off)
+
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import argparse
+import tempfile
+import threading
+
+RECORDER_PATH = "flight_recorder.bin"
+RECORDER_MB   = 64
+
+_MAGIC  = b"SARFLT01"
+_HEADER = struct.Struct("<8sQQQQ")     # magic, capacity, head, tail, count
+_CURSOR = struct.Struct("<QQQ")        # head, tail, count, rewritten after every record
+_RECORD = struct.Struct("<IdBHI")      # record length, ts, parser len, source len, payload len
+_START  = _HEADER.size
+
+
+class FlightRecorder:
+    """
+    Ring buffer of (ts, parser, source_id, payload) records in a mmap'd
+    file. Records are written whole at `head`; the oldest live record
+    starts at `tail`. A zero length word (or too little room for one)
+    means the rest of the buffer is unused and reading continues at the
+    start.
+    """
+
+    def __init__(self, path=RECORDER_PATH, size=RECORDER_MB << 20, readonly=False):
+        self.path    = path
+        self.lock    = threading.Lock()
+        self.dropped = 0
+
+        if readonly:
+            with open(path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self.size, self.head, self.tail, self.count = _HEADER.unpack_from(self._map)
+            if magic != _MAGIC:
+                raise ValueError(f"{path} is not a flight recorder file")
+            return
+
+        size = max(size, _START + 4096)
+        with open(path, "a+b") as f:
+            if os.fstat(f.fileno()).st_size != size:
+                f.truncate(size)
+            self._map = mmap.mmap(f.fileno(), size)
+        self.size = size
+        magic, capacity, head, tail, count = _HEADER.unpack_from(self._map)
+        if magic == _MAGIC and capacity == size:
+            # keep what an earlier run recorded
+            self.head, self.tail, self.count = head, tail, count
+        else:
+            self.head = self.tail = _START
+            self.count = 0
+            self._sync()
+
+    def _sync(self):
+        _HEADER.pack_into(self._map, 0, _MAGIC, self.size, self.head, self.tail, self.count)
+
+    def _drop_until(self, end):
+        # drop the oldest records while they overlap [head, end)
+        buf = self._map
+        if self.tail + 4 > self.size:
+            self.tail = _START
+        while self.count and self.head <= self.tail < end:
+            n = struct.unpack_from("<I", buf, self.tail)[0]
+            if n == 0:
+                self.tail = _START
+                continue
+            self.tail  += n
+            self.count -= 1
+            # a record ending at (or too close to) the end of the buffer
+            # means the next oldest one is at the start
+            if self.tail + 4 > self.size:
+                self.tail = _START
+
+    def record(self, parser, source_id, payload, ts=None):
+        """
+        Append one frame, overwriting the oldest ones if needed.
+        """
+        p = parser.encode()
+        s = source_id.encode()
+        d = payload.encode("utf-8", "surrogatepass") if isinstance(payload, str) else payload
+        n = _RECORD.size + len(p) + len(s) + len(d)
+        if n > self.size - _START or len(p) > 255 or len(s) > 65535:
+            self.dropped += 1
+            return
+        ts = time.time() if ts is None else ts
+
+        with self.lock:
+            buf = self._map
+            if not self.count:
+                self.tail = self.head
+            if self.head + n > self.size:
+                self._drop_until(self.size)
+                if self.head + 4 <= self.size:
+                    struct.pack_into("<I", buf, self.head, 0)
+                self.head = _START
+                if not self.count:
+                    self.tail = _START
+            self._drop_until(self.head + n)
+
+            pos = self.head
+            buf[pos:pos + n] = _RECORD.pack(n, ts, len(p), len(s), len(d)) + p + s + d
+            self.head  += n
+            self.count += 1
+            _CURSOR.pack_into(buf, 16, self.head, self.tail, self.count)
+
+    def records(self, since=None):
+        """
+        Yield (ts, parser, source_id, payload) oldest first, optionally
+        only those recorded at or after `since` (epoch seconds).
+        """
+        # copy first: the writer (maybe another process) keeps going
+        with self.lock:
+            snapshot = self._map[:]
+        _, size, _, pos, count = _HEADER.unpack_from(snapshot)
+        for _ in range(count):
+            if pos + 4 > size or struct.unpack_from("<I", snapshot, pos)[0] == 0:
+                pos = _START
+            n, ts, lp, ls, ld = _RECORD.unpack_from(snapshot, pos)
+            if n < _RECORD.size:
+                return      # torn write
+            if since is None or ts >= since:
+                start = pos + _RECORD.size
+                yield (
+                    ts,
+                    snapshot[start:start + lp].decode(),
+                    snapshot[start + lp:start + lp + ls].decode(),
+                    snapshot[start + lp + ls:start + lp + ls + ld].decode("utf-8", "replace"),
+                )
+            pos += n
+
+    def dump(self, path, minutes=None) -> int:
+        """
+        Write the last `minutes` (all, if None) of frames to `path` as
+        NDJSON. Returns the number of frames written.
+        """
+        since = time.time() - minutes * 60 if minutes else None
+        written = 0
+        with open(path, "w", encoding="utf-8") as f:
+            for ts, parser, source_id, payload in self.records(since):
+                f.write(json.dumps({
+                    "parser": parser, "source_id": source_id, "ts": ts, "payload": payload
+                }, ensure_ascii=False) + "\n")
+                written += 1
+        return written
+
+    def stats(self) -> dict:
+        return {"frames": self.count, "size": self.size, "dropped": self.dropped}
+
+    def close(self):
+        with self.lock:
+            self._map.flush()
+            self._map.close()
+
+
+flight = None     # the process-wide recorder, set by open_recorder()
+
+
+def open_recorder(cfg: dict, suffix=""):
+    """
+    Start the process-wide recorder from the "recorder" config section.
+    `suffix` is appended to the file name, so several processes (broker
+    workers) each keep their own file.
+    """
+    global flight
+    opts = cfg.get("recorder") or {}
+    size = opts.get("size_mb", RECORDER_MB)
+    if not size:
+        return None
+    root, ext = os.path.splitext(opts.get("path", RECORDER_PATH))
+    try:
+        flight = FlightRecorder(f"{root}{suffix}{ext}", int(size * (1 << 20)))
+    except (OSError, ValueError) as e:
+        print(f"[Recorder] Disabled: {e}")
+        flight = None
+    return flight
+
+
+def record(parser, source_id, payload):
+    """
+    Record one raw frame if the recorder is running. Called by the driver
+    for every frame it receives.
+    """
+    if flight is not None:
+        flight.record(parser, source_id, payload)
+
+
+def dump_recent(minutes=5, path=None):
+    """
+    Dump the running recorder's last `minutes` to a timestamped NDJSON
+    file. Returns (path, frames) or None when the recorder is off.
+    """
+    if flight is None:
+        return None
+    path = path or time.strftime("frames-%Y%m%d-%H%M%S.ndjson")
+    return path, flight.dump(path, minutes)
+
+
+def load_frames(path):
+    """
+    Records of a dump (or any NDJSON with parser/payload), in order.
+    """
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def self_check(size=4357, rounds=2000) -> bool:
+    """
+    Fill a scratch ring so that records end exactly at its end (and at
+    every other offset near it), keep writing past the wrap, and check
+    that what comes back is the newest records, whole and in order.
+    """
+    fd, path = tempfile.mkstemp(suffix=".bin")
+    os.close(fd)
+    ok = True
+    try:
+        rec  = FlightRecorder(path, size)
+        room = rec.size - _START
+        base = _RECORD.size + 2          # parser "p", source "s"
+        # ten records that fill the buffer to the last byte
+        each    = room // 10
+        written = []
+        for i in range(10):
+            n = each if i < 9 else room - 9 * each
+            written.append(f"{i}:".ljust(n - base, "x"))
+            rec.record("p", "s", written[-1], ts=i)
+        if rec.head != rec.size:
+            print(f"[Recorder] check: fill ended at {rec.head}, not {rec.size}")
+            ok = False
+        for i in range(rounds):
+            payload = f"n{i}:" + "y" * (i * 37 % 300)
+            rec.record("p", "s", payload, ts=10 + i)
+            written.append(payload)
+            got = [r[3] for r in rec.records()]
+            if not got or got != written[-len(got):] or len(got) != rec.count:
+                print(f"[Recorder] check: wrong records after write {i} (head {rec.head}, tail {rec.tail})")
+                ok = False
+                break
+        rec.close()
+    finally:
+        os.remove(path)
+    print(f"[Recorder] check {'passed' if ok else 'FAILED'}")
+    return ok
+
+
+if __name__ == "__main__":
+    ap  = argparse.ArgumentParser(description="Raw frame flight recorder")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    d   = sub.add_parser("dump", help="write recorded frames as NDJSON")
+    d.add_argument("--file", default=RECORDER_PATH, help="recorder file")
+    d.add_argument("--minutes", type=float, default=5, help="how far back (0 for everything)")
+    d.add_argument("--out", help="output file (default: frames-<time>.ndjson)")
+    s = sub.add_parser("stats", help="show how much the recorder holds")
+    s.add_argument("--file", default=RECORDER_PATH, help="recorder file")
+    sub.add_parser("check", help="test the ring buffer on a scratch file")
+    args = ap.parse_args()
+
+    if args.cmd == "check":
+        sys.exit(0 if self_check() else 1)
+    try:
+        rec = FlightRecorder(args.file, readonly=True)
+    except (OSError, ValueError) as e:
+        sys.exit(f"[Recorder] {e}")
+    if args.cmd == "dump":
+        out = args.out or time.strftime("frames-%Y%m%d-%H%M%S.ndjson")
+        print(f"[Recorder] {rec.dump(out, args.minutes or None)} frame(s) → {out}")
+    else:
+        frames = list(rec.records())
+        span   = frames[-1][0] - frames[0][0] if frames else 0
+        print(f"[Recorder] {len(frames)} frame(s) over {span / 60:.1f} min in {rec.size >> 20} MiB")
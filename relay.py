@@ -0,0 +1,167 @@
+# relay.py
+#
+# The step between the event queue and the sinks: drop duplicates, find
+# the zones that want the event, run their chat rules and viewer-history
+# triggers, and hand it all to delivery. Shared by the Tk UI and the
+# headless coordinator in broker.py.
+
+import queue
+
+from dedup import Deduper, idempotency_key, twin_key
+from events import Event, coerce_event
+from rules import chat_text
+from sinks import event_user_id
+from tokens import message_tokens
+from viewers import ViewerCache, visit_triggers
+
+
+class Relay:
+    def __init__(self, model, sinks, parsers_by_name, dedup=None, viewers=None):
+        self.model      = model
+        self.sinks      = sinks
+        self.parsers    = parsers_by_name
+        self.dedup      = dedup if dedup is not None else Deduper()
+        self.viewers    = viewers if viewers is not None else ViewerCache()
+        self.delivered  = 0
+        self.duplicates = 0
+        self.rule_hits  = 0
+        self.viewer_hits = 0
+        self._clashes   = set()     # (event key, field) already warned about
+        if hasattr(sinks, "bind"):
+            sinks.bind(parsers_by_name)
+
+    def handle(self, ev, out=None) -> bool:
+        """
+        Route one Event. Returns True if it was handed to the sinks.
+        Everything delivered, including rule triggers, is appended to `out`.
+        """
+        parser = self.parsers.get(ev.parser)
+        key, window = idempotency_key(parser, ev)
+        if self.dedup.seen(key, window):
+            self.duplicates += 1
+            return False
+        twin = twin_key(parser, ev)
+        if twin and self.dedup.paired(*twin):
+            self.duplicates += 1
+            return False
+        zones = self.model.zones_for(ev.parser, ev.source_id)
+        ev.event_id = key
+        if any(z.ruleset or z.viewers for z in zones):
+            self._chat_triggers(parser, ev, zones, out)
+        wanting = [z for z in zones if z.wants(ev.event_key)]
+        if not wanting:
+            return False
+        # segments are cut from the full customData, then survive projection
+        tokens = (
+            message_tokens(parser, ev) if any(z.rich_messages for z in wanting) else None
+        )
+        # build customData here, once, rather than racing to build it in
+        # several sink threads
+        data = ev.custom_data
+        if tokens is not None:
+            data["tokens"] = tokens
+        # only the sent body is trimmed; custom_data stays whole for the
+        # file and archive sinks
+        project = self._projection(wanting, ev.event_key)
+        if project:
+            view = ev.project(project)
+            if tokens is not None:
+                view["tokens"] = tokens
+        self.sinks.submit(ev)
+        self.delivered += 1
+        if out is not None:
+            out.append(ev)
+        return True
+
+    def _chat_triggers(self, parser, ev, zones, out):
+        # only runs when some zone on this source has rules or viewer
+        # triggers, so plain relaying never builds customData for them
+        text = chat_text(parser, ev)
+        if text is None:
+            return
+        uid   = event_user_id(parser, ev)
+        visit = self.viewers.seen(ev.parser, uid) if uid else None
+
+        for z in zones:
+            if z.viewers and visit:
+                for kind, trigger in visit_triggers(z.viewers, visit):
+                    v = visit.viewer
+                    self._fire(ev, z, "viewer", kind, trigger, {
+                        "kind":       kind,
+                        "messages":   v.messages,
+                        "streak":     v.streak,
+                        "first_seen": v.first_seen,
+                    }, out)
+                    self.viewer_hits += 1
+            if z.ruleset:
+                for rule in z.ruleset.match(text):
+                    if rule.cooldown and visit and not self.viewers.allow(
+                        visit.viewer, f"rule:{z.id}:{rule.id}", rule.cooldown
+                    ):
+                        continue
+                    self._fire(ev, z, "rule", rule.id, rule.trigger, {
+                        "id": rule.id, "type": rule.kind, "match": rule.pattern,
+                    }, out)
+                    self.rule_hits += 1
+
+    def _projection(self, zones, event_key):
+        """
+        customData selection for zones that all receive one event: the
+        union of their fields, or None if any of them wants everything.
+        Where two zones give one name different paths, the first zone's
+        path wins.
+        """
+        projectors = [z.projector(event_key) for z in zones]
+        if not all(projectors):
+            return None
+        if len(projectors) == 1:
+            return projectors[0]
+
+        paths = {}
+        for z in zones:
+            for name, path in (z.fields.get(event_key) or z.fields["*"]).items():
+                if paths.setdefault(name, path) != path and (event_key, name) not in self._clashes:
+                    self._clashes.add((event_key, name))
+                    print(f"[Relay] Zones map {event_key} field '{name}' to different paths; "
+                          f"sending the first one, '{paths[name]}'")
+
+        def _union(data):
+            out = {}
+            for p in reversed(projectors):
+                out.update(p(data))
+            return out
+        return _union
+
+    def _fire(self, ev, zone, event_key, name, trigger, info, out):
+        """
+        Deliver an extra trigger derived from `ev`: same source and
+        customData (trimmed by the zone's fields), plus `info` under
+        `event_key`.
+        """
+        project = zone.projector(ev.event_key)
+        data = project(ev.custom_data) if project else dict(ev.custom_data)
+        data[event_key] = info
+        hit = Event(
+            ev.parser, ev.source_id, event_key, trigger,
+            custom_data=data, ts=ev.ts,
+            event_id=f"{ev.event_id}:{event_key}:{zone.id}:{name}" if ev.event_id else None
+        )
+        self.sinks.submit(hit)
+        if out is not None:
+            out.append(hit)
+
+    def drain(self, q, limit) -> list:
+        """
+        Handle up to `limit` items already waiting on `q` without blocking.
+        Returns the events that were delivered.
+        """
+        delivered = []
+        for _ in range(limit):
+            try:
+                item = q.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                continue
+            self.handle(coerce_event(item), delivered)
+        return delivered
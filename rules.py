@@ -0,0 +1,254 @@
+# rules.py
+#
+# Per-zone chat rules that fire their own triggers. A zone's "rules" list
+# in config.json holds entries like
+#
+#     {"type": "command", "match": "!lurk",        "trigger": "Lurk"}
+#     {"type": "keyword", "match": "hydrate",      "trigger": "Drink water"}
+#     {"type": "regex",   "match": "\\bgg+\\b",    "trigger": "GG"}
+#     {"type": "command", "match": "!hug", "trigger": "Hug", "cooldown": 60}
+#
+# All rules of a zone compile into one RuleSet: commands are a dict keyed
+# on the message's first word, keywords share a single Aho-Corasick
+# automaton, and regexes that can safely share a pattern are joined into
+# one named alternation. Matching a message therefore costs about the same
+# with 5 rules or 5,000. Regexes that can't be combined (global inline
+# flags, named groups, backreferences) are run one by one.
+# Keywords and commands are case-insensitive; keywords match whole words.
+# "cooldown" (seconds) limits how often one viewer can fire a rule; it is
+# enforced by the relay through viewers.ViewerCache.
+
+import re
+
+RULE_TYPES = ("command", "keyword", "regex")
+
+# constructs whose meaning changes once the pattern sits inside a bigger one
+_UNCOMBINABLE = re.compile(r"^\(\?[aiLmsux]+\)|\(\?P[<=]|\(\?\(|\\[1-9]|\(\?<\w")
+
+
+class Rule:
+    __slots__ = ("id", "kind", "pattern", "trigger", "cooldown", "hits")
+
+    def __init__(self, rule_id, kind, pattern, trigger, cooldown=0):
+        self.id       = rule_id
+        self.kind     = kind
+        self.pattern  = pattern
+        self.trigger  = trigger
+        self.cooldown = cooldown     # seconds per viewer, 0 for none
+        self.hits     = 0
+
+    def __repr__(self):
+        return f"Rule({self.kind} {self.pattern!r} → {self.trigger!r})"
+
+
+class AhoCorasick:
+    """
+    Multi-keyword matcher. One pass over the text finds every occurrence
+    of every keyword, independent of how many keywords there are.
+    """
+
+    def __init__(self):
+        self._goto = [{}]      # node -> {char: node}
+        self._fail = [0]
+        self._out  = [()]      # node -> values of keywords ending here
+
+    def __len__(self):
+        return len(self._goto)
+
+    def add(self, word, value):
+        node = 0
+        for ch in word:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        self._out[node] += ((len(word), value),)
+
+    def build(self):
+        """
+        Compute failure links breadth-first. Call once after all add()s.
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        frontier = list(goto[0].values())
+        while frontier:
+            nxt_frontier = []
+            for node in frontier:
+                for ch, child in goto[node].items():
+                    f = fail[node]
+                    while f and ch not in goto[f]:
+                        f = fail[f]
+                    target = goto[f].get(ch, 0)
+                    fail[child] = target if target != child else 0
+                    out[child] += out[fail[child]]
+                    nxt_frontier.append(child)
+            frontier = nxt_frontier
+
+    def find(self, text):
+        """
+        Yield (start, end, value) for every keyword occurrence in `text`.
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                for length, value in out[node]:
+                    yield i - length + 1, i + 1, value
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+
+class RuleSet:
+    """
+    Compiled rules of one zone. match(text) returns the rules that fire,
+    each at most once per message, and counts hits per rule.
+    """
+
+    def __init__(self, entries):
+        self.rules    = []
+        self.checked  = 0
+        self.matched  = 0
+        self._commands = {}
+        self._keywords = None
+        self._combined = None     # named alternation over the combinable regexes
+        self._grouped  = []       # group index -> (rule, compiled pattern), in order
+        self._separate = []       # (compiled pattern, rule) run one by one
+
+        for i, entry in enumerate(entries or ()):
+            kind    = entry.get("type")
+            pattern = entry.get("match")
+            trigger = entry.get("trigger")
+            if kind not in RULE_TYPES or not pattern or not trigger:
+                print(f"[Rules] Skipping invalid rule: {entry}")
+                continue
+            rule = Rule(entry.get("id", i), kind, pattern, trigger, entry.get("cooldown") or 0)
+            if kind == "command":
+                self._commands.setdefault(pattern.casefold(), []).append(rule)
+            elif kind == "keyword":
+                if self._keywords is None:
+                    self._keywords = AhoCorasick()
+                self._keywords.add(pattern.casefold(), rule)
+            else:
+                try:
+                    rx = re.compile(pattern)
+                except re.error as e:
+                    print(f"[Rules] Skipping bad regex {pattern!r}: {e}")
+                    continue
+                if _UNCOMBINABLE.search(pattern):
+                    self._separate.append((rx, rule))
+                else:
+                    self._grouped.append((rule, rx))
+            self.rules.append(rule)
+
+        if self._keywords is not None:
+            self._keywords.build()
+        if self._grouped:
+            try:
+                self._combined = re.compile("|".join(
+                    f"(?P<r{i}>{rx.pattern})" for i, (_, rx) in enumerate(self._grouped)
+                ))
+            except re.error as e:
+                # should not happen for vetted patterns; fall back to one by one
+                print(f"[Rules] Could not combine regex rules, running them separately: {e}")
+                self._separate.extend((rx, rule) for rule, rx in self._grouped)
+                self._grouped = []
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def match(self, text) -> list:
+        if not text:
+            return []
+        self.checked += 1
+        fired = []
+
+        if self._commands and text[:1] == "!":
+            word = text.split(None, 1)[0].casefold()
+            fired.extend(self._commands.get(word, ()))
+
+        if self._keywords is not None:
+            folded = text.casefold()
+            n = len(folded)
+            for start, end, rule in self._keywords.find(folded):
+                if rule in fired:
+                    continue
+                if start > 0 and _is_word_char(folded[start - 1]):
+                    continue
+                if end < n and _is_word_char(folded[end]):
+                    continue
+                fired.append(rule)
+
+        if self._combined is not None:
+            self._match_combined(text, fired)
+        for rx, rule in self._separate:
+            if rx.search(text):
+                fired.append(rule)
+
+        if fired:
+            self.matched += 1
+            for rule in fired:
+                rule.hits += 1
+        return fired
+
+    def _match_combined(self, text, fired):
+        # The alternation reports the first rule matching at the leftmost
+        # start; restarting one character later visits every start where
+        # some rule matches, and rules listed after the winner are checked
+        # anchored at that start. Messages without a match cost one search.
+        grouped = self._grouped
+        found   = set()
+        pos     = 0
+        while True:
+            m = self._combined.search(text, pos)
+            if m is None:
+                break
+            start = m.start()
+            first = int(m.lastgroup[1:])
+            found.add(first)
+            for i in range(first + 1, len(grouped)):
+                if i not in found and grouped[i][1].match(text, start):
+                    found.add(i)
+            if len(found) == len(grouped) or start >= len(text):
+                break
+            pos = start + 1
+        fired.extend(grouped[i][0] for i in sorted(found))
+
+    def stats(self) -> dict:
+        return {
+            "checked": self.checked,
+            "matched": self.matched,
+            "hits":    {r.id: r.hits for r in self.rules},
+        }
+
+
+def compile_rules(entries):
+    """
+    RuleSet for a zone's "rules" list, or None when there are none.
+    """
+    ruleset = RuleSet(entries)
+    return ruleset if ruleset else None
+
+
+def chat_text(parser, event):
+    """
+    Message text of an Event via the parser's chat_text() hook, or None
+    for events that aren't chat messages.
+    """
+    fn = getattr(parser, "chat_text", None)
+    if not fn:
+        return None
+    try:
+        return fn(event.event_key, event.custom_data)
+    except Exception:
+        return None
@@ -1,9 +1,11 @@
 import requests
 
+from codec import dumps
+
 SAMMI_WEBHOOK_URL = "http://localhost:9450/webhook"
 SAMMI_PASSWORD = None  # Set this if your SAMMI webhook requires authorization
 
-def send_to_sammi(payload):
+def send_to_sammi(payload, idempotency_key=None, url=None, password=None, body=None):
     """
     Sends a JSON payload to the SAMMI webhook.
     Expected format:
@@ -11,20 +13,33 @@ def send_to_sammi(payload):
         "trigger": "EventName",
         "customData": { ... }
     }
+    `idempotency_key`, when given, is forwarded as the Idempotency-Key header
+    so SAMMI-side scripts can recognise a redelivered event.
+    `url` and `password` override SAMMI_WEBHOOK_URL / SAMMI_PASSWORD.
+    `body` is payload already serialised (events.Event.body()); it is sent
+    as is instead of encoding payload again.
+    Returns True if SAMMI accepted the trigger.
     """
     if not isinstance(payload, dict):
         print("[SAMMI] Invalid payload: not a dictionary")
-        return
+        return False
 
     headers = {"Content-Type": "application/json"}
-    if SAMMI_PASSWORD:
-        headers["Authorization"] = SAMMI_PASSWORD
+    password = password or SAMMI_PASSWORD
+    if password:
+        headers["Authorization"] = password
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
 
     try:
-        response = requests.post(SAMMI_WEBHOOK_URL, json=payload, headers=headers, timeout=5)
+        response = requests.post(
+            url or SAMMI_WEBHOOK_URL, data=body if body is not None else dumps(payload),
+            headers=headers, timeout=5
+        )
         if response.status_code == 200:
             print(f"[SAMMI] Trigger sent: {payload.get('trigger')}")
-        else:
-            print(f"[SAMMI] Failed with status {response.status_code}: {response.text}")
+            return True
+        print(f"[SAMMI] Failed with status {response.status_code}: {response.text}")
     except Exception as e:
-        print(f"[SAMMI] Error sending trigger: {e}")
\ No newline at end of file
+        print(f"[SAMMI] Error sending trigger: {e}")
+    return False
\ No newline at end of file
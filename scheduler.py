@@ -0,0 +1,202 @@
+# scheduler.py
+#
+# Paced delivery for alert bursts. A gift-sub bomb or raid flood would
+# otherwise reach SAMMI as fast as the relay can send, and overlays drop
+# or overlap the alerts. Events of a paced class wait in that class's FIFO
+# and are released one at a time: the next one goes out `duration` (how
+# long an alert of the class plays) plus `spacing` seconds after the
+# previous one. Classes are independent, and events no class claims are
+# passed straight through.
+#
+# Releases are driven by a heap of due times and one timer thread that
+# sleeps on a Condition until the earliest one, so nothing polls.
+#
+# config.json, on the SAMMI sink:
+#   "sammi": {"pacing": {
+#       "subs":  {"events": ["Twitch sub", "Kick sub", "Kick gift sub"],
+#                 "duration": 4, "spacing": 0.5, "max_pending": 500},
+#       "raids": {"events": ["Twitch raid", "Kick raid start"], "duration": 10,
+#                 "durations": {"Kick raid start": 8}}
+#   }}
+# "events" holds event keys or trigger names.
+
+import time
+import heapq
+import threading
+from collections import deque
+
+PACING_MAX_PENDING = 1000     # queued alerts per class before new ones are dropped
+PACING_WARN_WAIT   = 60.0     # log once when a class falls this many seconds behind
+
+
+class AlertClass:
+    __slots__ = ("name", "duration", "spacing", "durations", "max_pending",
+                 "pending", "next_free", "scheduled", "released", "dropped", "max_wait", "behind")
+
+    def __init__(self, name, duration=0.0, spacing=0.0, durations=None,
+                 max_pending=PACING_MAX_PENDING):
+        self.name        = name
+        self.duration    = float(duration)
+        self.spacing     = float(spacing)
+        self.durations   = durations or {}      # event key / trigger -> seconds
+        self.max_pending = max_pending
+        self.pending     = deque()              # (event, queued at)
+        self.next_free   = 0.0                  # earliest time the next alert may go out
+        self.scheduled   = False                # has an entry on the heap
+        self.released    = 0
+        self.dropped     = 0
+        self.max_wait    = 0.0
+        self.behind      = False                # backlog warning logged, not yet drained
+
+    def slot(self, event) -> float:
+        """
+        Seconds one alert occupies the class, spacing included.
+        """
+        d = self.durations
+        duration = d.get(event.event_key, d.get(event.trigger, self.duration)) if d else self.duration
+        return duration + self.spacing
+
+
+class AlertScheduler:
+    """
+    Holds paced events and calls release(event) when each one is due, from
+    the scheduler's own thread. Unpaced events are released immediately on
+    the caller's thread.
+    """
+
+    def __init__(self, classes, release, clock=time.monotonic):
+        self.release  = release
+        self.clock    = clock
+        self.classes  = {}
+        self._by_name = {}      # event key / trigger -> AlertClass
+        for name, opts in (classes or {}).items():
+            opts = dict(opts)
+            cls  = AlertClass(
+                name, opts.get("duration", 0), opts.get("spacing", 0),
+                opts.get("durations"), opts.get("max_pending", PACING_MAX_PENDING)
+            )
+            self.classes[name] = cls
+            for key in opts.get("events", ()):
+                self._by_name[key] = cls
+        self._heap    = []      # (due, seq, AlertClass)
+        self._seq     = 0
+        self._cond    = threading.Condition()
+        self._running = False
+        self._thread  = None
+
+    def class_for(self, event):
+        return self._by_name.get(event.event_key) or self._by_name.get(event.trigger)
+
+    def start(self):
+        self._running = True
+        self._thread  = threading.Thread(target=self._run, name="alert-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        """
+        Stop the timer thread. Alerts still waiting are discarded.
+        """
+        with self._cond:
+            self._running = False
+            left = sum(len(c.pending) for c in self.classes.values())
+            for c in self.classes.values():
+                c.pending.clear()
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        if left:
+            print(f"[Scheduler] Discarded {left} pending alert(s)")
+
+    def submit(self, event):
+        cls = self.class_for(event)
+        if cls is None:
+            self.release(event)
+            return
+        with self._cond:
+            if len(cls.pending) >= cls.max_pending:
+                cls.dropped += 1
+                return
+            now = self.clock()
+            cls.pending.append((event, now))
+            if not cls.scheduled:
+                self._schedule(cls, max(now, cls.next_free))
+            if not cls.behind and len(cls.pending) % 10 == 0:
+                # what this alert waits for: everything queued ahead of it
+                wait = self._wait(cls, now) - cls.slot(event)
+                if wait > PACING_WARN_WAIT:
+                    cls.behind = True
+                    print(f"[Scheduler] {cls.name}: {len(cls.pending)} pending, ~{wait:.0f}s behind")
+
+    def _schedule(self, cls, due):
+        cls.scheduled = True
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, cls))
+        # wake the timer only if this is now the earliest deadline
+        if self._heap[0][2] is cls:
+            self._cond.notify()
+
+    def _run(self):
+        heap = self._heap
+        while True:
+            with self._cond:
+                while self._running and (not heap or heap[0][0] > self.clock()):
+                    self._cond.wait(heap[0][0] - self.clock() if heap else None)
+                if not self._running:
+                    return
+                now = self.clock()
+                _, _, cls = heapq.heappop(heap)
+                cls.scheduled = False
+                if not cls.pending:
+                    continue
+                event, queued = cls.pending.popleft()
+                cls.next_free = now + cls.slot(event)
+                cls.released += 1
+                cls.max_wait  = max(cls.max_wait, now - queued)
+                if cls.pending:
+                    self._schedule(cls, cls.next_free)
+                elif cls.behind:
+                    cls.behind = False
+                    print(f"[Scheduler] {cls.name}: caught up")
+            try:
+                self.release(event)
+            except Exception as e:
+                print(f"[Scheduler] Release failed: {e}")
+
+    def expected_wait(self, cls, now=None) -> float:
+        """
+        Seconds an alert submitted to `cls` now would wait before release.
+        """
+        now = self.clock() if now is None else now
+        with self._cond:
+            return self._wait(cls, now)
+
+    def _wait(self, cls, now):
+        wait = max(0.0, cls.next_free - now)
+        for event, _ in cls.pending:
+            wait += cls.slot(event)
+        return wait
+
+    def stats(self) -> dict:
+        now = self.clock()
+        return {
+            name: {
+                "pending":       len(cls.pending),
+                "expected_wait": self.expected_wait(cls, now),
+                "released":      cls.released,
+                "dropped":       cls.dropped,
+                "max_wait":      cls.max_wait,
+            }
+            for name, cls in self.classes.items()
+        }
+
+
+def describe(stats) -> str:
+    """
+    One line for the classes in `stats` that have alerts waiting, e.g.
+    "subs 12 pending ~48s", or "" when nothing is queued.
+    """
+    return ", ".join(
+        f"{name} {s['pending']} pending ~{s['expected_wait']:.0f}s"
+        for name, s in stats.items() if s["pending"]
+    )
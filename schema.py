@@ -0,0 +1,242 @@
+# schema.py
+#
+# Declarative parser schemas. Instead of an if/elif ladder a parser can
+# describe how a decoded platform record maps to an event key:
+#
+#     SCHEMA = {
+#         "select":  "command",                  # path into the record
+#         "cases":   {"PRIVMSG": "Twitch chat",  # value -> node
+#                     "CLEARCHAT": {"select": "tags.ban-duration",
+#                                   "present": "Twitch timeout",
+#                                   "default": "Twitch ban"}},
+#         "default": {"event": "Twitch other", "fields": {"command": "command"}},
+#     }
+#
+# A node is an event key, a leaf dict {"event", "fields", "payload"}, or a
+# branch dict with "select" plus "cases" and/or "present", and "default".
+# Paths are dotted ("data.reward.title"), may list fallbacks separated by
+# "|", or may be a callable taking the record. compile_schema() turns the
+# tree into nested dict lookups and precompiled trigger formatters once,
+# so classifying a frame never re-walks the schema or re-parses templates.
+
+from string import Formatter
+
+from codec import try_json
+from events import Event
+
+_MISSING = object()
+
+
+class _Blank(dict):
+    # unknown template fields format as "" instead of raising
+    def __missing__(self, key):
+        return ""
+
+
+def compile_path(path):
+    """
+    Return a getter(record) for a dotted path, "a|b" fallbacks, or a callable.
+    Missing values come back as None.
+    """
+    if callable(path):
+        return path
+    alternatives = [tuple(p.split(".")) for p in path.split("|")]
+
+    def _get_one(rec, parts):
+        for part in parts:
+            if not isinstance(rec, dict):
+                return _MISSING
+            rec = rec.get(part, _MISSING)
+            if rec is _MISSING:
+                return _MISSING
+        return rec
+
+    if len(alternatives) == 1:
+        parts = alternatives[0]
+        if len(parts) == 1:
+            key = parts[0]
+            return lambda rec: rec.get(key) if isinstance(rec, dict) else None
+
+        def _get(rec):
+            value = _get_one(rec, parts)
+            return None if value is _MISSING else value
+        return _get
+
+    def _get_first(rec):
+        for parts in alternatives:
+            value = _get_one(rec, parts)
+            if value not in (_MISSING, None, ""):
+                return value
+        return None
+    return _get_first
+
+
+def compile_fields(fields):
+    """
+    Return project(record) -> {name: value} for a {name: path} mapping;
+    paths as in compile_path. Missing values come back as None.
+    """
+    getters = tuple((name, compile_path(p)) for name, p in fields.items())
+    return lambda rec: {name: get(rec) for name, get in getters}
+
+
+def _compile_presence(path):
+    # like compile_path, but distinguishes "absent" from "present but empty"
+    parts = tuple(path.split("."))
+
+    def _present(rec):
+        for part in parts:
+            if not isinstance(rec, dict) or part not in rec:
+                return False
+            rec = rec[part]
+        return True
+    return _present
+
+
+def compile_template(template):
+    """
+    Return (constant, formatter). Templates without fields compile to a
+    constant string; the rest to a bound str.format_map.
+    """
+    if not any(field for _, field, _, _ in Formatter().parse(template)):
+        return template, None
+    return None, template.format_map
+
+
+class Route:
+    """
+    A compiled leaf: event key, trigger formatter and payload extractors.
+    """
+    __slots__ = ("event_key", "_const", "_format", "_fields", "_defaults", "_payload")
+
+    def __init__(self, event_key, template, fields=None, defaults=None, payload=None):
+        self.event_key = event_key
+        self._const, self._format = compile_template(template)
+        self._fields   = tuple((name, compile_path(p)) for name, p in (fields or {}).items())
+        self._defaults = dict(defaults or {})
+        self._payload  = compile_fields(payload) if payload else None
+
+    def values(self, record) -> dict:
+        out = _Blank(self._defaults)
+        for name, get in self._fields:
+            value = get(record)
+            if value not in (None, ""):
+                out[name] = value
+        return out
+
+    def trigger(self, record=None, **extra) -> str:
+        if self._const is not None:
+            return self._const
+        ctx = self.values(record)
+        ctx.update(extra)
+        return self._format(ctx)
+
+    def payload(self, record):
+        """
+        Declared payload fields, or the whole record when none are declared.
+        """
+        if self._payload is None:
+            return record
+        return self._payload(record)
+
+
+class Dispatch:
+    """
+    Compiled schema: route(record) -> Route in a handful of dict lookups.
+    """
+
+    def __init__(self, schema, triggers):
+        self.triggers = triggers
+        self.routes   = {}
+        self._route   = self._compile(schema)
+
+    def route(self, record) -> Route:
+        return self._route(record)
+
+    @staticmethod
+    def _is_leaf(node):
+        return isinstance(node, str) or "event" in node
+
+    def _leaf(self, node) -> Route:
+        if isinstance(node, str):
+            node = {"event": node}
+        ek    = node["event"]
+        route = Route(
+            ek, self.triggers.get(ek, ek),
+            node.get("fields"), node.get("defaults"), node.get("payload")
+        )
+        self.routes.setdefault(ek, route)
+        return route
+
+    def _compile(self, node):
+        if self._is_leaf(node):
+            route = self._leaf(node)
+            return lambda rec: route
+
+        default = self._compile(node["default"]) if "default" in node else None
+
+        if "present" in node:
+            present = self._compile(node["present"])
+            has     = _compile_presence(node["select"])
+            return lambda rec: present(rec) if has(rec) else default(rec)
+
+        if default is None:
+            raise ValueError("schema branch needs a default")
+        get = compile_path(node["select"])
+        # leaves resolve with one dict hit; nested branches are called
+        leaves   = {}
+        branches = {}
+        for value, child in node["cases"].items():
+            if self._is_leaf(child):
+                leaves[value] = self._leaf(child)
+            else:
+                branches[value] = self._compile(child)
+
+        def _select(rec):
+            value = get(rec)
+            route = leaves.get(value)
+            if route is not None:
+                return route
+            branch = branches.get(value)
+            return branch(rec) if branch else default(rec)
+        return _select
+
+
+def compile_schema(schema, triggers) -> Dispatch:
+    return Dispatch(schema, triggers)
+
+
+def install(mod):
+    """
+    Called by main.discover_parsers for every parser module. Compiles a
+    declared SCHEMA into mod.DISPATCH (once) and, for purely declarative
+    parsers, supplies parse_event/parse_frame built on it. Modules
+    without a SCHEMA are left alone.
+    """
+    schema = getattr(mod, "SCHEMA", None)
+    if schema is None:
+        return mod
+    if getattr(mod, "DISPATCH", None) is None:
+        mod.DISPATCH = compile_schema(schema, getattr(mod, "TRIGGERS", {}))
+
+    if not hasattr(mod, "parse_event"):
+        decode = getattr(mod, "decode", try_json)
+        name   = mod.__name__
+
+        def parse_event(payload_str, source_id=""):
+            record = decode(payload_str)
+            if record is None:
+                record = {"raw": payload_str}
+            route = mod.DISPATCH.route(record)
+            return Event(
+                name, source_id, route.event_key, route.trigger(record),
+                custom_data=route.payload(record)
+            )
+        mod.parse_event = parse_event
+
+    if not hasattr(mod, "parse_frame"):
+        def parse_frame(payload_str):
+            ev = mod.parse_event(payload_str)
+            return ev.event_key, {"trigger": ev.trigger, "customData": ev.custom_data}
+        mod.parse_frame = parse_frame
+    return mod
@@ -0,0 +1,507 @@
+# sinks.py
+#
+# Delivery targets for relayed events. Every sink owns a bounded queue and
+# a worker thread, so a slow target (SAMMI timing out, a stalled overlay)
+# only ever backs up its own queue.
+#
+# config.json:
+#   "sinks": {
+#     "sammi":     {"url": "http://localhost:9450/webhook", "password": null, "pacing": {...}},
+#     "websocket": {"host": "127.0.0.1", "port": 9451},
+#     "file":      {"path": "events.ndjson"},
+#     "archive":   {"path": "events.db", "retention_days": 30, "max_rows": null}
+#   }
+# (see scheduler.py for "pacing")
+
+import re
+import time
+import sqlite3
+import base64
+import struct
+import asyncio
+import hashlib
+from threading import Thread
+from queue import Queue, Full, Empty
+
+import sammi
+from codec import dumps
+from scheduler import AlertScheduler
+
+SINK_QUEUE_SIZE   = 1000
+SAMMI_RETRIES     = 2       # extra attempts after a failed webhook call
+SAMMI_RETRY_DELAY = 0.25    # seconds before the first retry, doubled each time
+
+
+class Sink:
+    name    = "sink"
+    parsers = {}      # parser name -> module, set through FanOut.bind()
+
+    def __init__(self, maxsize=SINK_QUEUE_SIZE):
+        self.queue   = Queue(maxsize)
+        self.sent    = 0
+        self.failed  = 0
+        self.dropped = 0
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target=self._run, name=f"sink-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        if not self._thread:
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except Full:
+            pass
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def submit(self, event):
+        """
+        Hand an event to this sink without ever blocking the caller.
+        """
+        try:
+            self.queue.put_nowait(event)
+        except Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                break
+            try:
+                self.deliver(event)
+                self.sent += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"[{self.name}] Delivery failed: {e}")
+        self.close()
+
+    def deliver(self, event):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SammiSink(Sink):
+    """
+    SAMMI webhook. With `pacing`, alerts of the configured classes go
+    through an AlertScheduler first and reach the queue one at a time.
+    """
+    name = "SAMMI"
+
+    def __init__(self, url=sammi.SAMMI_WEBHOOK_URL, password=None,
+                 retries=SAMMI_RETRIES, pacing=None, **kwargs):
+        super().__init__(**kwargs)
+        self.url       = url
+        self.password  = password
+        self.retries   = retries
+        self.retried   = 0
+        self.scheduler = AlertScheduler(pacing, super().submit) if pacing else None
+
+    def start(self):
+        super().start()
+        if self.scheduler:
+            self.scheduler.start()
+
+    def stop(self, timeout=2):
+        if self.scheduler:
+            self.scheduler.stop(timeout)
+        super().stop(timeout)
+
+    def submit(self, event):
+        if self.scheduler:
+            self.scheduler.submit(event)
+        else:
+            super().submit(event)
+
+    def deliver(self, event):
+        # the body is encoded once; retries resend the same bytes with the
+        # same Idempotency-Key so SAMMI can tell a resend from a new event
+        body  = event.body()
+        delay = SAMMI_RETRY_DELAY
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                time.sleep(delay)
+                delay *= 2
+            if sammi.send_to_sammi(event.payload(), event.event_id, self.url,
+                                   self.password, body=body):
+                return
+        raise RuntimeError(f"gave up after {self.retries + 1} attempts")
+
+
+class FileSink(Sink):
+    """
+    Append one JSON object per line. Writes are flushed once the queue
+    has been drained, not per event.
+    """
+    name = "file"
+
+    def __init__(self, path="events.ndjson", **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._fh  = None
+
+    def deliver(self, event):
+        if self._fh is None:
+            self._fh = open(self.path, "ab")
+        self._fh.write(dumps({
+            "time":       time.time(),
+            "parser":     event.parser,
+            "source_id":  event.source_id,
+            "event_key":  event.event_key,
+            "trigger":    event.trigger,
+            "customData": event.custom_data,
+        }) + b"\n")
+        if self.queue.empty():
+            self._fh.flush()
+
+    def close(self):
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+
+
+ARCHIVE_BATCH      = 500     # rows per transaction at most
+ARCHIVE_BATCH_WAIT = 0.5     # seconds to wait for a batch to fill up
+ARCHIVE_PRUNE_SECS = 600     # how often retention is enforced
+
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id         INTEGER PRIMARY KEY,
+    ts         REAL NOT NULL,
+    parser     TEXT NOT NULL,
+    source_id  TEXT NOT NULL,
+    event_key  TEXT NOT NULL,
+    trigger    TEXT NOT NULL,
+    user_id    TEXT,
+    event_id   TEXT,
+    data       TEXT
+);
+CREATE INDEX IF NOT EXISTS events_ts     ON events (ts);
+CREATE INDEX IF NOT EXISTS events_source ON events (source_id, ts);
+CREATE INDEX IF NOT EXISTS events_key    ON events (event_key, ts);
+CREATE INDEX IF NOT EXISTS events_user   ON events (user_id, ts);
+"""
+
+
+def open_archive(path) -> sqlite3.Connection:
+    """
+    Open (and if needed create) an event archive in WAL mode, so readers
+    never block the writer.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(ARCHIVE_SCHEMA)
+    return conn
+
+
+def prune_archive(conn, retention_days=None, max_rows=None):
+    """
+    Delete rows older than `retention_days` and all but the newest `max_rows`.
+    """
+    with conn:
+        if retention_days:
+            cutoff = time.time() - retention_days * 86400
+            conn.execute("DELETE FROM events WHERE ts < ?", (cutoff,))
+        if max_rows:
+            conn.execute(
+                "DELETE FROM events WHERE id <= (SELECT MAX(id) FROM events) - ?",
+                (max_rows,)
+            )
+
+
+def event_user_id(parser, event):
+    """
+    Platform user id for an Event via the parser's user_id() hook, or None.
+    """
+    fn = getattr(parser, "user_id", None)
+    if not fn:
+        return None
+    try:
+        uid = fn(event.event_key, event.custom_data)
+    except Exception:
+        return None
+    return None if uid is None else str(uid)
+
+
+class ArchiveSink(Sink):
+    """
+    Keep every relayed event in a local SQLite database (see archive.py
+    for queries). Rows are written in batches of up to ARCHIVE_BATCH per
+    transaction from the sink thread; rows older than `retention_days`,
+    and the oldest beyond `max_rows`, are pruned periodically.
+    """
+    name = "archive"
+
+    def __init__(self, path="events.db", retention_days=30, max_rows=None, **kwargs):
+        super().__init__(**kwargs)
+        self.path           = path
+        self.retention_days = retention_days
+        self.max_rows       = max_rows
+        self._conn          = None
+        self._pruned        = 0.0
+
+    def _row(self, event):
+        # Event.ts is monotonic; turn it back into wall-clock arrival time
+        ts = time.time() - (time.monotonic() - event.ts)
+        return (
+            ts, event.parser, event.source_id, event.event_key, event.trigger,
+            event_user_id(self.parsers.get(event.parser), event), event.event_id,
+            dumps(event.custom_data).decode("utf-8"),
+        )
+
+    def _run(self):
+        self._conn = open_archive(self.path)
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + ARCHIVE_BATCH_WAIT
+            while len(batch) < ARCHIVE_BATCH and batch[-1] is not None:
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except Empty:
+                    break
+            if batch[-1] is None:
+                batch.pop()
+                running = False
+            self.deliver_batch(batch)
+            if time.monotonic() - self._pruned > ARCHIVE_PRUNE_SECS:
+                self.prune()
+        self.close()
+
+    def deliver(self, event):
+        self.deliver_batch([event])
+
+    def deliver_batch(self, events):
+        rows = []
+        for event in events:
+            try:
+                rows.append(self._row(event))
+            except Exception as e:
+                self.failed += 1
+                print(f"[{self.name}] Could not archive {event!r}: {e}")
+        if not rows:
+            return
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO events (ts, parser, source_id, event_key, trigger,"
+                    " user_id, event_id, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+                )
+            self.sent += len(rows)
+        except sqlite3.Error as e:
+            self.failed += len(rows)
+            print(f"[{self.name}] Write failed: {e}")
+
+    def prune(self):
+        self._pruned = time.monotonic()
+        try:
+            prune_archive(self._conn, self.retention_days, self.max_rows)
+        except sqlite3.Error as e:
+            print(f"[{self.name}] Prune failed: {e}")
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+
+_WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_WS_KEY  = re.compile(rb"^Sec-WebSocket-Key:\s*(\S+)", re.I | re.M)
+
+
+def _ws_frame(data: bytes, opcode=0x1) -> bytes:
+    n = len(data)
+    if n < 126:
+        head = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 1 << 16:
+        head = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    return head + data
+
+
+class WebSocketSink(Sink):
+    """
+    Minimal local WebSocket server that broadcasts every event as a JSON
+    text frame to all connected browser overlays. Clients that stop
+    reading are disconnected once `max_buffer` bytes pile up for them.
+    """
+    name = "websocket"
+
+    def __init__(self, host="127.0.0.1", port=9451, max_buffer=1 << 20, **kwargs):
+        super().__init__(**kwargs)
+        self.host       = host
+        self.port       = port
+        self.max_buffer = max_buffer
+        self._clients   = set()
+        self._loop      = None
+        self._server    = None
+        self._server_thread = None
+
+    def start(self):
+        ready = Queue()
+
+        def _serve():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._server = self._loop.run_until_complete(
+                    asyncio.start_server(self._handle, self.host, self.port)
+                )
+            except OSError as e:
+                print(f"[{self.name}] Could not listen on {self.host}:{self.port}: {e}")
+                ready.put(False)
+                return
+            ready.put(True)
+            self._loop.run_forever()
+
+        self._server_thread = Thread(target=_serve, name="sink-websocket-server", daemon=True)
+        self._server_thread.start()
+        if ready.get():
+            super().start()
+
+    def stop(self, timeout=2):
+        super().stop(timeout)
+        if self._loop and self._loop.is_running():
+            async def _shutdown():
+                self._server.close()
+                for w in list(self._clients):
+                    w.close()
+                # closed transports hit EOF, letting the handlers return
+                current = asyncio.current_task()
+                tasks = [t for t in asyncio.all_tasks() if t is not current]
+                if tasks:
+                    await asyncio.wait(tasks, timeout=timeout)
+                self._loop.stop()
+            asyncio.run_coroutine_threadsafe(_shutdown(), self._loop)
+            self._server_thread.join(timeout=timeout)
+        self._loop = None
+
+    def deliver(self, event):
+        frame = _ws_frame(event.body())
+        self._loop.call_soon_threadsafe(self._broadcast, frame)
+
+    def _broadcast(self, frame):
+        for w in list(self._clients):
+            if w.transport.get_write_buffer_size() > self.max_buffer:
+                self._clients.discard(w)
+                w.close()
+                continue
+            w.write(frame)
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        m = _WS_KEY.search(request)
+        if not m:
+            writer.write(b"HTTP/1.1 426 Upgrade Required\r\nContent-Length: 0\r\n\r\n")
+            writer.close()
+            return
+
+        accept = base64.b64encode(hashlib.sha1(m.group(1) + _WS_GUID).digest())
+        writer.write(
+            b"HTTP/1.1 101 Switching Protocols\r\n"
+            b"Upgrade: websocket\r\n"
+            b"Connection: Upgrade\r\n"
+            b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n"
+        )
+        self._clients.add(writer)
+        try:
+            # overlays only listen; read frames to answer pings and closes
+            while True:
+                head   = await reader.readexactly(2)
+                opcode = head[0] & 0x0F
+                length = head[1] & 0x7F
+                if length == 126:
+                    length = struct.unpack("!H", await reader.readexactly(2))[0]
+                elif length == 127:
+                    length = struct.unpack("!Q", await reader.readexactly(8))[0]
+                mask = await reader.readexactly(4) if head[1] & 0x80 else b""
+                data = await reader.readexactly(length)
+                if opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    if mask:
+                        data = bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+                    writer.write(_ws_frame(data, opcode=0xA))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+
+SINK_TYPES = {
+    "sammi":     SammiSink,
+    "websocket": WebSocketSink,
+    "file":      FileSink,
+    "archive":   ArchiveSink,
+}
+
+
+class FanOut:
+    """
+    Hands each event to every configured sink in parallel.
+    """
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def start(self):
+        for s in self.sinks:
+            s.start()
+
+    def stop(self):
+        for s in self.sinks:
+            s.stop()
+
+    def bind(self, parsers_by_name):
+        """
+        Give sinks that need parser hooks (e.g. user_id) the loaded parsers.
+        """
+        for s in self.sinks:
+            s.parsers = parsers_by_name
+
+    def submit(self, event):
+        for s in self.sinks:
+            s.submit(event)
+
+    def pacing_stats(self) -> dict:
+        """
+        AlertScheduler.stats() of every paced sink, merged by class name.
+        """
+        stats = {}
+        for s in self.sinks:
+            if getattr(s, "scheduler", None):
+                stats.update(s.scheduler.stats())
+        return stats
+
+
+def build_sinks(cfg: dict) -> FanOut:
+    """
+    Build sinks from the "sinks" section of config.json. Without one,
+    behave as before and deliver to the default SAMMI webhook only.
+    """
+    section = cfg.get("sinks")
+    if not isinstance(section, dict):
+        section = {"sammi": {}}
+    sinks = []
+    for kind, opts in section.items():
+        cls = SINK_TYPES.get(kind)
+        if not cls:
+            print(f"[Sinks] Unknown sink type: {kind}")
+            continue
+        if opts is False:
+            continue
+        sinks.append(cls(**(opts if isinstance(opts, dict) else {})))
+    return FanOut(sinks)
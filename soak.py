@@ -0,0 +1,281 @@
+# soak.py
+#
+# Long-stream soak test. Replays hours of synthetic chat through the real
+# parsers, relay and dedup on a simulated clock, as fast as the machine
+# allows, and watches memory while it does:
+#   - tracemalloc snapshots, grouped by allocation site (file:line)
+#   - resident set size of this process
+# Any site or process whose memory keeps climbing is flagged at the end.
+#
+# Usage:
+#   python soak.py [--hours H] [--rate R] [--sample-minutes M]
+#                  [--parsers twitch_parse,kick_parse] [--sources N] [--csv FILE]
+#   python soak.py --attach PID [--interval SECONDS] [--csv FILE]
+# Example:
+#   python soak.py --hours 12 --rate 40
+#   python soak.py --attach 12345          # watch a live relay and its Chromium
+#
+# --attach needs psutil; it samples the RSS of a running relay and every
+# Chromium process under it until interrupted.
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+from queue import Queue
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from bench import CORPORA, FRAMES
+from dedup import Deduper
+from loadtest import EVENTS_PER_TICK, TICK_SECONDS, FakeCDPSession, attach, deliver_frame
+from relay import Relay
+from zones import ZoneModel
+
+GROWTH_MIN_BYTES = 256 << 10   # ignore sites that grew less than this overall
+GROWTH_RISING    = 0.8         # share of sample-to-sample steps that must not shrink
+RSS_MIN_GROWTH   = 0.10        # process RSS must also grow by at least 10 %
+
+
+class SimClock:
+    """
+    Stream time that advances per replayed frame instead of wall time.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class SerialisingSink:
+    """
+    Stands in for FanOut: encodes every payload like a real sink would,
+    then throws it away.
+    """
+
+    def __init__(self):
+        self.sent  = 0
+        self.bytes = 0
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def submit(self, event):
+        self.bytes += len(event.body())
+        self.sent  += 1
+
+
+def rss_bytes(pid=None):
+    """
+    Resident set size of `pid` (default: this process), or None if it
+    can't be read on this platform.
+    """
+    if psutil:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def chromium_rss(root_pid):
+    """
+    {pid: rss} for every Chromium process under `root_pid`.
+    """
+    if not psutil:
+        return {}
+    out = {}
+    try:
+        children = psutil.Process(root_pid).children(recursive=True)
+    except psutil.Error:
+        return out
+    for p in children:
+        try:
+            if "chrom" in p.name().lower():
+                out[p.pid] = p.memory_info().rss
+        except psutil.Error:
+            pass
+    return out
+
+
+def keeps_growing(series, min_growth) -> bool:
+    """
+    True when `series` ends at least `min_growth` above where it started,
+    hardly ever went down along the way and was still climbing in its
+    second half. Bounded caches that fill up and then plateau (dedup ids,
+    viewer state) are not flagged.
+    """
+    if len(series) < 3 or series[-1] - series[0] < min_growth:
+        return False
+    if series[-1] - series[len(series) // 2] < min_growth / 2:
+        return False
+    steps  = list(zip(series, series[1:]))
+    rising = sum(1 for a, b in steps if b >= a)
+    return rising >= GROWTH_RISING * len(steps)
+
+
+def site_sizes(snapshot) -> dict:
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+    return {
+        f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}": stat.size
+        for stat in snapshot.statistics("lineno")
+    }
+
+
+def write_csv(path, header, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(",".join(header) + "\n")
+        for row in rows:
+            f.write(",".join(str(v) for v in row) + "\n")
+
+
+def soak(parsers, sources, hours, rate, sample_minutes, csv=None):
+    clock   = SimClock()
+    model   = ZoneModel()
+    by_name = {}
+    queue   = Queue()
+    sessions = []
+    for name in parsers:
+        mod = FRAMES[name][0]
+        by_name[name] = mod
+        for n in range(sources):
+            source_id = f"soak{n}"
+            model.add(name, source_id, {ek: True for ek in mod.EVENTS})
+            session = FakeCDPSession()
+            attach(mod, session, queue, source_id)
+            sessions.append((name, session))
+
+    sink  = SerialisingSink()
+    relay = Relay(model, sink, by_name, dedup=Deduper(clock=clock))
+
+    total       = int(hours * 3600 * rate)
+    per_tick    = max(1, int(rate * TICK_SECONDS))
+    per_sample  = max(1, int(sample_minutes * 60 * rate))
+    sites       = []      # one {site: bytes} per sample
+    rows        = []      # (sim hours, rss, traced, queue, dedup keys)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    print(f"[Soak] {hours:g}h at {rate:g} frames/s = {total} frames "
+          f"across {len(sessions)} source(s)")
+
+    def sample():
+        traced = tracemalloc.get_traced_memory()[0]
+        sites.append(site_sizes(tracemalloc.take_snapshot()))
+        rows.append((round(clock.now / 3600, 2), rss_bytes() or 0, traced,
+                     queue.qsize(), len(relay.dedup)))
+        print(f"[Soak] {clock.now / 3600:6.2f}h  rss {rows[-1][1] / 2**20:7.1f} MiB  "
+              f"traced {traced / 2**20:7.1f} MiB  dedup {rows[-1][4]}")
+
+    for i in range(total):
+        parser_name, session = sessions[i % len(sessions)]
+        deliver_frame(session, CORPORA[parser_name](i))
+        clock.now = i / rate
+        if i % per_tick == 0:
+            relay.drain(queue, EVENTS_PER_TICK)
+        if i % per_sample == 0:
+            sample()
+    relay.drain(queue, queue.qsize())
+    sample()
+    tracemalloc.stop()
+
+    wall = time.perf_counter() - started
+    print(f"[Soak] Replayed {total} frames in {wall:.0f}s "
+          f"({hours * 3600 / max(wall, 1e-9):.0f}x real time), {sink.sent} events delivered")
+
+    report_sites(sites, hours)
+    rss = [r[1] for r in rows if r[1]]
+    if rss and keeps_growing(rss, rss[0] * RSS_MIN_GROWTH):
+        print(f"[Soak] GROWING  python rss {rss[0] / 2**20:.1f} → {rss[-1] / 2**20:.1f} MiB")
+    if csv:
+        write_csv(csv, ("sim_hours", "rss", "traced", "queue", "dedup_keys"), rows)
+        print(f"[Soak] Samples written to {csv}")
+
+
+def report_sites(sites, hours):
+    names   = set().union(*sites) if sites else set()
+    flagged = []
+    for name in names:
+        series = [s.get(name, 0) for s in sites]
+        if keeps_growing(series, GROWTH_MIN_BYTES):
+            flagged.append((series[-1] - series[0], name, series))
+    if not flagged:
+        print("[Soak] No allocation site kept growing")
+        return
+    flagged.sort(reverse=True)
+    print(f"[Soak] {len(flagged)} allocation site(s) kept growing:")
+    for growth, name, series in flagged[:20]:
+        print(f"  {growth / 2**20:8.2f} MiB  ({growth / hours / 2**20:.2f} MiB/h)  {name}")
+
+
+def watch(pid, interval, csv=None):
+    """
+    Sample a live relay process and its Chromium children until Ctrl+C.
+    """
+    if not psutil:
+        print("[Soak] --attach needs psutil (pip install psutil)")
+        sys.exit(1)
+    rows    = []
+    history = {}      # pid -> [rss, ...]
+    started = time.monotonic()
+    try:
+        while psutil.pid_exists(pid):
+            t      = round((time.monotonic() - started) / 3600, 3)
+            own    = rss_bytes(pid) or 0
+            chrome = chromium_rss(pid)
+            history.setdefault(pid, []).append(own)
+            for cpid, rss in chrome.items():
+                history.setdefault(cpid, []).append(rss)
+            rows.append((t, own, sum(chrome.values()), len(chrome)))
+            print(f"[Soak] {t:6.2f}h  relay {own / 2**20:7.1f} MiB  "
+                  f"chromium {rows[-1][2] / 2**20:7.1f} MiB in {len(chrome)} process(es)")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+    for p, series in history.items():
+        if keeps_growing(series, series[0] * RSS_MIN_GROWTH):
+            label = "relay" if p == pid else "chromium"
+            print(f"[Soak] GROWING  {label} pid {p}: "
+                  f"{series[0] / 2**20:.1f} → {series[-1] / 2**20:.1f} MiB")
+    if csv:
+        write_csv(csv, ("hours", "relay_rss", "chromium_rss", "chromium_procs"), rows)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Accelerated long-stream soak test")
+    ap.add_argument("--hours", type=float, default=8, help="simulated stream length")
+    ap.add_argument("--rate", type=float, default=20, help="frames per simulated second")
+    ap.add_argument("--sample-minutes", type=float, default=15, help="simulated minutes between snapshots")
+    ap.add_argument("--parsers", default="twitch_parse,kick_parse,youtube_parse")
+    ap.add_argument("--sources", type=int, default=1, help="sources per parser")
+    ap.add_argument("--attach", type=int, help="watch a running relay's pid instead of replaying")
+    ap.add_argument("--interval", type=float, default=60, help="seconds between samples with --attach")
+    ap.add_argument("--csv", help="write samples to this file")
+    args = ap.parse_args()
+
+    if args.attach:
+        watch(args.attach, args.interval, args.csv)
+    else:
+        parsers = [p for p in args.parsers.split(",") if p]
+        unknown = [p for p in parsers if p not in FRAMES]
+        if unknown:
+            print(f"Unknown parser(s): {', '.join(unknown)}")
+            sys.exit(1)
+        soak(parsers, args.sources, args.hours, args.rate, args.sample_minutes, args.csv)
@@ -6,16 +6,46 @@
 #
 # Usage:
 #   python test.py <parser_module> <username_or_url>
+#   python test.py --replay <frames.ndjson> [parser_module]
 # Example:
 #   python test.py youtube_parse https://www.youtube.com/watch?v=XYZ123
+#
+# --replay runs recorded frames (a recorder.py dump) through their parsers
+# offline, printing what each frame was classified as.
 
 import sys
 import asyncio
 import os
-from playwright.async_api import async_playwright
-from driver import ensure_chromium_installed
+
+from events import event_from_frame, frame_parts
+from recorder import load_frames
+
+
+def replay(path, only=None):
+    parsers = {}
+    for rec in load_frames(path):
+        name = rec["parser"]
+        if only and name != only:
+            continue
+        if name not in parsers:
+            parsers[name] = __import__(name)
+        print("=== WS PAYLOAD ===")
+        print(rec["payload"], "\n")
+        print("=== PARSER RESULT ===")
+        for part in frame_parts(parsers[name], rec["payload"]):
+            ev = event_from_frame(parsers[name], rec.get("source_id", ""), part)
+            if ev is None:
+                print(None)
+            else:
+                print(f"{ev.source_id}: {ev.event_key} → {ev.trigger}")
+                print(ev.custom_data)
+        print("\n")
+
 
 async def test_stream(parser, source_id):
+    from playwright.async_api import async_playwright
+    from driver import ensure_chromium_installed
+
     # Make sure Playwright browsers are installed in your local playwright_home
     ensure_chromium_installed()
 
@@ -55,8 +85,12 @@ async def test_stream(parser, source_id):
             await browser.close()
 
 if __name__ == "__main__":
+    if len(sys.argv) in (3, 4) and sys.argv[1] == "--replay":
+        replay(sys.argv[2], sys.argv[3] if len(sys.argv) == 4 else None)
+        sys.exit(0)
     if len(sys.argv) != 3:
         print("Usage: python test.py <parser_module> <username_or_url>")
+        print("       python test.py --replay <frames.ndjson> [parser_module]")
         sys.exit(1)
 
     module_name, source_id = sys.argv[1], sys.argv[2]
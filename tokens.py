@@ -0,0 +1,184 @@
+# tokens.py
+#
+# Structured chat messages for zones with "rich_messages": true. A message
+# becomes a list of segments instead of one flat string:
+#
+#     [{"type": "text",    "text": "nice "},
+#      {"type": "emote",   "text": "Kappa", "id": "25", "url": "https://…"},
+#      {"type": "mention", "text": "@streamer", "name": "streamer"}]
+#
+# Sources: Twitch `emotes` tag ranges, Kick `[emote:id:name]` markup and
+# YouTube message runs with `emoji` entries. Emote metadata lives in one
+# size-bounded cache shared by all parsers, so an emote seen before costs
+# a single dict hit; the cached segment dicts are shared between messages
+# and must be treated as read-only.
+
+import re
+from collections import OrderedDict
+
+EMOTE_CACHE_SIZE = 5000
+
+_MENTION_RE    = re.compile(r"@(\w+)")
+_KICK_EMOTE_RE = re.compile(r"\[emote:(\d+):([^\]]*)\]")
+
+TWITCH_EMOTE_URL = "https://static-cdn.jtvnw.net/emoticons/v2/{id}/default/dark/1.0"
+KICK_EMOTE_URL   = "https://files.kick.com/emotes/{id}/fullsize"
+
+
+class EmoteCache:
+    """
+    LRU of emote segments keyed by (platform, emote id).
+    """
+
+    def __init__(self, max_entries=EMOTE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits        = 0
+        self.misses      = 0
+        self._emotes     = OrderedDict()
+
+    def __len__(self):
+        return len(self._emotes)
+
+    def get(self, platform, emote_id, name, url):
+        key = (platform, emote_id)
+        seg = self._emotes.get(key)
+        if seg is not None:
+            self.hits += 1
+            self._emotes.move_to_end(key)
+            return seg
+        self.misses += 1
+        seg = {"type": "emote", "text": name, "id": emote_id, "url": url}
+        self._emotes[key] = seg
+        if len(self._emotes) > self.max_entries:
+            self._emotes.popitem(last=False)
+        return seg
+
+    def stats(self) -> dict:
+        return {"emotes": len(self._emotes), "hits": self.hits, "misses": self.misses}
+
+
+emote_cache = EmoteCache()
+
+
+def _text_segments(text, out):
+    # plain text, with @mentions split out
+    pos = 0
+    for m in _MENTION_RE.finditer(text):
+        if m.start() > pos:
+            out.append({"type": "text", "text": text[pos:m.start()]})
+        out.append({"type": "mention", "text": m.group(0), "name": m.group(1)})
+        pos = m.end()
+    if pos < len(text):
+        out.append({"type": "text", "text": text[pos:]})
+
+
+def tokenize_twitch(text, emotes_tag):
+    """
+    Split on the IRC `emotes` tag, e.g. "25:0-4,12-16/1902:6-10".
+    Ranges are inclusive code-point offsets, which is what str indexes.
+    """
+    if not text:
+        return []
+    spans = []
+    if emotes_tag:
+        for entry in emotes_tag.split("/"):
+            emote_id, _, ranges = entry.partition(":")
+            for r in ranges.split(","):
+                start, _, end = r.partition("-")
+                if start.isdigit() and end.isdigit():
+                    spans.append((int(start), int(end) + 1, emote_id))
+        spans.sort()
+
+    out = []
+    pos = 0
+    for start, end, emote_id in spans:
+        if start < pos or end > len(text):
+            continue
+        if start > pos:
+            _text_segments(text[pos:start], out)
+        name = text[start:end]
+        out.append(emote_cache.get(
+            "twitch", emote_id, name, TWITCH_EMOTE_URL.format(id=emote_id)
+        ))
+        pos = end
+    if pos < len(text):
+        _text_segments(text[pos:], out)
+    return out
+
+
+def tokenize_kick(content):
+    """
+    Split Kick's inline `[emote:37226:KEKW]` markup.
+    """
+    if not content:
+        return []
+    out = []
+    pos = 0
+    for m in _KICK_EMOTE_RE.finditer(content):
+        if m.start() > pos:
+            _text_segments(content[pos:m.start()], out)
+        emote_id = m.group(1)
+        out.append(emote_cache.get(
+            "kick", emote_id, m.group(2), KICK_EMOTE_URL.format(id=emote_id)
+        ))
+        pos = m.end()
+    if pos < len(content):
+        _text_segments(content[pos:], out)
+    return out
+
+
+def compact_runs(runs):
+    """
+    Shrink YouTube message runs to what tokenize_youtube needs:
+    plain strings for text, (id, name, url) tuples for emoji. Returns None
+    when the message is plain text, so nothing extra is kept for it.
+    """
+    if not any("emoji" in run for run in runs):
+        return None
+    out = []
+    for run in runs:
+        emoji = run.get("emoji")
+        if emoji is None:
+            out.append(run.get("text", ""))
+            continue
+        shortcuts = emoji.get("shortcuts") or []
+        thumbs    = (emoji.get("image") or {}).get("thumbnails") or [{}]
+        out.append((
+            emoji.get("emojiId", ""),
+            shortcuts[0] if shortcuts else emoji.get("emojiId", ""),
+            thumbs[0].get("url", ""),
+        ))
+    return out
+
+
+def tokenize_youtube(text, runs=None):
+    """
+    Segments from compact_runs() output, or from the flat text when the
+    message had no emoji.
+    """
+    out = []
+    if not runs:
+        if text:
+            _text_segments(text, out)
+        return out
+    for run in runs:
+        if isinstance(run, str):
+            if run:
+                _text_segments(run, out)
+        else:
+            emoji_id, name, url = run
+            out.append(emote_cache.get("youtube", emoji_id, name, url))
+    return out
+
+
+def message_tokens(parser, event):
+    """
+    Segments for an Event via the parser's message_tokens() hook, or None.
+    """
+    fn = getattr(parser, "message_tokens", None)
+    if not fn:
+        return None
+    try:
+        return fn(event.event_key, event.custom_data, event.raw)
+    except Exception:
+        return None
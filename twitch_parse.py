@@ -1,6 +1,13 @@
 # twitch_parse.py
 
-import json
+import re
+from datetime import datetime, timezone
+
+from codec import try_json
+from events import Event
+from pagescript import multiplex, prune_chat
+from schema import compile_schema
+from tokens import tokenize_twitch
 
 # prompt the UI to show “Enter username”
 INPUT_TYPE = "username"
@@ -36,6 +43,25 @@ TRIGGERS = {
 }
 
 
+# Twitch keeps its own chat buffer short, so the page only stops rendering
+PAGE_SCRIPT = prune_chat()
+
+# multiplexed mode: extra channels are JOINed on the pop-out's anonymous IRC
+# socket, at most 20 per JOIN and 20 JOINs per 10 s (Twitch's join limit)
+MUX_SCRIPT = multiplex(
+    "irc-ws.chat.twitch.tv", r" 376 ",
+    subscribe="""keys => { const out = [];
+        for (let i = 0; i < keys.length; i += 20)
+          out.push("JOIN " + keys.slice(i, i + 20).map(k => "#" + k).join(","));
+        return out; }""",
+    unsubscribe="""keys => { const out = [];
+        for (let i = 0; i < keys.length; i += 20)
+          out.push("PART " + keys.slice(i, i + 20).map(k => "#" + k).join(","));
+        return out; }""",
+    spacing=10500,
+)
+
+
 def get_chat_url(channel: str) -> str:
     """
     Return Twitch’s pop-out chat URL for the given channel.
@@ -43,13 +69,6 @@ def get_chat_url(channel: str) -> str:
     return f"https://www.twitch.tv/popout/{channel}/chat?popout="
 
 
-def try_json(s: str):
-    try:
-        return json.loads(s)
-    except Exception:
-        return None
-
-
 def parse_irc_tags(tag_str: str) -> dict:
     tags = {}
     if not tag_str:
@@ -120,6 +139,36 @@ def param_channel(params: list[str]) -> str | None:
     return ch[1:] if ch.startswith("#") else ch
 
 
+# channel of the first IRC line: [@tags] [:prefix] COMMAND #channel
+_CHANNEL_RE = re.compile(r"(?:@\S* )?(?::\S+ )?[A-Z0-9]+ #(\w+)")
+
+
+def split_frame(payload_str: str) -> list:
+    """
+    The IRC lines of a WebSocket frame; Twitch sends several in one frame
+    when chat is busy. PubSub frames are a single JSON document.
+    """
+    if payload_str.startswith("{"):
+        return [payload_str]
+    return [line for line in payload_str.split("\r\n") if line]
+
+
+def frame_channel(payload_str: str) -> str | None:
+    """
+    Demultiplexing key of a frame: the IRC channel it belongs to, or None
+    for PubSub and server messages.
+    """
+    m = _CHANNEL_RE.match(payload_str)
+    return m.group(1) if m else None
+
+
+async def mux_keys(page, channels) -> dict:
+    """
+    {IRC channel: source id} for channels to JOIN on a multiplexed page.
+    """
+    return {c.strip().lstrip("#").lower(): c for c in channels}
+
+
 def build_payload_from_irc(msg: dict) -> dict:
     tags = msg.get("tags", {})
     return {
@@ -137,7 +186,178 @@ def build_payload_from_irc(msg: dict) -> dict:
     }
 
 
-def parse_frame(payload_str: str):
+# A redemption arrives over IRC and PubSub. Only PubSub carries the
+# redemption id, so the two copies are paired (dedup.Deduper.paired) on
+# room, reward and user plus their own timestamps, which are a second or
+# so apart; a second redemption is never mistaken for the first's twin.
+TWIN_EVENTS = frozenset({"Twitch redeem (irc)", "Twitch redeem (pubsub)"})
+
+
+def event_id(event_key: str, data: dict) -> str | None:
+    """
+    Stable id used by the relay to drop duplicate deliveries: the
+    redemption id for PubSub redeems, the IRC message id otherwise.
+    """
+    if event_key == "Twitch redeem (pubsub)":
+        rid = data.get("redemption_id")
+        return f"twitch:redemption:{rid}" if rid else None
+    mid = data.get("msg_id")
+    return f"twitch:{mid}" if mid else None
+
+
+def _iso_seconds(stamp) -> float | None:
+    # PubSub's redeemed_at, e.g. "2024-01-01T12:00:00.123456789Z"
+    if not isinstance(stamp, str):
+        return None
+    base, _, frac = stamp.rstrip("Z").partition(".")
+    try:
+        t = datetime.strptime(base, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    return t.timestamp() + (float("0." + frac) if frac.isdigit() else 0.0)
+
+
+def twin_key(event_key: str, data: dict):
+    """
+    (room:reward:user, side, seconds) pairing the IRC and PubSub copies of
+    one redemption, or None if a part is missing.
+    """
+    if event_key == "Twitch redeem (pubsub)":
+        room, reward, user = data.get("channel_id"), data.get("reward_id"), data.get("user_id")
+        ts = _iso_seconds(data.get("redeemed_at"))
+    else:
+        tags = data.get("tags") or {}
+        room, reward, user = data.get("room_id"), tags.get("custom-reward-id"), data.get("user_id")
+        sent = tags.get("tmi-sent-ts") or ""
+        ts   = int(sent) / 1000 if sent.isdigit() else None
+    if ts is None or not (room and reward and user):
+        return None
+    return f"twitch:redeem:{room}:{reward}:{user}", event_key, ts
+
+
+def user_id(event_key: str, data: dict) -> str | None:
+    """
+    Twitch user id of whoever caused the event, if known.
+    """
+    return data.get("user_id")
+
+
+def chat_text(event_key: str, data: dict) -> str | None:
+    """
+    Message text of a chat event, for rules.py.
+    """
+    return data.get("text") if event_key == "Twitch chat" else None
+
+
+def message_tokens(event_key: str, data: dict, raw=None) -> list | None:
+    """
+    Text / emote / mention segments of a chat message, for rich zones.
+    """
+    if event_key != "Twitch chat":
+        return None
+    return tokenize_twitch(data.get("text"), (data.get("tags") or {}).get("emotes"))
+
+
+def build_payload_from_pubsub_redeem(inner: dict) -> dict:
+    data   = inner.get("data", {})
+    red    = data.get("redemption", {}) if isinstance(data, dict) else {}
+    user   = red.get("user", {}) if isinstance(red, dict) else {}
+    reward = red.get("reward", {}) if isinstance(red, dict) else {}
+    return {
+        "source":             "pubsub",
+        "event":              "reward-redeemed",
+        "timestamp":          data.get("timestamp"),
+        "redeemed_at":        red.get("redeemed_at"),
+        "channel_id":         red.get("channel_id"),
+        "user_display_name":  user.get("display_name"),
+        "user_login":         user.get("login"),
+        "user_id":            user.get("id"),
+        "reward_title":       reward.get("title") or "Unknown",
+        "reward_id":          reward.get("id"),
+        "redemption_id":      red.get("id"),
+    }
+
+
+def build_payload_from_line(line: str) -> dict:
+    return build_payload_from_irc(parse_irc_line(line))
+
+
+def _short_reward_id(msg: dict) -> str:
+    rid = msg["tags"].get("custom-reward-id")
+    return rid[:6] + "…" if rid else ""
+
+
+# IRC command / tag → event key, compiled once into DISPATCH
+SCHEMA = {
+    "select": "command",
+    "cases": {
+        "PRIVMSG": {
+            "select":  "tags.custom-reward-id",
+            "present": {"event": "Twitch redeem (irc)", "fields": {"short_id": _short_reward_id}},
+            "default": "Twitch chat",
+        },
+        "USERNOTICE": {
+            "select": "tags.msg-id",
+            "cases": {
+                "sub":            "Twitch sub",
+                "resub":          "Twitch sub",
+                "subgift":        "Twitch sub",
+                "anonsubgift":    "Twitch sub",
+                "submysterygift": "Twitch sub",
+                "raid":           "Twitch raid",
+            },
+            "default": "Twitch notice",
+        },
+        "CLEARCHAT": {
+            "select":  "tags.ban-duration",
+            "present": "Twitch timeout",
+            "default": "Twitch ban",
+        },
+        "CLEARMSG":  "Twitch message delete",
+        "NOTICE":    "Twitch notice",
+        "ROOMSTATE": "Twitch roomstate",
+    },
+    # any other IRC command
+    "default": {"event": "Twitch other", "fields": {"command": "command"}},
+}
+
+# PubSub message type → event key
+PUBSUB_SCHEMA = {
+    "select": "type",
+    "cases": {
+        "reward-redeemed": {
+            "event":    "Twitch redeem (pubsub)",
+            "fields":   {"title": "data.redemption.reward.title"},
+            "defaults": {"title": "Unknown"},
+        },
+    },
+    "default": {"event": "Twitch other", "fields": {"command": "type"}},
+}
+
+DISPATCH        = compile_schema(SCHEMA, TRIGGERS)
+PUBSUB_DISPATCH = compile_schema(PUBSUB_SCHEMA, TRIGGERS)
+
+
+def classify_irc(msg: dict) -> tuple[str, str]:
+    """
+    Map one parsed IRC message to (event_key, trigger).
+    """
+    route = DISPATCH.route(msg)
+    return route.event_key, route.trigger(msg)
+
+
+def _redemption(inner: dict) -> dict:
+    data = inner.get("data")
+    red  = data.get("redemption") if isinstance(data, dict) else None
+    return red if isinstance(red, dict) else {}
+
+
+def parse_event(payload_str: str, source_id: str = "") -> Event:
+    """
+    Classify one frame without building customData. IRC events keep only
+    the raw line (far smaller than its tags dict) and re-parse it if a
+    delivery target asks for customData.
+    """
     # Try PubSub JSON first
     j = try_json(payload_str)
     if isinstance(j, dict) and "notification" in j:
@@ -147,89 +367,40 @@ def parse_frame(payload_str: str):
                  else try_json(blob) if isinstance(blob, str)
                  else None)
         if isinstance(inner, dict):
-            t = inner.get("type", "")
-            if t == "reward-redeemed":
-                data = inner.get("data", {})
-                red  = data.get("redemption", {}) if isinstance(data, dict) else {}
-                user = red.get("user", {}) if isinstance(red, dict) else {}
-                reward = red.get("reward", {}) if isinstance(red, dict) else {}
-                title = reward.get("title") or "Unknown"
-                payload = {
-                    "source":             "pubsub",
-                    "event":              "reward-redeemed",
-                    "timestamp":          data.get("timestamp"),
-                    "redeemed_at":        red.get("redeemed_at"),
-                    "channel_id":         red.get("channel_id"),
-                    "user_display_name":  user.get("display_name"),
-                    "user_login":         user.get("login"),
-                    "user_id":            user.get("id"),
-                    "reward_title":       title,
-                    "reward_id":          reward.get("id"),
-                }
-                trig = TRIGGERS["Twitch redeem (pubsub)"].format(title=title)
-                return "Twitch redeem (pubsub)", {"trigger": trig, "customData": payload}
-            else:
-                trig = TRIGGERS["Twitch other"].format(command=t)
-                return "Twitch other", {"trigger": trig, "customData": inner}
+            route = PUBSUB_DISPATCH.route(inner)
+            if route.event_key == "Twitch redeem (pubsub)":
+                rid = _redemption(inner).get("id")
+                return Event(
+                    __name__, source_id, route.event_key, route.trigger(inner),
+                    raw=inner, build=build_payload_from_pubsub_redeem,
+                    event_id=f"twitch:redemption:{rid}" if rid else None
+                )
+            return Event(__name__, source_id, route.event_key, route.trigger(inner), custom_data=inner)
 
     # Fallback to IRC parsing
     for line in payload_str.split("\r\n"):
         msg = parse_irc_line(line)
         if not msg:
             continue
-
-        cmd = msg["command"]
-        tags = msg.get("tags", {})
-        payload = build_payload_from_irc(msg)
-
-        if cmd == "PRIVMSG" and "custom-reward-id" in tags:
-            short_id = tags["custom-reward-id"][:6] + "…" if tags.get("custom-reward-id") else ""
-            trig = TRIGGERS["Twitch redeem (irc)"].format(short_id=short_id)
-            return "Twitch redeem (irc)", {"trigger": trig, "customData": payload}
-
-        if cmd == "PRIVMSG":
-            trig = TRIGGERS["Twitch chat"]
-            return "Twitch chat", {"trigger": trig, "customData": payload}
-
-        if cmd == "USERNOTICE":
-            mid = tags.get("msg-id", "")
-            if mid in ("sub", "resub", "subgift", "anonsubgift", "submysterygift"):
-                trig = TRIGGERS["Twitch sub"]
-                return "Twitch sub", {"trigger": trig, "customData": payload}
-            if mid == "raid":
-                trig = TRIGGERS["Twitch raid"]
-                return "Twitch raid", {"trigger": trig, "customData": payload}
-            trig = TRIGGERS["Twitch notice"]
-            return "Twitch notice", {"trigger": trig, "customData": payload}
-
-        if cmd == "CLEARCHAT":
-            if "ban-duration" in tags:
-                trig = TRIGGERS["Twitch timeout"]
-                return "Twitch timeout", {"trigger": trig, "customData": payload}
-            trig = TRIGGERS["Twitch ban"]
-            return "Twitch ban", {"trigger": trig, "customData": payload}
-
-        if cmd == "CLEARMSG":
-            trig = TRIGGERS["Twitch message delete"]
-            return "Twitch message delete", {"trigger": trig, "customData": payload}
-
-        if cmd == "NOTICE":
-            trig = TRIGGERS["Twitch notice"]
-            return "Twitch notice", {"trigger": trig, "customData": payload}
-
-        if cmd == "ROOMSTATE":
-            trig = TRIGGERS["Twitch roomstate"]
-            return "Twitch roomstate", {"trigger": trig, "customData": payload}
-
-        # any other IRC command
-        trig = TRIGGERS["Twitch other"].format(command=cmd)
-        return "Twitch other", {"trigger": trig, "customData": payload}
+        route = DISPATCH.route(msg)
+        mid   = msg["tags"].get("id")
+        return Event(
+            __name__, source_id, route.event_key, route.trigger(msg),
+            raw=line, build=build_payload_from_line,
+            event_id=f"twitch:{mid}" if mid else None
+        )
 
     # if nothing matched, emit raw
-    return "Twitch other", {
-        "trigger": TRIGGERS["Twitch other"].format(command="Unknown"),
-        "customData": {"raw": payload_str}
-    }
+    return Event(
+        __name__, source_id, "Twitch other",
+        DISPATCH.routes["Twitch other"].trigger(command="Unknown"),
+        raw=payload_str
+    )
+
+
+def parse_frame(payload_str: str):
+    ev = parse_event(payload_str)
+    return ev.event_key, {"trigger": ev.trigger, "customData": ev.custom_data}
 
 
 def attach_listeners(page, cdp_session, event_queue, source_id):
@@ -238,16 +409,7 @@ def attach_listeners(page, cdp_session, event_queue, source_id):
     The driver will call this automatically.
     """
     def _ws_handler(frame):
-        payload = frame["response"]["payloadData"]
-        result  = parse_frame(payload)
-        if result:
-            ek, fmt = result
-            event_queue.put((
-                __name__,
-                source_id,
-                ek,
-                fmt["trigger"],
-                fmt["customData"]
-            ))
+        for line in split_frame(frame["response"]["payloadData"]):
+            event_queue.put(parse_event(line, source_id))
 
     cdp_session.on("Network.webSocketFrameReceived", _ws_handler)
\ No newline at end of file
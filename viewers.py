@@ -0,0 +1,234 @@
+# viewers.py
+#
+# Per-viewer state for alerts that depend on history: first message this
+# stream, new vs returning viewer, chat streaks across streams, and
+# per-user cooldowns on chat rules. Keyed by (parser name, user id) as
+# returned by the parsers' user_id() hook.
+#
+# The cache is an LRU with an idle TTL, so memory stays bounded however
+# many chatters pass through, and every lookup is one dict hit. It can be
+# snapshotted to disk between streams; loading a snapshot starts a new
+# stream, which is what "first message this stream" and streaks count.
+#
+# config.json:
+#   "viewer_cache": {"snapshot": "viewers.json", "max_viewers": 100000, "ttl_days": 30}
+# and per zone:
+#   "viewers": {"first_message": "First chat", "new_viewer": "New viewer",
+#               "returning": "Welcome back", "streak": {"min": 3, "trigger": "Chat streak"}}
+
+import os
+import sys
+import time
+from collections import OrderedDict
+
+from codec import dumps, loads
+
+VIEWER_MAX = 100_000          # records kept before the least recently seen is evicted
+VIEWER_TTL = 30 * 86400.0     # seconds of silence after which a viewer is forgotten
+
+
+class Viewer:
+    __slots__ = ("first_seen", "last_seen", "messages", "stream", "streak", "cooldowns")
+
+    def __init__(self, now, stream=0, first_seen=None, messages=0, streak=0):
+        self.first_seen = now if first_seen is None else first_seen
+        self.last_seen  = now
+        self.messages   = messages
+        self.stream     = stream     # last stream this viewer chatted in
+        self.streak     = streak     # consecutive streams with at least one message
+        self.cooldowns  = None       # key -> time it may fire again, only when used
+
+
+class Visit:
+    """
+    What one chat message meant for its viewer.
+    """
+    __slots__ = ("viewer", "new", "first_in_stream")
+
+    def __init__(self, viewer, new, first_in_stream):
+        self.viewer          = viewer
+        self.new             = new
+        self.first_in_stream = first_in_stream
+
+
+class ViewerCache:
+    def __init__(self, max_viewers=VIEWER_MAX, ttl=VIEWER_TTL, clock=time.time):
+        self.max_viewers = max_viewers
+        self.ttl         = ttl
+        self.clock       = clock
+        self.stream      = 1
+        self.hits        = 0
+        self.misses      = 0
+        self.evicted     = 0
+        self.expired     = 0
+        self.snapshot_path = None
+        self._viewers    = OrderedDict()
+
+    @classmethod
+    def from_config(cls, cfg: dict):
+        """
+        Build from the "viewer_cache" section and load its snapshot, if any.
+        """
+        opts  = cfg.get("viewer_cache") or {}
+        ttl   = opts.get("ttl_days")
+        cache = cls(
+            opts.get("max_viewers", VIEWER_MAX),
+            VIEWER_TTL if ttl is None else ttl * 86400
+        )
+        cache.snapshot_path = opts.get("snapshot")
+        if cache.snapshot_path and os.path.exists(cache.snapshot_path):
+            cache.load(cache.snapshot_path)
+        return cache
+
+    def __len__(self):
+        return len(self._viewers)
+
+    def get(self, platform, user_id, now=None):
+        """
+        Viewer record or None, without counting a message.
+        """
+        key    = (platform, user_id)
+        viewer = self._viewers.get(key)
+        if viewer is None or not self.ttl:
+            return viewer
+        now = self.clock() if now is None else now
+        if now - viewer.last_seen > self.ttl:
+            del self._viewers[key]
+            self.expired += 1
+            viewer = None
+        return viewer
+
+    def seen(self, platform, user_id, now=None) -> Visit:
+        """
+        Record one chat message from a viewer and say whether it was their
+        first ever and/or their first this stream.
+        """
+        now    = self.clock() if now is None else now
+        key    = (platform, user_id)
+        viewer = self.get(platform, user_id, now)
+        new    = viewer is None
+        if new:
+            self.misses += 1
+            viewer = self._viewers[key] = Viewer(now)
+            self._evict(now)
+        else:
+            self.hits += 1
+            self._viewers.move_to_end(key)
+
+        first = viewer.stream != self.stream
+        if first:
+            viewer.streak = viewer.streak + 1 if viewer.stream == self.stream - 1 else 1
+            viewer.stream = self.stream
+        viewer.messages += 1
+        viewer.last_seen = now
+        return Visit(viewer, new, first)
+
+    def allow(self, viewer, key, seconds, now=None) -> bool:
+        """
+        Per-viewer cooldown: True (and start the cooldown) unless `key`
+        fired for this viewer less than `seconds` ago.
+        """
+        now = self.clock() if now is None else now
+        if viewer.cooldowns is None:
+            viewer.cooldowns = {}
+        elif viewer.cooldowns.get(key, 0) > now:
+            return False
+        viewer.cooldowns[key] = now + seconds
+        return True
+
+    def _evict(self, now):
+        viewers = self._viewers
+        while len(viewers) > self.max_viewers:
+            viewers.popitem(last=False)
+            self.evicted += 1
+        # least recently seen sit at the front, so expiry stops at the first live one
+        if self.ttl:
+            while viewers:
+                viewer = next(iter(viewers.values()))
+                if now - viewer.last_seen <= self.ttl:
+                    break
+                viewers.popitem(last=False)
+                self.expired += 1
+
+    def memory(self) -> int:
+        """
+        Approximate bytes held: the dict plus one sampled record and key
+        times the number of records.
+        """
+        size = sys.getsizeof(self._viewers)
+        if self._viewers:
+            (platform, uid), viewer = next(reversed(self._viewers.items()))
+            per = (sys.getsizeof(viewer) + sys.getsizeof((platform, uid))
+                   + sys.getsizeof(uid) + sys.getsizeof(viewer.cooldowns or None))
+            size += per * len(self._viewers)
+        return size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "viewers":  len(self._viewers),
+            "stream":   self.stream,
+            "hits":     self.hits,
+            "misses":   self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evicted":  self.evicted,
+            "expired":  self.expired,
+            "bytes":    self.memory(),
+        }
+
+    def save(self, path=None):
+        """
+        Write every record to `path` (atomically). Cooldowns are not kept.
+        """
+        path = path or self.snapshot_path
+        if not path:
+            return
+        records = [
+            [platform, uid, v.first_seen, v.last_seen, v.messages, v.stream, v.streak]
+            for (platform, uid), v in self._viewers.items()
+        ]
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(dumps({"stream": self.stream, "viewers": records}))
+        os.replace(tmp, path)
+
+    def load(self, path):
+        """
+        Replace the cache with a snapshot; the relay is now in the stream
+        after the one the snapshot was taken in.
+        """
+        try:
+            with open(path, "rb") as f:
+                snap = loads(f.read())
+        except (OSError, ValueError) as e:
+            print(f"[Viewers] Could not load {path}: {e}")
+            return
+        self._viewers.clear()
+        now = self.clock()
+        for platform, uid, first_seen, last_seen, messages, stream, streak in snap.get("viewers", []):
+            if self.ttl and now - last_seen > self.ttl:
+                continue
+            v = Viewer(last_seen, stream, first_seen, messages, streak)
+            self._viewers[(platform, uid)] = v
+        while len(self._viewers) > self.max_viewers:
+            self._viewers.popitem(last=False)
+        self.stream = snap.get("stream", 0) + 1
+
+
+def visit_triggers(options, visit):
+    """
+    (kind, trigger) pairs a zone's "viewers" options fire for one visit.
+    """
+    if not visit.first_in_stream:
+        return []
+    out = []
+    if options.get("first_message"):
+        out.append(("first_message", options["first_message"]))
+    if visit.new and options.get("new_viewer"):
+        out.append(("new_viewer", options["new_viewer"]))
+    if not visit.new and options.get("returning"):
+        out.append(("returning", options["returning"]))
+    streak = options.get("streak")
+    if isinstance(streak, dict) and streak.get("trigger") and visit.viewer.streak >= streak.get("min", 2):
+        out.append(("streak", streak["trigger"]))
+    return out
@@ -1,9 +1,17 @@
 # youtube_parse.py
 
 import re
-import json
+import time
+import base64
+from collections import deque
 from urllib.parse import urlparse, parse_qs
 
+from codec import try_json
+from events import Event
+from pagescript import prune_chat
+from recorder import record
+from tokens import compact_runs, tokenize_youtube
+
 # UI will prompt “Enter url”
 INPUT_TYPE = "url"
 
@@ -22,6 +30,10 @@ TRIGGERS = {
 }
 
 
+# the live chat renderer trims its own item list, so just stop rendering
+PAGE_SCRIPT = prune_chat()
+
+
 def get_chat_url(input_str: str) -> str:
     if "studio.youtube.com/live_chat" in input_str:
         parsed = urlparse(input_str)
@@ -37,17 +49,76 @@ def get_chat_url(input_str: str) -> str:
     return f"https://www.youtube.com/live_chat?is_popout=1&v={vid}"
 
 
-def parse_frame(payload_str: str):
-    try:
-        data = json.loads(payload_str)
-    except json.JSONDecodeError:
-        return (
-            "raw_json",
-            {
-                "trigger": TRIGGERS["raw_json"],
-                "customData": {"raw": payload_str}
-            }
-        )
+def event_id(event_key: str, data: dict) -> str | None:
+    """
+    Stable id used by the relay to drop items replayed after a reload.
+    """
+    if event_key == "raw_json":
+        return None
+    item_id = data.get("id")
+    return f"yt:{item_id}" if item_id else None
+
+
+def user_id(event_key: str, data: dict) -> str | None:
+    """
+    Channel id of the message author, if known.
+    """
+    return data.get("author_id")
+
+
+def chat_text(event_key: str, data: dict) -> str | None:
+    """
+    Message text of a chat or Super Chat, for rules.py.
+    """
+    if event_key in ("chat_message", "paid_message"):
+        return data.get("text")
+    return None
+
+
+def message_tokens(event_key: str, data: dict, raw=None) -> list | None:
+    """
+    Text / emoji / mention segments of a chat message, for rich zones.
+    `raw` is the message's runs, kept on the Event by parse_event.
+    """
+    if event_key not in ("chat_message", "paid_message"):
+        return None
+    return tokenize_youtube(data.get("text"), compact_runs(raw) if raw else None)
+
+
+def build_chat_payload(r: dict) -> dict:
+    author = r.get("authorName", {}).get("simpleText", "")
+    runs   = r.get("message", {}).get("runs", [])
+    text   = "".join(run.get("text", "") for run in runs)
+    return {
+        "id":        r.get("id"),
+        "author":    author,
+        "author_id": r.get("authorExternalChannelId"),
+        "text":      text,
+    }
+
+
+def _message_runs(r: dict):
+    # emoji are lost in the flat text; the runs ride along on the Event, by
+    # reference, and only message_tokens() (rich zones) looks at them
+    return r.get("message", {}).get("runs") or None
+
+
+def build_paid_payload(r: dict) -> dict:
+    payload = build_chat_payload(r)
+    payload["amount"] = r.get("purchaseAmountText", {}).get("simpleText", "")
+    return payload
+
+
+def parse_event(payload_str: str, source_id: str = "") -> Event:
+    """
+    Find the first chat item in a poll response. The extracted customData
+    is a handful of short strings, so it is built right away rather than
+    keeping the much larger renderer dict alive; only the message's runs
+    are kept, as `raw`.
+    """
+    data = try_json(payload_str)
+    if not isinstance(data, dict):
+        return Event(__name__, source_id, "raw_json", TRIGGERS["raw_json"], raw=payload_str)
 
     actions = data.get("actions", []) or \
         data.get("continuationContents", {}) \
@@ -58,58 +129,128 @@ def parse_frame(payload_str: str):
         item = action.get("addChatItemAction", {}).get("item", {})
 
         if "liveChatTextMessageRenderer" in item:
-            r      = item["liveChatTextMessageRenderer"]
-            author = r.get("authorName", {}).get("simpleText", "")
-            runs   = r.get("message", {}).get("runs", [])
-            text   = "".join(run.get("text", "") for run in runs)
-
-            return (
-                "chat_message",
-                {
-                    "trigger": TRIGGERS["chat_message"],
-                    "customData": {"author": author, "text": text}
-                }
+            r = item["liveChatTextMessageRenderer"]
+            return Event(
+                __name__, source_id, "chat_message", TRIGGERS["chat_message"],
+                custom_data=build_chat_payload(r), raw=_message_runs(r)
             )
 
         if "liveChatPaidMessageRenderer" in item:
-            r      = item["liveChatPaidMessageRenderer"]
-            author = r.get("authorName", {}).get("simpleText", "")
-            amount = r.get("purchaseAmountText", {}).get("simpleText", "")
-            runs   = r.get("message", {}).get("runs", [])
-            text   = "".join(run.get("text", "") for run in runs)
-
-            return (
-                "paid_message",
-                {
-                    "trigger": TRIGGERS["paid_message"],
-                    "customData": {"author": author, "amount": amount, "text": text}
-                }
+            r = item["liveChatPaidMessageRenderer"]
+            return Event(
+                __name__, source_id, "paid_message", TRIGGERS["paid_message"],
+                custom_data=build_paid_payload(r), raw=_message_runs(r)
             )
 
-    return (
-        "raw_json",
-        {
-            "trigger": TRIGGERS["raw_json"],
-            "customData": data
-        }
-    )
+    return Event(__name__, source_id, "raw_json", TRIGGERS["raw_json"], custom_data=data)
+
+
+def parse_frame(payload_str: str):
+    ev = parse_event(payload_str)
+    return ev.event_key, {"trigger": ev.trigger, "customData": ev.custom_data}
+
+
+# How live-chat polls are captured. "fetch" lets the browser filter with
+# CDP Fetch, so only get_live_chat responses reach Python, paused with the
+# body read in the same step. "response" is the page-level listener that
+# is called for every response the page loads.
+CAPTURE           = "fetch"
+LIVE_CHAT_PATTERN = "*get_live_chat*"
+CAPTURE_SLOW      = 0.05    # seconds from poll to queue that count as slow
+CAPTURE_CALM      = 100     # fast polls in a row before slow capture counts as over
+
+
+class CaptureStats:
+    """
+    Python callbacks run vs live-chat polls captured, and the time from a
+    poll reaching Python to its event being queued. Logs once when a poll
+    takes CAPTURE_SLOW or longer, and again after CAPTURE_CALM fast ones.
+    """
+
+    def __init__(self, keep=1000):
+        self.callbacks = 0
+        self.polls     = 0
+        self.latencies = deque(maxlen=keep)
+        self.slow      = False
+        self.calm      = 0      # fast polls since the last slow one
+
+    def poll(self, seconds):
+        self.polls += 1
+        self.latencies.append(seconds)
+        if seconds >= CAPTURE_SLOW:
+            self.calm = 0
+            if not self.slow:
+                self.slow = True
+                print(f"[YouTube] Capture slow ({seconds * 1e3:.0f} ms): {self.summary()}")
+        elif self.slow:
+            self.calm += 1
+            if self.calm >= CAPTURE_CALM:
+                self.slow = False
+                print(f"[YouTube] Capture back to normal: {self.summary()}")
+
+    def summary(self) -> str:
+        lat = sorted(self.latencies)
+        p50 = lat[len(lat) // 2] * 1e3 if lat else 0.0
+        top = lat[-1] * 1e3 if lat else 0.0
+        return (f"capture ({CAPTURE}): {self.callbacks} callbacks for {self.polls} polls, "
+                f"latency p50 {p50:.2f} ms, max {top:.2f} ms")
+
+
+capture_stats = CaptureStats()
+
+
+def _capture(body, source_id, event_queue, started):
+    record(__name__, source_id, body)
+    event_queue.put(parse_event(body, source_id))
+    capture_stats.poll(time.perf_counter() - started)
 
 
 def attach_listeners(page, cdp_session, event_queue, source_id):
-    async def _on_response(resp):
-        if "get_live_chat" not in resp.url:
-            return
+    """
+    Capture live-chat poll responses. Returns a coroutine the driver
+    awaits before navigating (it enables interception).
+    """
+    if CAPTURE != "fetch":
+        async def _on_response(resp):
+            started = time.perf_counter()
+            capture_stats.callbacks += 1
+            if "get_live_chat" not in resp.url:
+                return
+            try:
+                _capture(await resp.text(), source_id, event_queue, started)
+            except Exception:
+                pass
+
+        page.on("response", _on_response)
+        return None
+
+    async def _on_paused(params):
+        started = time.perf_counter()
+        capture_stats.callbacks += 1
+        request_id = params["requestId"]
+        body = None
         try:
-            body = await resp.text()
-            ek, fmt = parse_frame(body)
-            event_queue.put((
-                __name__,     # "youtube_parse"
-                source_id,
-                ek,
-                fmt["trigger"],
-                fmt["customData"]
-            ))
-        except:
+            res  = await cdp_session.send("Fetch.getResponseBody", {"requestId": request_id})
+            body = res.get("body", "")
+            if res.get("base64Encoded"):
+                body = base64.b64decode(body).decode("utf-8", "replace")
+        except Exception:
             pass
+        finally:
+            # hand the response back to the page before parsing it
+            try:
+                await cdp_session.send("Fetch.continueRequest", {"requestId": request_id})
+            except Exception:
+                pass
+        if body:
+            # as on the response path: a bad poll must not escape into the
+            # event emitter as an unhandled task exception
+            try:
+                _capture(body, source_id, event_queue, started)
+            except Exception:
+                pass
 
-    page.on("response", _on_response)
\ No newline at end of file
+    cdp_session.on("Fetch.requestPaused", _on_paused)
+    return cdp_session.send("Fetch.enable", {
+        "patterns": [{"urlPattern": LIVE_CHAT_PATTERN, "requestStage": "Response"}]
+    })
\ No newline at end of file
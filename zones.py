@@ -0,0 +1,204 @@
+# zones.py
+#
+# Plain data model for zones, independent of Tk. The UI edits it, the
+# relay routes events through it, and config.json is written from it.
+#
+# A zone may trim what it sends with "fields", e.g.
+#   "fields": {"Twitch chat": {"user": "display_name", "text": "text"},
+#              "*":           {"user": "display_name"}}
+
+from rules import compile_rules
+from schema import compile_fields
+
+DEFAULT_ZONES = 4
+
+
+class Zone:
+    __slots__ = (
+        "id", "parser", "input", "filters", "rules", "ruleset", "viewers",
+        "fields", "projectors", "rich_messages",
+    )
+
+    def __init__(self, zone_id, parser="", input="", filters=None, rules=None, viewers=None,
+                 fields=None, rich_messages=False):
+        self.id      = zone_id
+        self.parser  = parser           # parser module name, e.g. "twitch_parse"
+        self.input   = input            # username or url, as typed
+        self.filters = dict(filters or {})
+        self.viewers = dict(viewers or {})   # viewer-history triggers, see viewers.py
+        self.rich_messages = bool(rich_messages)   # add tokens.py segments to chat
+        self.set_rules(rules)
+        self.set_fields(fields)
+
+    def set_fields(self, fields):
+        """
+        Per-event customData selection, {event key or "*": {name: path}},
+        compiled into extractors (paths as in schema.compile_path).
+        """
+        self.fields     = {ek: dict(spec) for ek, spec in (fields or {}).items() if spec}
+        self.projectors = {ek: compile_fields(spec) for ek, spec in self.fields.items()}
+
+    def projector(self, event_key):
+        """
+        Extractor for this event key, or None to send customData as is.
+        """
+        return self.projectors.get(event_key) or self.projectors.get("*")
+
+    def set_rules(self, rules):
+        """
+        Replace the zone's chat rules (see rules.py) and recompile them.
+        """
+        self.rules   = list(rules or [])
+        self.ruleset = compile_rules(self.rules)
+
+    def wants(self, event_key) -> bool:
+        # event keys missing from the filters (new in the parser, or a hand
+        # written config) are on, as the UI shows them
+        return self.filters.get(event_key, True)
+
+    def to_config(self) -> dict:
+        return {
+            "id":      self.id,
+            "parser":  self.parser,
+            "input":   self.input,
+            "filters": dict(self.filters),
+            "rules":   list(self.rules),
+            "viewers": dict(self.viewers),
+            "fields":  {ek: dict(spec) for ek, spec in self.fields.items()},
+            "rich_messages": self.rich_messages,
+        }
+
+
+class ZoneModel:
+    """
+    Ordered collection of zones with an index from (parser, source_id)
+    to the zones watching it, so routing an event is one dict lookup no
+    matter how many zones exist.
+
+    Listeners are called as fn(kind, zone) with kind "add", "remove" or
+    "update" after every change.
+    """
+
+    def __init__(self):
+        self._zones     = {}
+        self._index     = {}
+        self._listeners = []
+        self._next_id   = 1
+
+    @classmethod
+    def from_config(cls, cfg: dict):
+        """
+        Read the "zones" list, or the legacy zone_0…zone_3 keys.
+        """
+        model = cls()
+        entries = cfg.get("zones")
+        if not isinstance(entries, list):
+            legacy  = sorted(k for k in cfg if k.startswith("zone_"))
+            entries = [cfg[k] for k in legacy] or [{}] * DEFAULT_ZONES
+        for entry in entries:
+            if isinstance(entry, dict):
+                model.add(
+                    entry.get("parser", ""), entry.get("input", ""),
+                    entry.get("filters", {}), zone_id=entry.get("id"),
+                    rules=entry.get("rules"), viewers=entry.get("viewers"),
+                    fields=entry.get("fields"), rich_messages=entry.get("rich_messages", False)
+                )
+        return model
+
+    def to_config(self) -> list:
+        return [z.to_config() for z in self._zones.values()]
+
+    def __iter__(self):
+        return iter(list(self._zones.values()))
+
+    def __len__(self):
+        return len(self._zones)
+
+    def get(self, zone_id):
+        return self._zones.get(zone_id)
+
+    def position(self, zone_id) -> int:
+        for i, zid in enumerate(self._zones):
+            if zid == zone_id:
+                return i
+        return -1
+
+    def subscribe(self, fn):
+        self._listeners.append(fn)
+
+    def add(self, parser="", input="", filters=None, zone_id=None, rules=None,
+            viewers=None, fields=None, rich_messages=False) -> Zone:
+        if not isinstance(zone_id, int) or zone_id in self._zones:
+            zone_id = self._next_id
+        self._next_id = max(self._next_id, zone_id + 1)
+        zone = Zone(zone_id, parser, input, filters, rules, viewers, fields, rich_messages)
+        self._zones[zone_id] = zone
+        self._reindex()
+        self._notify("add", zone)
+        return zone
+
+    def remove(self, zone_id):
+        zone = self._zones.pop(zone_id, None)
+        if zone:
+            self._reindex()
+            self._notify("remove", zone)
+
+    def update(self, zone_id, **fields):
+        """
+        Set any of parser / input / filters / rules / viewers / fields /
+        rich_messages on a zone.
+        """
+        zone = self._zones.get(zone_id)
+        if not zone:
+            return
+        changed = False
+        for name in ("parser", "input", "filters", "viewers", "rich_messages"):
+            if name in fields and getattr(zone, name) != fields[name]:
+                setattr(zone, name, dict(fields[name]) if name in ("filters", "viewers") else fields[name])
+                changed = True
+        if "rules" in fields and zone.rules != fields["rules"]:
+            zone.set_rules(fields["rules"])
+            changed = True
+        if "fields" in fields and zone.fields != fields["fields"]:
+            zone.set_fields(fields["fields"])
+            changed = True
+        if changed:
+            if "parser" in fields or "input" in fields:
+                self._reindex()
+            self._notify("update", zone)
+
+    def set_filter(self, zone_id, event_key, enabled):
+        zone = self._zones.get(zone_id)
+        if zone and zone.filters.get(event_key) != enabled:
+            zone.filters[event_key] = enabled
+            self._notify("update", zone)
+
+    def zones_for(self, parser_name, source_id) -> tuple:
+        return self._index.get((parser_name, source_id), ())
+
+    def sources(self, parsers_by_name) -> list:
+        """
+        Driver source list: one entry per (parser, input) with a known
+        parser, however many zones share it. The relay hands each parsed
+        event to all of them through zones_for().
+        """
+        out  = []
+        seen = set()
+        for z in self._zones.values():
+            parser = parsers_by_name.get(z.parser)
+            key    = (z.parser, z.input)
+            if parser and z.input and key not in seen:
+                seen.add(key)
+                out.append({"parser": parser, "username": z.input})
+        return out
+
+    def _reindex(self):
+        index = {}
+        for z in self._zones.values():
+            if z.parser and z.input:
+                index.setdefault((z.parser, z.input), []).append(z)
+        self._index = {k: tuple(v) for k, v in index.items()}
+
+    def _notify(self, kind, zone):
+        for fn in list(self._listeners):
+            fn(kind, zone)